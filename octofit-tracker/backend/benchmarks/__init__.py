@@ -0,0 +1 @@
+"""Performance benchmarks for the OctoFit API, run from the backend directory"""
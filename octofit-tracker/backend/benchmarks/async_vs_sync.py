@@ -0,0 +1,104 @@
+"""
+Compare throughput of the sync DRF endpoints and their async counterparts.
+
+Starts the ASGI app under uvicorn (or targets --base-url), then drives each
+sync/async endpoint pair with the same number of concurrent clients and
+reports requests per second and latency percentiles. Seed the database first,
+e.g. ``python manage.py populate_db --users 1000 --activities-per-user 50``.
+
+    python -m benchmarks.async_vs_sync --concurrency 64 --requests 2000
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.load import fetch, request_urls, run_load
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (sync path, async path); {user_id} is filled in from the seeded data
+ENDPOINT_PAIRS = {
+    'activity list': ('/api/activities/', '/api/async/activities/'),
+    'leaderboard list': ('/api/leaderboard/', '/api/async/leaderboard/'),
+    'top performers': ('/api/leaderboard/top_performers/', '/api/async/leaderboard/top_performers/'),
+    'user stats': ('/api/users/{user_id}/stats/?bucket=week', '/api/async/users/{user_id}/stats/?bucket=week'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'octofit_tracker.asgi:application',
+         '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=BACKEND_DIR,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('uvicorn did not start within 30s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--base-url', help='Benchmark a running server instead of starting uvicorn')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint')
+    parser.add_argument('--no-cache-bust', action='store_true', help='Let the sync response cache answer repeats')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        port = free_port()
+        process = start_server(port, args.workers)
+        base_url = f'http://127.0.0.1:{port}'
+    try:
+        with urllib.request.urlopen(f'{base_url}/api/leaderboard/top_performers/') as response:
+            top = json.load(response)
+        if not top:
+            raise SystemExit('The leaderboard is empty; seed the database with populate_db first')
+        user_id = top[0]['user_id']
+
+        results = {}
+        print(f'{"endpoint":<18} {"mode":<6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for name, paths in ENDPOINT_PAIRS.items():
+            for mode, path in zip(('sync', 'async'), paths):
+                path = path.format(user_id=user_id)
+                fetch(f'{base_url}{path}')
+                next_url = request_urls(base_url, path, cache_bust=not args.no_cache_bust)
+                result = run_load(next_url, args.requests, args.concurrency)
+                results[f'{name} ({mode})'] = result
+                print(
+                    f'{name:<18} {mode:<6} {result["rps"]:>9.1f} {result["p50_ms"]:>8.1f} '
+                    f'{result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} {result["errors"]:>7}'
+                )
+            speedup = results[f'{name} (async)']['rps'] / results[f'{name} (sync)']['rps']
+            print(f'{"":<18} async/sync throughput: {speedup:.2f}x')
+        if args.json:
+            with open(args.json, 'w') as handle:
+                json.dump(results, handle, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare a benchmark run against a stored baseline.
+
+Latency and throughput may drift by ``--tolerance`` (a fraction) before they
+count as regressions; database commands per request are deterministic for a
+given dataset, so any increase of half a command or more fails.
+
+    python -m benchmarks.compare benchmarks/baseline.json results.json
+"""
+import argparse
+import json
+import sys
+
+QUERY_SLACK = 0.5
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Return human-readable regressions of ``current`` against ``baseline``"""
+    regressions = []
+    for name, base in baseline['endpoints'].items():
+        result = current['endpoints'].get(name)
+        if result is None:
+            regressions.append(f'{name}: missing from the current run')
+            continue
+        if result['errors'] > base['errors']:
+            regressions.append(f'{name}: {result["errors"]} errors (baseline {base["errors"]})')
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {result[metric]:.1f} > {base[metric]:.1f} baseline')
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {result["rps"]:.1f} req/s < {base["rps"]:.1f} baseline')
+        if result['queries_per_request'] >= base['queries_per_request'] + QUERY_SLACK:
+            regressions.append(
+                f'{name}: {result["queries_per_request"]:.2f} queries/request '
+                f'> {base["queries_per_request"]:.2f} baseline'
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail when a benchmark run regresses against a baseline')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed latency/throughput drift (fraction)')
+    args = parser.parse_args()
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.current) as handle:
+        current = json.load(handle)
+    regressions = compare(baseline, current, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Concurrent HTTP load generator shared by the benchmark scripts.
+"""
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+
+def fetch(url):
+    """GET ``url`` and return ``(seconds, ok)``"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def request_urls(base_url, path, cache_bust=True):
+    """
+    Return a callable producing the URL for each request.
+
+    Unique query strings keep the response cache from answering every repeat,
+    so the numbers reflect the database work behind the endpoint.
+    """
+    sequence = count()
+    separator = '&' if '?' in path else '?'
+    if not cache_bust:
+        return lambda: f'{base_url}{path}'
+    return lambda: f'{base_url}{path}{separator}bench={next(sequence)}'
+
+
+def run_load(next_url, requests, concurrency):
+    """Issue ``requests`` GETs from ``concurrency`` clients and summarise latencies"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(lambda _: fetch(next_url()), range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': requests,
+        'rps': requests / elapsed,
+        'p50_ms': percentiles[49] * 1000,
+        'p95_ms': percentiles[94] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'errors': sum(1 for _, ok in results if not ok),
+    }
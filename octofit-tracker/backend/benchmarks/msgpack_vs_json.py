@@ -0,0 +1,93 @@
+"""
+Compare JSON and MessagePack encoding of a large activity list.
+
+Builds an in-memory page of activities, serializes it once with
+ActivitySerializer (the rows carry their stored names, so no database is
+needed) and times each renderer over several runs. Reports the median
+encode time and the payload size, raw and gzipped.
+
+    python -m benchmarks.msgpack_vs_json --rows 10000 --repeat 7
+"""
+import argparse
+import gzip
+import os
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import django
+import msgpack
+
+
+def build_page(rows, seed):
+    """A cursor page of serialized activities, as the list endpoint returns it"""
+    from bson import ObjectId
+    from django.utils import timezone
+    from octofit_tracker.models import Activity
+    from octofit_tracker.serializers import ActivitySerializer
+
+    rng = random.Random(seed)
+    users = [(str(ObjectId()), f'Hero {index}', f'Team {index % 4}') for index in range(500)]
+    now = timezone.now()
+    activities = []
+    for _ in range(rows):
+        user_id, user_name, team_name = rng.choice(users)
+        duration = rng.randint(20, 120)
+        activities.append(Activity(
+            _id=ObjectId(),
+            user_id=user_id,
+            user_name=user_name,
+            team_name=team_name,
+            activity_type=rng.choice(['Running', 'Cycling', 'Swimming', 'Yoga', 'Walking']),
+            duration=duration,
+            calories_burned=duration * rng.randint(5, 10),
+            date=now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+        ))
+    results = ActivitySerializer(activities, many=True).data
+    return {'next': 'http://testserver/api/activities/?cursor=cD0yMDI0', 'previous': None, 'results': results}
+
+
+def measure(encode, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = encode()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000, help='Activities in the list')
+    parser.add_argument('--repeat', type=int, default=7, help='Encodes per format; the median is reported')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the rows')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
+    django.setup()
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.utils.encoders import JSONEncoder
+    from octofit_tracker.renderers import MessagePackRenderer
+
+    page = build_page(args.rows, args.seed)
+    formats = {
+        'json': lambda: JSONRenderer().render(page),
+        'msgpack rows': lambda: msgpack.packb(page, default=JSONEncoder().default, use_bin_type=True),
+        'msgpack columnar': lambda: MessagePackRenderer().render(page),
+    }
+
+    print(f'{args.rows} activities, median of {args.repeat} encodes')
+    print(f'{"format":<18} {"encode ms":>10} {"bytes":>11} {"gzip bytes":>11} {"size vs json":>13}')
+    json_size = None
+    for name, encode in formats.items():
+        seconds, payload = measure(encode, args.repeat)
+        json_size = json_size or len(payload)
+        print(
+            f'{name:<18} {seconds * 1000:>10.1f} {len(payload):>11,} {len(gzip.compress(payload)):>11,} '
+            f'{len(payload) / json_size:>12.0%}'
+        )
+
+
+if __name__ == '__main__':
+    main()
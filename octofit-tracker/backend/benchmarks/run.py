@@ -0,0 +1,173 @@
+"""
+Load-test the REST API against a seeded benchmark database.
+
+Seeds a dedicated database through the populate_db command, serves the WSGI
+app from a threaded in-process server and drives every router endpoint with
+concurrent clients. Each endpoint reports latency percentiles, requests per
+second and MongoDB commands per request. Commands are counted by a pymongo
+listener, so raw pymongo access is included alongside djongo's queries.
+Results can be written out as a baseline and compared against one;
+regressions exit non-zero.
+
+    python -m benchmarks.run --users 500 --activities-per-user 20 --output benchmarks/baseline.json
+    python -m benchmarks.run --users 500 --activities-per-user 20 --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from io import StringIO
+
+import django
+from pymongo import monitoring
+
+from benchmarks.compare import compare
+from benchmarks.load import fetch, request_urls, run_load
+
+# name -> path; {user_id} and {team_id} are filled in from the seeded data
+ENDPOINTS = {
+    'users list': '/api/users/',
+    'users detail': '/api/users/{user_id}/',
+    'users activities': '/api/users/{user_id}/activities/',
+    'teams list': '/api/teams/',
+    'teams members': '/api/teams/{team_id}/members/',
+    'activities list': '/api/activities/',
+    'leaderboard list': '/api/leaderboard/',
+    'leaderboard top_performers': '/api/leaderboard/top_performers/',
+    'workouts list': '/api/workouts/',
+}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count every command sent to MongoDB by any client in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def configure(database):
+    """Point every database alias at the benchmark database and set Django up"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
+    from django.conf import settings
+    development_database = settings.DATABASES['default']['NAME']
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = database
+    settings.DEBUG = False
+    django.setup()
+    return development_database
+
+
+def start_server():
+    """Serve the WSGI application on a free port from a background thread"""
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def seed(users, activities_per_user, random_seed):
+    from django.core.management import call_command
+    call_command('populate_db', users=users, activities_per_user=activities_per_user, seed=random_seed, stdout=StringIO())
+    call_command('ensure_indexes', stdout=StringIO())
+
+
+def path_ids():
+    from octofit_tracker.models import Leaderboard, Team
+    top = Leaderboard.objects.order_by('rank').first()
+    team = Team.objects.order_by('_id').first()
+    if top is None or team is None:
+        raise SystemExit('The benchmark database is empty; run without --skip-seed')
+    return {'user_id': top.user_id, 'team_id': str(team._id)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the REST API endpoints')
+    parser.add_argument('--database', default='octofit_benchmark', help='MongoDB database to seed and benchmark')
+    parser.add_argument('--users', type=int, default=200, help='Users to seed')
+    parser.add_argument('--activities-per-user', type=int, default=20, help='Activities to seed per user')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the dataset')
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse the data already in --database')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+    parser.add_argument('--no-cache-bust', action='store_true', help='Let the response cache answer repeats')
+    parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS), help='Only run these endpoints')
+    parser.add_argument('--output', help='Write the results as JSON (usable as a baseline)')
+    parser.add_argument('--baseline', help='Compare against this baseline and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed latency/throughput drift (fraction)')
+    args = parser.parse_args()
+
+    # Listeners only attach to clients created after registration
+    counter = CommandCounter()
+    monitoring.register(counter)
+    development_database = configure(args.database)
+    if not args.skip_seed:
+        if args.database == development_database:
+            raise SystemExit(f'Refusing to reseed the development database {development_database!r}')
+        print(f'Seeding {args.database}: {args.users} users x {args.activities_per_user} activities')
+        seed(args.users, args.activities_per_user, args.seed)
+
+    from octofit_tracker.startup import warm_caches
+    warm_caches()
+    server, base_url = start_server()
+    ids = path_ids()
+
+    results = {}
+    print(f'{"endpoint":<28} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries/req":>12} {"errors":>7}')
+    try:
+        for name in args.endpoint or ENDPOINTS:
+            path = ENDPOINTS[name].format(**ids)
+            fetch(f'{base_url}{path}')
+            before = counter.count
+            result = run_load(request_urls(base_url, path, cache_bust=not args.no_cache_bust), args.requests, args.concurrency)
+            result['queries_per_request'] = (counter.count - before) / args.requests
+            results[name] = result
+            print(
+                f'{name:<28} {result["rps"]:>9.1f} {result["p50_ms"]:>8.1f} {result["p95_ms"]:>8.1f} '
+                f'{result["p99_ms"]:>8.1f} {result["queries_per_request"]:>12.2f} {result["errors"]:>7}'
+            )
+    finally:
+        server.shutdown()
+
+    report = {
+        'dataset': {'users': args.users, 'activities_per_user': args.activities_per_user, 'seed': args.seed},
+        'load': {'concurrency': args.concurrency, 'requests': args.requests, 'cache_bust': not args.no_cache_bust},
+        'endpoints': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f'Wrote {args.output}')
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        if args.endpoint:
+            baseline['endpoints'] = {name: value for name, value in baseline['endpoints'].items() if name in results}
+        regressions = compare(baseline, report, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, Leaderboard, LeaderboardBucket, TeamLeaderboard, Workout
 
 
 @admin.register(User)
@@ -37,6 +37,23 @@ class LeaderboardAdmin(admin.ModelAdmin):
     ordering = ['rank']
 
 
+@admin.register(TeamLeaderboard)
+class TeamLeaderboardAdmin(admin.ModelAdmin):
+    """Admin interface for TeamLeaderboard model"""
+    list_display = ['rank', 'team_id', 'total_calories', 'total_activities', 'member_count', 'average_calories']
+    search_fields = ['team_id']
+    ordering = ['rank']
+
+
+@admin.register(LeaderboardBucket)
+class LeaderboardBucketAdmin(admin.ModelAdmin):
+    """Admin interface for LeaderboardBucket model"""
+    list_display = ['granularity', 'period', 'user_id', 'total_calories', 'total_activities']
+    list_filter = ['granularity']
+    search_fields = ['user_id', 'period']
+    ordering = ['granularity', '-period', '-total_calories']
+
+
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
     """Admin interface for Workout model"""
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'octofit_tracker'
+
+    def ready(self):
+        # Connect signal receivers and register the Mongo command listener
+        from . import caching, catalog, monitoring, ranking  # noqa: F401
@@ -0,0 +1,77 @@
+"""
+Async MongoDB access for the ASGI read path.
+
+Motor clients are bound to the event loop they were first used on, so one
+client (and its connection pool) is kept per running loop. Under an ASGI
+server that is a single long-lived client per worker process; under WSGI
+Django runs each async view in a fresh loop, so serve these views via ASGI.
+The client reuses the djongo ``CLIENT`` settings for the database alias,
+with its own pool size; every view here is GET-only, so the whole client
+reads with ``MONGO_READ_ONLY_READ_PREFERENCE``.
+"""
+import asyncio
+import weakref
+
+from bson import ObjectId
+from django.conf import settings
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .mongo import from_document
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_database(using='default'):
+    """Return the Motor database for a djongo alias on the running event loop"""
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    if using not in clients:
+        config = settings.DATABASES[using]
+        clients[using] = AsyncIOMotorClient(**{
+            **config.get('CLIENT', {}),
+            'maxPoolSize': settings.ASYNC_MONGO_MAX_POOL_SIZE,
+            'readPreference': settings.MONGO_READ_ONLY_READ_PREFERENCE,
+        })
+    return clients[using][settings.DATABASES[using]['NAME']]
+
+
+def get_async_collection(model, using='default'):
+    """Return the Motor collection backing a model"""
+    return get_async_database(using)[model._meta.db_table]
+
+
+async def find_instances(model, query, sort=None, limit=0, projection=None, using='default'):
+    """
+    Run a find and build unsaved model instances from the documents.
+
+    ``projection`` lists the model attributes to load; the others are None.
+    """
+    if projection is not None:
+        projection = [model._meta.get_field(name).column for name in projection]
+    cursor = get_async_collection(model, using).find(query, projection, sort=sort, limit=limit)
+    return [from_document(model, doc) async for doc in cursor]
+
+
+async def resolve_names_async(model, ids, using='default'):
+    """Async counterpart of serializers.resolve_names"""
+    object_ids = [ObjectId(value) for value in set(ids) if value and ObjectId.is_valid(value)]
+    if not object_ids:
+        return {}
+    cursor = get_async_collection(model, using).find({'_id': {'$in': object_ids}}, {'name': 1})
+    return {str(doc['_id']): doc.get('name') async for doc in cursor}
+
+
+async def resolve_name_maps(serializer, instances, using='default'):
+    """
+    Resolve every related name a RelatedNameMixin serializer needs for a page.
+
+    Only fields the serializer kept are resolved. The per-collection lookups
+    run concurrently; the result is passed to the serializer as
+    ``context['name_maps']``.
+    """
+    fields = [(name, related) for name, related in serializer.related_names.items() if name in serializer.fields]
+    results = await asyncio.gather(*(
+        resolve_names_async(model, serializer.unresolved_ids(field_name, instances), using)
+        for field_name, (model, _) in fields
+    ))
+    return {field_name: names for (field_name, _), names in zip(fields, results)}
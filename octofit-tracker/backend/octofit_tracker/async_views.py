@@ -0,0 +1,169 @@
+"""
+Async (ASGI) variants of the hot read endpoints.
+
+DRF viewsets are synchronous and djongo blocks on pymongo, so these are plain
+Django async views on Motor. They reuse the DRF serializers for output, with
+related names resolved up front by concurrent lookups, and keep the sync
+endpoints' response shapes. List pages are keyset paginated in the same
+order as the sync cursor pagination; cursors are opaque and not
+interchangeable between the two.
+"""
+import asyncio
+import base64
+import functools
+
+from bson import ObjectId, json_util
+from django.http import HttpResponseNotAllowed, JsonResponse
+from pymongo import ASCENDING, DESCENDING
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+from .async_mongo import find_instances, get_async_collection, resolve_name_maps
+from .models import User, Activity, Leaderboard
+from .pagination import ActivityCursorPagination, LeaderboardCursorPagination
+from .serializers import ActivitySerializer, LeaderboardSerializer
+from .stats import BUCKET_FORMATS, activity_stats_pipeline, summarise_stats
+from .views import parse_date_param
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def get_only(view):
+    """Reject methods other than GET/HEAD (Django 4.1's decorators are sync-only)"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET'])
+        try:
+            return await view(request, *args, **kwargs)
+        except ValidationError as exc:
+            return json_response(exc.detail, status=400)
+    return wrapper
+
+
+def _ordering(model, pagination_class):
+    """(attname, column, direction) for each field of a pagination class's ordering"""
+    ordering = []
+    for name in pagination_class.ordering:
+        field = model._meta.get_field(name.lstrip('-'))
+        ordering.append((field.attname, field.column, DESCENDING if name.startswith('-') else ASCENDING))
+    return ordering
+
+
+def _page_size(request, pagination_class):
+    try:
+        size = int(request.GET[pagination_class.page_size_query_param])
+    except (KeyError, ValueError):
+        return pagination_class.page_size
+    return min(size, pagination_class.max_page_size) if size > 0 else pagination_class.page_size
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(ordering, position):
+    """Match documents that sort strictly after ``position``"""
+    clauses = []
+    for index, (_, column, direction) in enumerate(ordering):
+        clause = {previous: value for (_, previous, _), value in zip(ordering[:index], position)}
+        clause[column] = {'$lt' if direction == DESCENDING else '$gt': position[index]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+async def keyset_page(request, model, serializer_class, pagination_class, query):
+    """Serve one ``{next, previous, results}`` page ordered like ``pagination_class``"""
+    ordering = _ordering(model, pagination_class)
+    page_size = _page_size(request, pagination_class)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if not isinstance(position, list) or len(position) != len(ordering):
+            return json_response({'detail': 'Invalid cursor'}, status=404)
+        query = {'$and': [query, _after(ordering, position)]}
+
+    # Builds the field selection for ?fields= and ?view=summary
+    fields = serializer_class(context={'request': request})
+    projection = fields.projection()
+    if projection is not None:
+        projection |= {attname for attname, _, _ in ordering}
+    sort = [(column, direction) for _, column, direction in ordering]
+    instances = await find_instances(model, query, sort=sort, limit=page_size + 1, projection=projection)
+    has_next = len(instances) > page_size
+    instances = instances[:page_size]
+    name_maps = await resolve_name_maps(fields, instances)
+    serializer = serializer_class(instances, many=True, context={'request': request, 'name_maps': name_maps})
+
+    next_url = None
+    if has_next:
+        last = instances[-1]
+        position = [getattr(last, attname) for attname, _, _ in ordering]
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(position))
+    return json_response({'next': next_url, 'previous': None, 'results': serializer.data})
+
+
+@get_only
+async def activity_list(request):
+    """Activities, newest first, optionally filtered by user_id"""
+    query = {}
+    user_id = request.GET.get('user_id')
+    if user_id is not None:
+        query['user_id'] = user_id
+    return await keyset_page(request, Activity, ActivitySerializer, ActivityCursorPagination, query)
+
+
+@get_only
+async def leaderboard_list(request):
+    """Leaderboard entries in rank order"""
+    return await keyset_page(request, Leaderboard, LeaderboardSerializer, LeaderboardCursorPagination, {})
+
+
+@get_only
+async def leaderboard_top_performers(request):
+    """Top 10 performers"""
+    fields = LeaderboardSerializer(context={'request': request})
+    entries = await find_instances(
+        Leaderboard, {}, sort=[('rank', ASCENDING), ('_id', ASCENDING)], limit=10, projection=fields.projection()
+    )
+    name_maps = await resolve_name_maps(fields, entries)
+    context = {'request': request, 'name_maps': name_maps}
+    return json_response(LeaderboardSerializer(entries, many=True, context=context).data)
+
+
+@get_only
+async def user_stats(request, pk):
+    """Activity totals for a user, bucketed by day, week or month"""
+    bucket = request.GET.get('bucket', 'day')
+    if bucket not in BUCKET_FORMATS:
+        raise ValidationError({'bucket': f'Must be one of: {", ".join(BUCKET_FORMATS)}.'})
+    start = parse_date_param(request.GET, 'from')
+    end = parse_date_param(request.GET, 'to', end_of_range=True)
+    if not ObjectId.is_valid(pk):
+        return json_response({'detail': 'Not found.'}, status=404)
+
+    # The user lookup and the aggregation don't depend on each other
+    pipeline = activity_stats_pipeline(pk, start, end, bucket)
+    user, rows = await asyncio.gather(
+        get_async_collection(User).find_one({'_id': ObjectId(pk)}, {'_id': 1}),
+        get_async_collection(Activity).aggregate(pipeline).to_list(None),
+    )
+    if user is None:
+        return json_response({'detail': 'Not found.'}, status=404)
+    return json_response({
+        'user_id': pk,
+        'bucket': bucket,
+        'from': start,
+        'to': end,
+        **summarise_stats(rows),
+    })
@@ -0,0 +1,132 @@
+"""
+Response caching for read-heavy viewsets.
+
+Cached responses live in the ``api`` cache under a per-namespace version.
+Writes bump the version of every namespace whose output they affect, which
+orphans the old entries instead of deleting them one by one. The viewsets'
+perform_create/perform_update/perform_destroy all save through the ORM, so
+model save/delete signals drive the bumps; leaderboard writes made directly
+against MongoDB arrive through ``leaderboard_changed``.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import User, Team, Activity, Leaderboard, Workout
+from .routers import primary_reads
+from .signals import leaderboard_changed
+
+# Cache namespaces whose responses embed data from each model
+MODEL_NAMESPACES = {
+    User: ('teams', 'leaderboard'),
+    Team: ('teams', 'leaderboard'),
+    # Windowed leaderboards move with activity dates as well as calories
+    Activity: ('leaderboard',),
+    Leaderboard: ('leaderboard',),
+    Workout: ('workouts',),
+}
+
+
+def get_api_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f'api:{namespace}:version'
+
+
+def namespace_version(namespace):
+    """Return the current version of a namespace, starting a new one if evicted"""
+    cache = get_api_cache()
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # A clock-based start never reuses versions from before an eviction
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespaces(namespaces):
+    """Invalidate every cached response in the given namespaces"""
+    cache = get_api_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            namespace_version(namespace)
+
+
+def make_etag(data):
+    """Weak ETag over the response data, shared by every rendered format"""
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()
+    return f'W/"{hashlib.sha1(payload).hexdigest()}"'
+
+
+class CachedResponseMixin:
+    """
+    Serve list and retrieve from the API cache, keyed by path and query params.
+
+    Requests whose If-None-Match matches the cached ETag get a 304 without
+    the queryset or serializer running.
+    """
+    cache_namespace = None
+
+    def get_response_cache_key(self, request):
+        query = sorted(request.query_params.lists())
+        fingerprint = hashlib.sha1(f'{request.path}?{query}'.encode()).hexdigest()
+        version = namespace_version(self.cache_namespace)
+        return f'api:{self.cache_namespace}:{version}:{request.accepted_renderer.format}:{fingerprint}'
+
+    def cached_response(self, request, produce):
+        cache = get_api_cache()
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            # A lagging replica's response would stay cached past the write that bumped the namespace
+            with primary_reads():
+                response = produce()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag = make_etag(response.data)
+            cache.set(key, (etag, response.data))
+            cache_status = 'MISS'
+        else:
+            etag, data = cached
+            response = None
+            cache_status = 'HIT'
+
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif response is None:
+            response = Response(data)
+        response['ETag'] = etag
+        response['X-Cache'] = cache_status
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_model_namespaces(sender, **kwargs):
+    namespaces = MODEL_NAMESPACES.get(sender)
+    if namespaces:
+        bump_namespaces(namespaces)
+
+
+@receiver(leaderboard_changed)
+def invalidate_leaderboard_namespace(sender, **kwargs):
+    bump_namespaces(('leaderboard',))
@@ -0,0 +1,126 @@
+"""
+Process-local workout catalog index.
+
+The workout catalog is small and read constantly, so it is loaded once into
+memory with each workout's calorie estimate precomputed. Facet fields keep
+value -> position postings for multi-valued filters, range filters scan the
+candidates left after faceting, and facet counts are computed against every
+filter except the facet's own, as faceted search UIs expect. The catalog is
+invalidated when a workout is saved or deleted in this process and reloaded
+after ``WORKOUT_CATALOG_TTL`` seconds to pick up other workers' writes.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Workout, estimate_workout_calories
+from .mongo import get_collection
+
+FACET_FIELDS = ('difficulty', 'category')
+
+# Range filter name -> (attribute, comparison)
+RANGE_FILTERS = {
+    'duration__gte': ('duration', lambda value, bound: value >= bound),
+    'duration__lte': ('duration', lambda value, bound: value <= bound),
+    'calories__gte': ('calories_estimate', lambda value, bound: value >= bound),
+    'calories__lte': ('calories_estimate', lambda value, bound: value <= bound),
+}
+
+WORKOUT_FIELDS = ('_id', 'name', 'description', 'difficulty', 'duration', 'category')
+
+
+class WorkoutCatalog:
+    """In-memory workout catalog with facet postings"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._workouts = None
+        self._postings = {}
+        self._built_at = None
+
+    def build(self):
+        """Load every workout from MongoDB and precompute calorie estimates"""
+        workouts = []
+        # The catalog outlives the request, so it never loads from a lagging replica
+        for doc in get_collection(Workout, using='default').find().sort('_id', 1):
+            workout = Workout(**{field: doc.get(field) for field in WORKOUT_FIELDS})
+            workout.calories_estimate = estimate_workout_calories(workout.difficulty, workout.duration)
+            workouts.append(workout)
+        postings = {field: {} for field in FACET_FIELDS}
+        for position, workout in enumerate(workouts):
+            for field in FACET_FIELDS:
+                postings[field].setdefault(getattr(workout, field), set()).add(position)
+        with self._lock:
+            self._workouts = workouts
+            self._postings = postings
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the catalog so the next search rebuilds it"""
+        with self._lock:
+            self._workouts = None
+
+    def _ensure_built(self):
+        with self._lock:
+            workouts, built_at = self._workouts, self._built_at
+        if workouts is None or (self.ttl is not None and time.monotonic() - built_at > self.ttl):
+            self.build()
+
+    def _facet_matches(self, postings, facets, skip=None):
+        positions = None
+        for field, values in facets.items():
+            if field == skip or not values:
+                continue
+            matched = set().union(*(postings[field].get(value, set()) for value in values))
+            positions = matched if positions is None else positions & matched
+        return positions
+
+    def search(self, facets=None, ranges=None):
+        """
+        Return ``(workouts, facet_counts)`` for the given filters.
+
+        ``facets`` maps facet fields to the accepted values (any of them
+        matches); ``ranges`` maps RANGE_FILTERS names to numeric bounds.
+        """
+        facets = facets or {}
+        ranges = ranges or {}
+        self._ensure_built()
+        with self._lock:
+            workouts, postings = self._workouts, self._postings
+
+        def in_ranges(workout):
+            for name, bound in ranges.items():
+                attribute, compare = RANGE_FILTERS[name]
+                if not compare(getattr(workout, attribute), bound):
+                    return False
+            return True
+
+        range_matches = {position for position, workout in enumerate(workouts) if in_ranges(workout)}
+
+        facet_positions = self._facet_matches(postings, facets)
+        matched = range_matches if facet_positions is None else range_matches & facet_positions
+        results = [workouts[position] for position in sorted(matched)]
+
+        facet_counts = {}
+        for field in FACET_FIELDS:
+            others = self._facet_matches(postings, facets, skip=field)
+            candidates = range_matches if others is None else range_matches & others
+            facet_counts[field] = {
+                value: len(positions & candidates)
+                for value, positions in sorted(postings[field].items(), key=lambda item: str(item[0]))
+                if positions & candidates
+            }
+        return results, facet_counts
+
+
+workout_catalog = WorkoutCatalog(ttl=getattr(settings, 'WORKOUT_CATALOG_TTL', None))
+
+
+@receiver(post_save, sender=Workout)
+@receiver(post_delete, sender=Workout)
+def invalidate_workout_catalog(sender, **kwargs):
+    workout_catalog.invalidate()
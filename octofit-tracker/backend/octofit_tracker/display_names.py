@@ -0,0 +1,145 @@
+"""
+User and team names copied onto activity and leaderboard documents.
+
+Activities and leaderboard entries store ``user_name`` and ``team_name`` at
+write time so list endpoints serialize without joining users and teams.
+Renames, team moves and deletions rewrite the copies with ``update_many``,
+and ``check_display_names`` finds and repairs rows that drifted anyway. An
+empty string means the user or team no longer exists; documents written
+before the fields existed hold ``None`` and the serializers look those up.
+Every rewrite that modifies rows sends ``leaderboard_changed``, which
+refreshes the ranked index and the cached leaderboard responses.
+"""
+from bson import ObjectId
+from pymongo import UpdateMany
+
+from .models import Activity, Leaderboard, Team, User
+from .mongo import get_collection
+from .signals import leaderboard_changed
+
+# Collections holding copies of the names, keyed by user_id
+DENORMALIZED_MODELS = (Activity, Leaderboard)
+REPAIR_BATCH_SIZE = 1000
+MEMBER_BATCH_SIZE = 1000
+
+
+def user_profiles(user_ids):
+    """
+    Map user ids to ``{'team_id', 'user_name', 'team_name'}`` with two queries.
+
+    Unknown users and teams map to empty strings.
+    """
+    user_ids = set(user_ids)
+    object_ids = [ObjectId(user_id) for user_id in user_ids if user_id and ObjectId.is_valid(user_id)]
+    users = {
+        str(user['_id']): user
+        for user in get_collection(User).find({'_id': {'$in': object_ids}}, {'name': 1, 'team_id': 1})
+    } if object_ids else {}
+    team_ids = {ObjectId(user['team_id']) for user in users.values() if ObjectId.is_valid(user.get('team_id') or '')}
+    teams = {
+        str(team['_id']): team.get('name') or ''
+        for team in get_collection(Team).find({'_id': {'$in': list(team_ids)}}, {'name': 1})
+    } if team_ids else {}
+
+    profiles = {}
+    for user_id in user_ids:
+        user = users.get(user_id, {})
+        team_id = user.get('team_id') or ''
+        profiles[user_id] = {
+            'team_id': team_id,
+            'user_name': user.get('name') or '',
+            'team_name': teams.get(team_id, ''),
+        }
+    return profiles
+
+
+def names_for(profile):
+    """The denormalized fields of a user profile"""
+    return {'user_name': profile['user_name'], 'team_name': profile['team_name']}
+
+
+def user_names(user_id):
+    """The denormalized fields for one user"""
+    return names_for(user_profiles([user_id])[user_id])
+
+
+def fill_names(documents):
+    """Set user_name and team_name on raw documents before they are inserted"""
+    profiles = user_profiles(document.get('user_id') for document in documents)
+    for document in documents:
+        document.update(names_for(profiles[document.get('user_id')]))
+
+
+def _stale(names):
+    return {'$or': [{field: {'$ne': value}} for field, value in names.items()]}
+
+
+def propagate_user(user_id):
+    """Rewrite a user's current names on their activities and leaderboard entry"""
+    names = user_names(user_id)
+    modified = sum(
+        get_collection(model).update_many({'user_id': user_id, **_stale(names)}, {'$set': names}).modified_count
+        for model in DENORMALIZED_MODELS
+    )
+    if modified:
+        leaderboard_changed.send(sender=Leaderboard, user_ids=[user_id])
+    return modified
+
+
+def propagate_team(team_id, name):
+    """
+    Rewrite a team's name on its members' activities and leaderboard entries.
+
+    Pass ``''`` when the team is deleted.
+    """
+    members = [str(user['_id']) for user in get_collection(User).find({'team_id': team_id}, {'_id': 1})]
+    modified = 0
+    for start in range(0, len(members), MEMBER_BATCH_SIZE):
+        batch = members[start:start + MEMBER_BATCH_SIZE]
+        for model in DENORMALIZED_MODELS:
+            modified += get_collection(model).update_many(
+                {'user_id': {'$in': batch}, 'team_name': {'$ne': name}},
+                {'$set': {'team_name': name}},
+            ).modified_count
+    if modified:
+        leaderboard_changed.send(sender=Leaderboard, user_ids=members)
+    return modified
+
+
+def find_drift(model):
+    """
+    Return ``{user_id: (expected names, stale row count)}`` for one collection.
+
+    Rows are grouped by user and stored names, so the scan returns one row
+    per distinct copy rather than one per document.
+    """
+    pipeline = [{'$group': {
+        '_id': {'user_id': '$user_id', 'user_name': '$user_name', 'team_name': '$team_name'},
+        'count': {'$sum': 1},
+    }}]
+    groups = list(get_collection(model).aggregate(pipeline, allowDiskUse=True))
+    profiles = user_profiles(group['_id'].get('user_id') for group in groups)
+    drift = {}
+    for group in groups:
+        user_id = group['_id'].get('user_id')
+        expected = names_for(profiles[user_id])
+        stored = {field: group['_id'].get(field) for field in expected}
+        if stored != expected:
+            count = drift[user_id][1] if user_id in drift else 0
+            drift[user_id] = (expected, count + group['count'])
+    return drift
+
+
+def repair_drift(model, drift):
+    """Rewrite the stale rows reported by ``find_drift``; returns rows modified"""
+    requests = [
+        UpdateMany({'user_id': user_id, **_stale(names)}, {'$set': names})
+        for user_id, (names, _) in drift.items()
+    ]
+    collection = get_collection(model)
+    modified = 0
+    for start in range(0, len(requests), REPAIR_BATCH_SIZE):
+        modified += collection.bulk_write(requests[start:start + REPAIR_BATCH_SIZE], ordered=False).modified_count
+    if modified:
+        leaderboard_changed.send(sender=Leaderboard, user_ids=list(drift))
+    return modified
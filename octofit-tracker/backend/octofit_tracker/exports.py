@@ -0,0 +1,96 @@
+"""
+Streaming exports of the activities collection.
+
+Rows are produced from a server-side MongoDB cursor one batch at a time.
+User names come from the activity documents; older documents without one
+are resolved per batch through a bounded LRU, so memory stays flat however
+many activities are exported.
+"""
+import zlib
+from collections import OrderedDict
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Activity, User, estimate_distance
+from .mongo import get_collection
+from .serializers import resolve_names
+
+EXPORT_FIELDS = ['id', 'user_id', 'user_name', 'activity_type', 'duration', 'distance', 'calories_burned', 'date']
+
+
+class NameLRU:
+    """Bounded id -> name cache that resolves misses in one query per batch"""
+
+    def __init__(self, model, max_size=10000, default=None):
+        self.model = model
+        self.max_size = max_size
+        self.default = default
+        self._names = OrderedDict()
+
+    def resolve(self, ids):
+        """Return names for ``ids``, looking up only the ones not cached"""
+        ids = set(ids)
+        missing = [value for value in ids if value not in self._names]
+        if missing:
+            found = resolve_names(self.model, missing)
+            for value in missing:
+                self._names[value] = found.get(value, self.default)
+        names = {}
+        for value in ids:
+            self._names.move_to_end(value)
+            names[value] = self._names[value]
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+        return names
+
+
+def iter_activity_rows(query, batch_size=1000, name_cache_size=10000):
+    """Yield export rows for activities matching ``query`` in _id order"""
+    date_field = serializers.DateTimeField()
+    user_names = NameLRU(User, max_size=name_cache_size, default='Unknown')
+    cursor = get_collection(Activity, read_only=True).find(query).sort('_id', 1).batch_size(batch_size)
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield from _rows(batch, user_names, date_field)
+            batch = []
+    if batch:
+        yield from _rows(batch, user_names, date_field)
+
+
+def _distance(doc):
+    if doc.get('distance_km') is not None:
+        return doc['distance_km']
+    return estimate_distance(doc.get('activity_type'), doc.get('duration') or 0)
+
+
+def _rows(batch, user_names, date_field):
+    # Only activities written before names were stored on them need a lookup
+    names = user_names.resolve(doc.get('user_id') for doc in batch if doc.get('user_name') is None)
+    for doc in batch:
+        date = doc.get('date')
+        stored = doc.get('user_name')
+        yield {
+            'id': str(doc['_id']),
+            'user_id': doc.get('user_id'),
+            'user_name': names.get(doc.get('user_id')) if stored is None else stored or 'Unknown',
+            'activity_type': doc.get('activity_type'),
+            'duration': doc.get('duration'),
+            'distance': _distance(doc),
+            'calories_burned': doc.get('calories_burned'),
+            'date': date_field.to_representation(timezone.make_aware(date, dt_timezone.utc)) if date else None,
+        }
+
+
+def gzip_stream(chunks, level=6):
+    """Compress an iterable of byte chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,486 @@
+"""
+Incremental maintenance of the leaderboard collection.
+
+Ranks use competition ranking: a user's rank is one more than the number of
+users with strictly more calories, so tied users share a rank. When a user's
+total moves from ``old`` to ``new`` only entries whose total lies between the
+two change rank, each by exactly one. ``move_entry`` shifts that block with
+one server-side ``$inc`` and sets the mover's rank from an indexed count, so a
+single write never reads entries back. The shifts commute, so concurrent
+moves compose; only the mover's own count can race with another write and
+persist a rank that is off until that entry next moves or ``rebuild_ranks``
+runs. Batch writes, which move many users at once, re-rank the envelope of
+their moves with ``rerank_range``.
+
+Team standings live in the ``team_leaderboard`` collection. Every change to
+a user's totals or team moves the team totals by the same delta, so team
+standings never need a scan of users or activities.
+
+``rebuild_leaderboard`` recomputes every entry from activities into a shadow
+collection and renames it over the live one, so readers never see a
+partially written leaderboard.
+"""
+import time
+from collections import defaultdict
+
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from .display_names import names_for, user_profiles
+from .models import Activity, Leaderboard, Team, TeamLeaderboard, User
+from .mongo import ensure_indexes, get_collection, get_database
+from .signals import leaderboard_changed
+
+REBUILD_CHUNK_SIZE = 5000
+SHADOW_SUFFIX = '_rebuild'
+
+
+def rank_entries(entries):
+    """
+    Sort leaderboard entry dicts by total_calories and set their competition ranks.
+
+    Used when a whole leaderboard is built in memory before being written.
+    """
+    entries = sorted(entries, key=lambda entry: -entry['total_calories'])
+    previous_total = None
+    for position, entry in enumerate(entries, start=1):
+        if entry['total_calories'] != previous_total:
+            rank = position
+            previous_total = entry['total_calories']
+        entry['rank'] = rank
+    return entries
+
+
+def rerank_range(low=None, high=None, model=Leaderboard):
+    """
+    Recompute ranks for entries with total_calories in [low, high].
+
+    ``None`` leaves that side of the range open, so ``rerank_range()``
+    re-ranks the whole leaderboard. ``model`` selects the user or team
+    leaderboard. Ranks are read and then written back, so calls over
+    overlapping ranges can race; single-entry writes use ``move_entry``.
+    Returns the number of entries updated.
+    """
+    collection = get_collection(model)
+    bounds = {}
+    if low is not None:
+        bounds['$gte'] = low
+    if high is not None:
+        bounds['$lte'] = high
+    position = collection.count_documents({'total_calories': {'$gt': high}}) if high is not None else 0
+
+    updates = []
+    rank = position
+    previous_total = None
+    entries = collection.find(
+        {'total_calories': bounds} if bounds else {},
+        {'total_calories': 1, 'rank': 1},
+    ).sort([('total_calories', DESCENDING), ('_id', ASCENDING)])
+    for entry in entries:
+        position += 1
+        if entry['total_calories'] != previous_total:
+            rank = position
+            previous_total = entry['total_calories']
+        if entry.get('rank') != rank:
+            updates.append(UpdateOne({'_id': entry['_id']}, {'$set': {'rank': rank}}))
+
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def move_entry(key, old_total, new_total, model=Leaderboard):
+    """
+    Re-rank after one entry's total moved from ``old_total`` to ``new_total``.
+
+    ``key`` is the filter selecting the entry, e.g. ``{'user_id': ...}``;
+    ``old_total`` is None for an entry that was just created.
+    """
+    if old_total is None:
+        # A new entry pushes down everyone strictly below it
+        displaced, shift = {'$lt': new_total}, 1
+    elif new_total > old_total:
+        displaced, shift = {'$gte': old_total, '$lt': new_total}, 1
+    elif new_total < old_total:
+        displaced, shift = {'$gte': new_total, '$lt': old_total}, -1
+    else:
+        return
+    collection = get_collection(model)
+    others = {field: {'$ne': value} for field, value in key.items()}
+    collection.update_many({**others, 'total_calories': displaced}, {'$inc': {'rank': shift}})
+    rank = collection.count_documents({'total_calories': {'$gt': new_total}}) + 1
+    collection.update_one(key, {'$set': {'rank': rank}})
+
+
+def rebuild_ranks():
+    """Re-rank every leaderboard entry"""
+    updated = rerank_range()
+    leaderboard_changed.send(sender=Leaderboard, user_ids=None)
+    return updated
+
+
+def record_activity(user_id, calories, activities=1):
+    """
+    Atomically add an activity delta to a user's totals and move their rank.
+
+    Creates the user's leaderboard entry on their first activity.
+    """
+    if not user_id:
+        return
+    collection = get_collection(Leaderboard)
+    increments = {'total_calories': calories, 'total_activities': activities}
+    before = collection.find_one_and_update(
+        {'user_id': user_id},
+        {'$inc': increments},
+        projection={'total_calories': 1, 'team_id': 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        profile = user_profiles([user_id])[user_id]
+        # Another write may have created the entry since the first update
+        before = collection.find_one_and_update(
+            {'user_id': user_id},
+            {'$inc': increments, '$setOnInsert': {'team_id': profile['team_id'], **names_for(profile), 'rank': 0}},
+            projection={'total_calories': 1, 'team_id': 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        team_id = profile['team_id'] if before is None else before.get('team_id')
+    else:
+        team_id = before.get('team_id')
+    old_total = before['total_calories'] if before is not None else None
+    move_entry({'user_id': user_id}, old_total, (old_total or 0) + calories)
+    apply_team_deltas({team_id: (calories, activities, 0)})
+    leaderboard_changed.send(sender=Leaderboard, user_ids=[user_id])
+
+
+def apply_activity_change(before=None, after=None):
+    """
+    Update leaderboard totals for an activity write.
+
+    ``before`` and ``after`` are ``(user_id, calories_burned)`` pairs describing
+    the activity before and after the write; pass ``None`` for the side that
+    does not exist (``before`` on create, ``after`` on delete).
+    """
+    if before and after and before[0] == after[0]:
+        if after[1] != before[1]:
+            record_activity(after[0], after[1] - before[1], 0)
+        return
+    if before:
+        record_activity(before[0], -before[1], -1)
+    if after:
+        record_activity(after[0], after[1], 1)
+
+
+def _write_totals(collection, updates, before, after):
+    """
+    Bulk-write per-user leaderboard updates, then re-rank the moved range once.
+
+    ``updates`` maps user ids to update documents, ``before`` maps them to
+    their current entries (absent when the user has no entry yet) and
+    ``after`` to ``(total_calories, total_activities)`` once updated. The
+    re-ranked range is the envelope of every user's old and new totals, and
+    each team's totals move by the sum of its members' deltas.
+    """
+    new_profiles = user_profiles([user_id for user_id in updates if user_id not in before])
+    requests = []
+    low, high = [], []
+    team_deltas = defaultdict(lambda: [0, 0, 0])
+    for user_id, update in updates.items():
+        calories, activities = after[user_id]
+        entry = before.get(user_id)
+        if entry is not None:
+            team_id = entry.get('team_id')
+            old_calories, old_activities = entry['total_calories'], entry['total_activities']
+            low.append(min(old_calories, calories))
+            high.append(max(old_calories, calories))
+        else:
+            team_id = new_profiles[user_id]['team_id']
+            old_calories = old_activities = 0
+            update = {**update, '$setOnInsert': {'team_id': team_id, **names_for(new_profiles[user_id]), 'rank': 0}}
+            low.append(None)
+            high.append(calories)
+        team_deltas[team_id][0] += calories - old_calories
+        team_deltas[team_id][1] += activities - old_activities
+        requests.append(UpdateOne({'user_id': user_id}, update, upsert=True))
+    collection.bulk_write(requests, ordered=False)
+
+    rerank_range(None if None in low else min(low), max(high))
+    apply_team_deltas({team_id: delta for team_id, delta in team_deltas.items() if any(delta)})
+    leaderboard_changed.send(sender=Leaderboard, user_ids=list(updates))
+
+
+def _current_entries(collection, user_ids):
+    projection = {'user_id': 1, 'team_id': 1, 'total_calories': 1, 'total_activities': 1}
+    return {doc['user_id']: doc for doc in collection.find({'user_id': {'$in': list(user_ids)}}, projection)}
+
+
+def record_activities(deltas):
+    """
+    Apply many users' activity deltas in one bulk write, then re-rank once.
+
+    ``deltas`` maps user ids to ``(calories, activities)`` increments.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id}
+    if not deltas:
+        return
+    collection = get_collection(Leaderboard)
+    before = _current_entries(collection, deltas)
+    updates, after = {}, {}
+    for user_id, (calories, activities) in deltas.items():
+        entry = before.get(user_id, {'total_calories': 0, 'total_activities': 0})
+        updates[user_id] = {'$inc': {'total_calories': calories, 'total_activities': activities}}
+        after[user_id] = (entry['total_calories'] + calories, entry['total_activities'] + activities)
+    _write_totals(collection, updates, before, after)
+
+
+def recompute_users(user_ids):
+    """Recompute the given users' totals from their activities, then re-rank once"""
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    if not user_ids:
+        return
+    pipeline = [
+        {'$match': {'user_id': {'$in': user_ids}}},
+        {'$group': {'_id': '$user_id', 'calories': {'$sum': '$calories_burned'}, 'count': {'$sum': 1}}},
+    ]
+    totals = {row['_id']: (row['calories'], row['count']) for row in get_collection(Activity).aggregate(pipeline)}
+    collection = get_collection(Leaderboard)
+    before = _current_entries(collection, user_ids)
+    updates, after = {}, {}
+    for user_id in user_ids:
+        calories, count = totals.get(user_id, (0, 0))
+        updates[user_id] = {'$set': {'total_calories': calories, 'total_activities': count}}
+        after[user_id] = (calories, count)
+    _write_totals(collection, updates, before, after)
+
+
+# Recomputes the per-member average from the totals in the same update
+TEAM_AVERAGE_STAGE = {'$set': {'average_calories': {'$cond': [
+    {'$gt': ['$member_count', 0]},
+    {'$round': [{'$divide': ['$total_calories', '$member_count']}, 2]},
+    0,
+]}}}
+
+
+def apply_team_deltas(deltas):
+    """
+    Apply per-team ``(calories, activities, members)`` increments, then re-rank teams.
+
+    Each team gets one pipeline update, so its average per member is derived
+    from the incremented totals atomically; missing entries are created.
+    Teams are few, so every change re-ranks all of them.
+    """
+    deltas = {team_id: delta for team_id, delta in deltas.items() if team_id}
+    if not deltas:
+        return
+    requests = [
+        UpdateOne({'team_id': team_id}, [
+            {'$set': {
+                'total_calories': {'$add': [{'$ifNull': ['$total_calories', 0]}, calories]},
+                'total_activities': {'$add': [{'$ifNull': ['$total_activities', 0]}, activities]},
+                'member_count': {'$add': [{'$ifNull': ['$member_count', 0]}, members]},
+                'rank': {'$ifNull': ['$rank', 0]},
+            }},
+            TEAM_AVERAGE_STAGE,
+        ], upsert=True)
+        for team_id, (calories, activities, members) in deltas.items()
+    ]
+    get_collection(TeamLeaderboard).bulk_write(requests, ordered=False)
+    rerank_range(model=TeamLeaderboard)
+
+
+def change_user_team(user_id, old_team_id=None, new_team_id=None):
+    """
+    Move a user's membership and totals between team leaderboard entries.
+
+    Pass ``None`` for ``old_team_id`` when the user is created and for
+    ``new_team_id`` when they are deleted. The user's leaderboard entry
+    follows the move so later activity deltas reach the new team.
+    """
+    old_team_id, new_team_id = old_team_id or '', new_team_id or ''
+    if not user_id or old_team_id == new_team_id:
+        return
+    entry = get_collection(Leaderboard).find_one_and_update(
+        {'user_id': user_id},
+        {'$set': {'team_id': new_team_id}},
+        projection={'total_calories': 1, 'total_activities': 1},
+    )
+    calories = entry['total_calories'] if entry else 0
+    activities = entry['total_activities'] if entry else 0
+    apply_team_deltas({
+        old_team_id: (-calories, -activities, -1),
+        new_team_id: (calories, activities, 1),
+    })
+    if entry is not None:
+        leaderboard_changed.send(sender=Leaderboard, user_ids=[user_id])
+
+
+def remove_team(team_id):
+    """Drop a deleted team's standings entry and re-rank the rest"""
+    get_collection(TeamLeaderboard).delete_one({'team_id': team_id})
+    rerank_range(model=TeamLeaderboard)
+
+
+def rebuild_team_leaderboard():
+    """
+    Rebuild the team leaderboard from users and their leaderboard entries.
+
+    Also repairs leaderboard entries whose team_id no longer matches their
+    user's team. Returns the number of team entries written.
+    """
+    user_teams = {str(user['_id']): user.get('team_id') or '' for user in get_collection(User).find({}, {'team_id': 1})}
+    totals = {str(team['_id']): [0, 0, 0] for team in get_collection(Team).find({}, {'_id': 1})}
+    for team_id in user_teams.values():
+        if team_id:
+            totals.setdefault(team_id, [0, 0, 0])[2] += 1
+
+    collection = get_collection(Leaderboard)
+    repairs = []
+    projection = {'user_id': 1, 'team_id': 1, 'total_calories': 1, 'total_activities': 1}
+    for entry in collection.find({}, projection):
+        team_id = user_teams.get(entry['user_id'], '')
+        if team_id != entry.get('team_id'):
+            repairs.append(UpdateOne({'_id': entry['_id']}, {'$set': {'team_id': team_id}}))
+        if team_id:
+            team_totals = totals.setdefault(team_id, [0, 0, 0])
+            team_totals[0] += entry['total_calories']
+            team_totals[1] += entry['total_activities']
+    if repairs:
+        collection.bulk_write(repairs, ordered=False)
+
+    entries = rank_entries(
+        {
+            'team_id': team_id,
+            'total_calories': calories,
+            'total_activities': activities,
+            'member_count': members,
+            'average_calories': round(calories / members, 2) if members else 0,
+        }
+        for team_id, (calories, activities, members) in totals.items()
+    )
+    team_collection = get_collection(TeamLeaderboard)
+    team_collection.delete_many({})
+    if entries:
+        team_collection.insert_many(entries)
+    if repairs:
+        leaderboard_changed.send(sender=Leaderboard, user_ids=None)
+    return len(entries)
+
+
+def _object_id_of(field):
+    return {'$convert': {'input': field, 'to': 'objectId', 'onError': None, 'onNull': None}}
+
+
+def _rebuild_pipeline(shadow_name):
+    """
+    Build ranked leaderboard entries with one aggregation and ``$out`` them to ``shadow_name``.
+
+    Totals come from one ``$group`` over activities; users without activities
+    are unioned in with zero totals, names are joined from users and teams on
+    their ``_id`` indexes and ``$rank`` sets competition ranks, matching
+    ``rank_entries``. Needs MongoDB 5.0 for ``$setWindowFields``.
+    """
+    return [
+        {'$group': {'_id': '$user_id', 'total_calories': {'$sum': '$calories_burned'}, 'total_activities': {'$sum': 1}}},
+        {'$match': {'_id': {'$nin': [None, '']}}},
+        {'$unionWith': {'coll': User._meta.db_table, 'pipeline': [
+            {'$project': {'_id': {'$toString': '$_id'}, 'total_calories': {'$literal': 0}, 'total_activities': {'$literal': 0}}},
+        ]}},
+        {'$group': {'_id': '$_id', 'total_calories': {'$sum': '$total_calories'}, 'total_activities': {'$sum': '$total_activities'}}},
+        {'$set': {'user_oid': _object_id_of('$_id')}},
+        {'$lookup': {'from': User._meta.db_table, 'localField': 'user_oid', 'foreignField': '_id', 'as': 'user'}},
+        {'$set': {'user': {'$arrayElemAt': ['$user', 0]}}},
+        {'$set': {'team_id': {'$ifNull': ['$user.team_id', '']}}},
+        {'$set': {'team_oid': _object_id_of('$team_id')}},
+        {'$lookup': {'from': Team._meta.db_table, 'localField': 'team_oid', 'foreignField': '_id', 'as': 'team'}},
+        {'$project': {
+            '_id': 0,
+            'user_id': '$_id',
+            'team_id': 1,
+            'user_name': {'$ifNull': ['$user.name', '']},
+            'team_name': {'$ifNull': [{'$arrayElemAt': ['$team.name', 0]}, '']},
+            'total_calories': 1,
+            'total_activities': 1,
+        }},
+        {'$setWindowFields': {'sortBy': {'total_calories': -1}, 'output': {'rank': {'$rank': {}}}}},
+        {'$out': shadow_name},
+    ]
+
+
+def _write_ranked_entries(shadow, chunk_size):
+    """Total activities with one ``$group``, rank in memory and bulk-insert into ``shadow``"""
+    pipeline = [{'$group': {'_id': '$user_id', 'calories': {'$sum': '$calories_burned'}, 'count': {'$sum': 1}}}]
+    totals = {
+        row['_id']: (row['calories'], row['count'])
+        for row in get_collection(Activity).aggregate(pipeline, allowDiskUse=True)
+        if row['_id']
+    }
+    user_ids = set(totals) | {str(user['_id']) for user in get_collection(User).find({}, {'_id': 1})}
+    profiles = user_profiles(user_ids)
+    entries = rank_entries(
+        {
+            'user_id': user_id,
+            'team_id': profiles[user_id]['team_id'],
+            **names_for(profiles[user_id]),
+            'total_calories': totals.get(user_id, (0, 0))[0],
+            'total_activities': totals.get(user_id, (0, 0))[1],
+        }
+        for user_id in user_ids
+    )
+    for start in range(0, len(entries), chunk_size):
+        shadow.insert_many(entries[start:start + chunk_size], ordered=False)
+
+
+def rebuild_leaderboard(in_python=False, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Recompute the whole leaderboard into a shadow collection and swap it in.
+
+    The entries are ranked server-side with ``$setWindowFields``, or with
+    ``rank_entries`` when ``in_python`` is set. The shadow gets the model's
+    indexes before ``renameCollection`` with ``dropTarget`` replaces the live
+    collection in one step. Activities inserted while the rebuild ran are
+    then re-applied with ``recompute_users``; edits and deletes of older
+    activities during the run are not, so schedule it when writes are quiet.
+    Returns the counts and per-phase seconds.
+    """
+    database = get_database()
+    live_name = Leaderboard._meta.db_table
+    shadow = database[f'{live_name}{SHADOW_SUFFIX}']
+    shadow.drop()
+    # Truncated to the second, so it also covers ids generated just before it
+    started_id = ObjectId.from_datetime(timezone.now())
+    activities = get_collection(Activity).estimated_document_count()
+    timings = {}
+
+    started = time.perf_counter()
+    try:
+        if in_python:
+            _write_ranked_entries(shadow, chunk_size)
+        else:
+            get_collection(Activity).aggregate(_rebuild_pipeline(shadow.name), allowDiskUse=True)
+        timings['compute'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ensure_indexes(Leaderboard, shadow)
+        timings['indexes'] = time.perf_counter() - started
+        entries = shadow.estimated_document_count()
+
+        started = time.perf_counter()
+        shadow.rename(live_name, dropTarget=True)
+        timings['swap'] = time.perf_counter() - started
+    except Exception:
+        shadow.drop()
+        raise
+
+    # Writes during the rebuild went to the old collection; redo the new activities
+    started = time.perf_counter()
+    late_users = [
+        user_id for user_id in get_collection(Activity).distinct('user_id', {'_id': {'$gte': started_id}})
+        if user_id
+    ]
+    recompute_users(late_users)
+    leaderboard_changed.send(sender=Leaderboard, user_ids=None)
+    rebuild_team_leaderboard()
+    timings['catch_up'] = time.perf_counter() - started
+    return {'entries': entries, 'activities': activities, 'late_users': len(late_users), 'seconds': timings}
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from octofit_tracker.models import Activity, activity_derived_fields
+from octofit_tracker.mongo import get_collection
+
+
+class Command(BaseCommand):
+    help = 'Store the normalized activity_type and distance_km on existing activities'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Activities read and updated per batch'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every activity, not only those without distance_km'
+        )
+
+    def handle(self, *args, **options):
+        collection = get_collection(Activity)
+        query = {} if options['all'] else {'distance_km': None}
+        started = time.perf_counter()
+        scanned = updated = 0
+        last_id = None
+        while True:
+            # Keyset batches on _id, so rows updated earlier never shift the scan
+            batch_query = {**query, '_id': {'$gt': last_id}} if last_id is not None else query
+            batch = list(
+                collection.find(batch_query, {'activity_type': 1, 'duration': 1, 'distance_km': 1})
+                .sort('_id', 1)
+                .limit(options['batch_size'])
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+            requests = []
+            for doc in batch:
+                derived = activity_derived_fields(doc.get('activity_type'), doc.get('duration'))
+                if any(doc.get(name) != value for name, value in derived.items()):
+                    requests.append(UpdateOne({'_id': doc['_id']}, {'$set': derived}))
+            if requests:
+                updated += collection.bulk_write(requests, ordered=False).modified_count
+            scanned += len(batch)
+            self.stdout.write(f'{scanned} scanned, {updated} updated')
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {updated} of {scanned} activities in {elapsed:.1f}s'
+        ))
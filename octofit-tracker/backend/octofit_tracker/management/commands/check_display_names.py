@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker.display_names import DENORMALIZED_MODELS, find_drift, repair_drift
+
+
+class Command(BaseCommand):
+    help = 'Check the user and team names stored on activities and leaderboard entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Rewrite stale names from the users and teams collections'
+        )
+
+    def handle(self, *args, **options):
+        stale_total = repaired = 0
+        for model in DENORMALIZED_MODELS:
+            drift = find_drift(model)
+            stale = sum(count for _, count in drift.values())
+            stale_total += stale
+            self.stdout.write(f'{model._meta.db_table}: {stale} stale rows across {len(drift)} users')
+            if drift and options['repair']:
+                modified = repair_drift(model, drift)
+                repaired += modified
+                self.stdout.write(f'    repaired {modified} rows')
+
+        if not stale_total:
+            self.stdout.write(self.style.SUCCESS('Stored names are consistent'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} rows'))
+        else:
+            self.stderr.write(self.style.WARNING(f'{stale_total} rows have stale names; run with --repair'))
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from octofit_tracker.caching import bump_namespaces
+from octofit_tracker.windows import compact_day_buckets, rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = 'Fold old daily leaderboard buckets into their monthly buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=62,
+            help='Keep daily buckets for the months covering this many recent days'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute every bucket from activities before compacting'
+        )
+
+    def handle(self, *args, **options):
+        changed = False
+        if options['rebuild']:
+            written = rebuild_buckets()
+            self.stdout.write(f'Rebuilt {written} buckets from activities')
+            changed = True
+
+        cutoff = timezone.now() - timedelta(days=options['keep_days'])
+        before_month = cutoff.strftime('%Y-%m')
+        removed, created = compact_day_buckets(before_month)
+        changed = changed or bool(removed)
+        if changed:
+            bump_namespaces(('leaderboard',))
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} daily buckets before {before_month}-01 ({created} monthly buckets created)'
+        ))
@@ -0,0 +1,55 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from pymongo.errors import OperationFailure
+from octofit_tracker.mongo import existing_indexes, get_collection, index_specs
+
+# Queries served by each declared index
+INDEX_USAGE = {
+    'user_team_idx': 'TeamViewSet.members and member counts: users filtered by team_id',
+    'email_1': 'User.email uniqueness and lookups by email',
+    'activity_user_date_idx': 'ActivityViewSet ?user_id= and UserViewSet.activities: user_id match, newest first',
+    'activity_date_idx': 'ActivityViewSet list: cursor pages ordered by (-date, -_id)',
+    'activity_distance_idx': 'ActivityViewSet ?min_distance=/?max_distance= and ?ordering=-distance_km',
+    'leaderboard_rank_idx': 'LeaderboardViewSet list: cursor pages ordered by (rank, _id)',
+    'leaderboard_calories_idx': 'Leaderboard re-ranking range scans and index warm-up by total_calories',
+    'leaderboard_user_unique': 'Leaderboard $inc upserts by user_id; one entry per user',
+    'team_leaderboard_calories_idx': 'Team standings re-ranking by total_calories',
+    'team_leaderboard_team_unique': 'Team total upserts by team_id; one entry per team',
+    'bucket_ranking_idx': 'LeaderboardViewSet ?window=: one period\'s buckets by (-total_calories, _id), and rank counts',
+    'bucket_user_unique': 'Window bucket $inc upserts by (granularity, period, user_id)',
+    'workout_filter_idx': 'WorkoutViewSet ?difficulty=&category= filters',
+}
+
+
+class Command(BaseCommand):
+    help = 'Create the MongoDB indexes declared on the octofit_tracker models'
+
+    def handle(self, *args, **kwargs):
+        failures = 0
+        for model in apps.get_app_config('octofit_tracker').get_models():
+            collection = get_collection(model)
+            existing = existing_indexes(collection)
+            for name, keys, options in index_specs(model):
+                key_text = ', '.join(f'{field} {direction}' for field, direction in keys)
+                existing_name = existing.get(tuple(keys))
+                if existing_name is not None and existing_name != name:
+                    # A second index on the same keys would be rejected
+                    self.stdout.write(f'{collection.name}.{name} ({key_text}): already indexed as {existing_name}')
+                    continue
+                try:
+                    if existing_name is None and name in existing.values():
+                        # Left with other keys, e.g. by djongo's migrate dropping a key direction
+                        collection.drop_index(name)
+                        self.stdout.write(f'{collection.name}.{name}: replacing an index with different keys')
+                    collection.create_index(keys, name=name, **options)
+                except OperationFailure as exc:
+                    failures += 1
+                    self.stderr.write(self.style.ERROR(f'{collection.name}.{name} ({key_text}): {exc}'))
+                    continue
+                self.stdout.write(self.style.SUCCESS(f'{collection.name}.{name} ({key_text})'))
+                self.stdout.write(f'    covers: {INDEX_USAGE.get(name, "not documented")}')
+
+        if failures:
+            self.stderr.write(self.style.ERROR(f'\n{failures} index(es) could not be created'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\nAll indexes are in place.'))
@@ -0,0 +1,215 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone as dt_timezone
+
+import django
+from bson import ObjectId
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+from octofit_tracker import display_names, leaderboard, windows
+from octofit_tracker.models import Activity, activity_derived_fields
+from octofit_tracker.mongo import get_collection
+
+IMPORT_FIELDS = ('user_id', 'activity_type', 'duration', 'calories_burned', 'date')
+DUPLICATE_KEY = 11000
+
+
+def new_id_prefix():
+    """Timestamp and random bytes shared by the _ids of one import"""
+    return ObjectId().binary[:7].hex()
+
+
+def document_id(id_prefix, line_number):
+    """The _id of the activity on ``line_number``, the same each time the line is imported"""
+    return ObjectId(bytes.fromhex(id_prefix) + line_number.to_bytes(5, 'big'))
+
+
+def parse_chunk(file_format, header, lines, first_line, id_prefix):
+    """
+    Parse and validate a chunk of raw lines into activity documents.
+
+    Validation uses the Activity model fields' own clean() so rows are checked
+    against the stored types without building a serializer per row. Returns
+    ``(documents, errors)`` where errors are ``(line_number, message)`` pairs.
+    Each document's _id comes from its line number, so replaying a chunk
+    after a crash cannot insert it twice. Runs in worker processes, so it only takes and returns plain data.
+    """
+    if file_format == 'csv':
+        records = csv.DictReader(lines, fieldnames=header)
+    else:
+        records = lines
+
+    connection = connections['default']
+    fields = [Activity._meta.get_field(name) for name in IMPORT_FIELDS]
+    documents, errors = [], []
+    for line_number, record in enumerate(records, start=first_line):
+        if file_format == 'ndjson':
+            if not record.strip():
+                continue
+            try:
+                record = json.loads(record)
+            except ValueError as exc:
+                errors.append((line_number, f'invalid JSON: {exc}'))
+                continue
+            if not isinstance(record, dict):
+                errors.append((line_number, 'expected a JSON object'))
+                continue
+        document = {}
+        for field in fields:
+            try:
+                value = field.clean(record.get(field.name), None)
+            except ValidationError as exc:
+                errors.append((line_number, f'{field.name}: {"; ".join(exc.messages)}'))
+                break
+            if field.name == 'date' and timezone.is_naive(value):
+                value = timezone.make_aware(value, dt_timezone.utc)
+            document[field.column] = field.get_db_prep_save(value, connection)
+        else:
+            document.update(activity_derived_fields(document['activity_type'], document['duration']))
+            document['_id'] = document_id(id_prefix, line_number)
+            documents.append(document)
+    return documents, errors
+
+
+def _setup_worker():
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Import historical activities from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV (with header row) or NDJSON file of activities')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='File format (default: from extension)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per insert_many batch')
+        parser.add_argument('--workers', type=int, default=0, help='Parse chunks in this many processes')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <file>.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint')
+
+    def _read_chunks(self, handle, chunk_size, skip_lines, first_line):
+        """Yield (first_line_number, lines) chunks, skipping lines already imported"""
+        line_number = first_line
+        chunk = []
+        chunk_start = None
+        for line in handle:
+            line_number += 1
+            if line_number <= skip_lines:
+                continue
+            if chunk_start is None:
+                chunk_start = line_number
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk_start, chunk
+                chunk, chunk_start = [], None
+        if chunk:
+            yield chunk_start, chunk
+
+    def _parsed_chunks(self, chunks, file_format, header, workers, id_prefix):
+        """Parse chunks in order, keeping at most two chunks per worker in flight"""
+        if workers <= 0:
+            for first_line, lines in chunks:
+                yield first_line, lines, parse_chunk(file_format, header, lines, first_line, id_prefix)
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as executor:
+            pending = deque()
+            for first_line, lines in chunks:
+                pending.append((first_line, lines, executor.submit(parse_chunk, file_format, header, lines, first_line, id_prefix)))
+                if len(pending) >= workers * 2:
+                    first, chunk_lines, future = pending.popleft()
+                    yield first, chunk_lines, future.result()
+            while pending:
+                first, chunk_lines, future = pending.popleft()
+                yield first, chunk_lines, future.result()
+
+    def _save_checkpoint(self, path, state):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(state, handle)
+        os.replace(temporary, path)
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+
+        state = {
+            'file': os.path.abspath(path),
+            'line': 0,
+            'inserted': 0,
+            'rejected': 0,
+            'user_ids': [],
+            'id_prefix': new_id_prefix(),
+        }
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as handle:
+                state = json.load(handle)
+            if state['file'] != os.path.abspath(path):
+                raise CommandError(f'{checkpoint_path} belongs to {state["file"]}')
+            self.stdout.write(f'Resuming after line {state["line"]} ({state["inserted"]} rows already imported)')
+            state.setdefault('id_prefix', new_id_prefix())
+        # Saved before the first insert, so a crash in any chunk replays it with the same _ids
+        self._save_checkpoint(checkpoint_path, state)
+
+        collection = get_collection(Activity)
+        user_ids = set(state['user_ids'])
+        started = time.perf_counter()
+        imported_now = 0
+
+        with open(path, newline='', encoding='utf-8') as handle:
+            header = None
+            first_line = 0
+            if file_format == 'csv':
+                header = next(csv.reader([handle.readline()]))
+                missing = set(IMPORT_FIELDS) - set(header)
+                if missing:
+                    raise CommandError(f'CSV header is missing: {", ".join(sorted(missing))}')
+                first_line = 1
+            chunks = self._read_chunks(handle, options['chunk_size'], state['line'], first_line)
+
+            for chunk_start, lines, (documents, errors) in self._parsed_chunks(chunks, file_format, header, options['workers'], state['id_prefix']):
+                for line_number, message in errors:
+                    self.stderr.write(f'line {line_number}: {message}')
+                inserted = len(documents)
+                if documents:
+                    display_names.fill_names(documents)
+                    try:
+                        collection.insert_many(documents, ordered=False)
+                    except BulkWriteError as exc:
+                        # Duplicate _ids are rows a crashed run inserted before its checkpoint
+                        failed = [error for error in exc.details['writeErrors'] if error['code'] != DUPLICATE_KEY]
+                        inserted -= len(failed)
+                        for error in failed:
+                            self.stderr.write(f'insert failed: {error["errmsg"]}')
+                user_ids.update(document['user_id'] for document in documents)
+                imported_now += inserted
+
+                state['line'] = chunk_start + len(lines) - 1
+                state['inserted'] += inserted
+                state['rejected'] += len(documents) - inserted + len(errors)
+                state['user_ids'] = sorted(user_ids)
+                self._save_checkpoint(checkpoint_path, state)
+
+                elapsed = max(time.perf_counter() - started, 1e-6)
+                self.stdout.write(
+                    f'line {state["line"]}: {state["inserted"]} imported, {state["rejected"]} rejected '
+                    f'({imported_now / elapsed:,.0f} rows/s)'
+                )
+
+        self.stdout.write(f'Recomputing leaderboard totals and windows for {len(user_ids)} users...')
+        leaderboard.recompute_users(user_ids)
+        windows.rebuild_buckets(user_ids)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {state["inserted"]} activities ({state["rejected"]} rejected) '
+            f'in {elapsed:.1f}s ({imported_now / elapsed:,.0f} rows/s)'
+        ))
@@ -1,216 +1,225 @@
 from django.core.management.base import BaseCommand
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime, timedelta
+from django.utils import timezone
+from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout, activity_derived_fields
+from octofit_tracker.caching import bump_namespaces
+from octofit_tracker.catalog import workout_catalog
+from octofit_tracker.leaderboard import rank_entries, rebuild_team_leaderboard
+from octofit_tracker.windows import rebuild_buckets
+from octofit_tracker.mongo import get_collection
+from octofit_tracker.signals import leaderboard_changed
+from datetime import timedelta
 import random
+import time
+
+
+HERO_USERS = [
+    # (name, email, password, team)
+    ('Tony Stark', 'ironman@marvel.com', 'arc_reactor_3000', 'marvel'),
+    ('Steve Rogers', 'captain@marvel.com', 'super_soldier_serum', 'marvel'),
+    ('Natasha Romanoff', 'blackwidow@marvel.com', 'red_room_elite', 'marvel'),
+    ('Bruce Banner', 'hulk@marvel.com', 'gamma_radiation', 'marvel'),
+    ('Thor Odinson', 'thor@marvel.com', 'mjolnir_worthy', 'marvel'),
+    ('Bruce Wayne', 'batman@dc.com', 'dark_knight_rises', 'dc'),
+    ('Clark Kent', 'superman@dc.com', 'kryptonite_weakness', 'dc'),
+    ('Diana Prince', 'wonderwoman@dc.com', 'lasso_of_truth', 'dc'),
+    ('Barry Allen', 'flash@dc.com', 'speed_force', 'dc'),
+    ('Arthur Curry', 'aquaman@dc.com', 'trident_power', 'dc'),
+]
+
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'HIIT']
+
+WORKOUTS = [
+    {
+        'name': 'Hero Training Circuit',
+        'description': 'High-intensity circuit training to build superhero strength and endurance.',
+        'difficulty': 'Advanced',
+        'duration': 45,
+        'category': 'HIIT'
+    },
+    {
+        'name': 'Speedster Sprint',
+        'description': 'Speed-focused cardio workout inspired by the fastest heroes.',
+        'difficulty': 'Intermediate',
+        'duration': 30,
+        'category': 'Running'
+    },
+    {
+        'name': 'Warrior Strength',
+        'description': 'Build power and muscle with this strength-focused workout.',
+        'difficulty': 'Advanced',
+        'duration': 60,
+        'category': 'Weightlifting'
+    },
+    {
+        'name': 'Mystic Yoga Flow',
+        'description': 'Find balance and flexibility with this calming yoga session.',
+        'difficulty': 'Beginner',
+        'duration': 40,
+        'category': 'Yoga'
+    },
+    {
+        'name': 'Atlantean Swim',
+        'description': 'Master the waters with this comprehensive swim workout.',
+        'difficulty': 'Intermediate',
+        'duration': 50,
+        'category': 'Swimming'
+    },
+    {
+        'name': 'Combat Training',
+        'description': 'Learn fighting techniques with this boxing and martial arts workout.',
+        'difficulty': 'Advanced',
+        'duration': 55,
+        'category': 'Boxing'
+    },
+    {
+        'name': 'Beginner Hero Boot Camp',
+        'description': 'Start your hero journey with this beginner-friendly full-body workout.',
+        'difficulty': 'Beginner',
+        'duration': 25,
+        'category': 'HIIT'
+    },
+    {
+        'name': 'Endurance Challenge',
+        'description': 'Push your limits with this long-duration cardio challenge.',
+        'difficulty': 'Intermediate',
+        'duration': 75,
+        'category': 'Cycling'
+    },
+]
 
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=len(HERO_USERS),
+            help='Number of users; the first ten are the heroes, the rest are generated'
+        )
+        parser.add_argument(
+            '--activities-per-user', type=int, default=None,
+            help='Activities per user (default: random 5-10 each)'
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable datasets')
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Documents per insert_many batch'
+        )
+
+    def _insert_chunked(self, collection, documents, chunk_size):
+        """Insert an iterable of documents in insert_many batches; returns the count"""
+        count = 0
+        chunk = []
+        for document in documents:
+            chunk.append(document)
+            if len(chunk) >= chunk_size:
+                collection.insert_many(chunk, ordered=False)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            collection.insert_many(chunk, ordered=False)
+            count += len(chunk)
+        return count
+
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting database population...'))
+        started = time.perf_counter()
+        rng = random.Random(options['seed'])
+        chunk_size = options['chunk_size']
+        activities_per_user = options['activities_per_user']
+        collections = {model: get_collection(model) for model in (User, Team, Activity, Leaderboard, Workout)}
 
         # Delete existing data
         self.stdout.write('Deleting existing data...')
-        User.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
+        for collection in collections.values():
+            collection.delete_many({})
 
         # Create Teams
         self.stdout.write('Creating teams...')
-        team_marvel = Team.objects.create(
-            name='Team Marvel',
-            description='Assemble! The mightiest heroes unite for fitness.'
-        )
-        team_dc = Team.objects.create(
-            name='Team DC',
-            description='Justice League members pushing their limits.'
-        )
+        teams = {
+            'marvel': {'name': 'Team Marvel', 'description': 'Assemble! The mightiest heroes unite for fitness.'},
+            'dc': {'name': 'Team DC', 'description': 'Justice League members pushing their limits.'},
+        }
+        collections[Team].insert_many(list(teams.values()))
+        team_ids = {key: str(team['_id']) for key, team in teams.items()}
+        team_names = {str(team['_id']): team['name'] for team in teams.values()}
 
-        # Create Users - Marvel Heroes
+        # Create Users - heroes first, then generated users alternating between teams
         self.stdout.write('Creating users...')
-        marvel_users = [
-            User.objects.create(
-                name='Tony Stark',
-                email='ironman@marvel.com',
-                password='arc_reactor_3000',
-                team_id=str(team_marvel._id)
-            ),
-            User.objects.create(
-                name='Steve Rogers',
-                email='captain@marvel.com',
-                password='super_soldier_serum',
-                team_id=str(team_marvel._id)
-            ),
-            User.objects.create(
-                name='Natasha Romanoff',
-                email='blackwidow@marvel.com',
-                password='red_room_elite',
-                team_id=str(team_marvel._id)
-            ),
-            User.objects.create(
-                name='Bruce Banner',
-                email='hulk@marvel.com',
-                password='gamma_radiation',
-                team_id=str(team_marvel._id)
-            ),
-            User.objects.create(
-                name='Thor Odinson',
-                email='thor@marvel.com',
-                password='mjolnir_worthy',
-                team_id=str(team_marvel._id)
-            ),
-        ]
-
-        # Create Users - DC Heroes
-        dc_users = [
-            User.objects.create(
-                name='Bruce Wayne',
-                email='batman@dc.com',
-                password='dark_knight_rises',
-                team_id=str(team_dc._id)
-            ),
-            User.objects.create(
-                name='Clark Kent',
-                email='superman@dc.com',
-                password='kryptonite_weakness',
-                team_id=str(team_dc._id)
-            ),
-            User.objects.create(
-                name='Diana Prince',
-                email='wonderwoman@dc.com',
-                password='lasso_of_truth',
-                team_id=str(team_dc._id)
-            ),
-            User.objects.create(
-                name='Barry Allen',
-                email='flash@dc.com',
-                password='speed_force',
-                team_id=str(team_dc._id)
-            ),
-            User.objects.create(
-                name='Arthur Curry',
-                email='aquaman@dc.com',
-                password='trident_power',
-                team_id=str(team_dc._id)
-            ),
-        ]
-
-        all_users = marvel_users + dc_users
-
-        # Create Activities
+        users = []
+        for index in range(options['users']):
+            if index < len(HERO_USERS):
+                name, email, password, team = HERO_USERS[index]
+            else:
+                name = f'Hero {index + 1}'
+                email = f'hero{index + 1}@octofit.test'
+                password = f'hero_password_{index + 1}'
+                team = 'marvel' if index % 2 == 0 else 'dc'
+            users.append({'name': name, 'email': email, 'password': password, 'team_id': team_ids[team]})
+        self._insert_chunked(collections[User], users, chunk_size)
+
+        # Create Activities, totalling calories per user as they are generated
         self.stdout.write('Creating activities...')
-        activity_types = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'HIIT']
-        
-        for user in all_users:
-            # Create 5-10 activities for each user
-            num_activities = random.randint(5, 10)
-            for i in range(num_activities):
-                activity_type = random.choice(activity_types)
-                duration = random.randint(20, 120)
-                calories = duration * random.randint(5, 10)
-                date = datetime.now() - timedelta(days=random.randint(0, 30))
-                
-                Activity.objects.create(
-                    user_id=str(user._id),
-                    activity_type=activity_type,
-                    duration=duration,
-                    calories_burned=calories,
-                    date=date
-                )
-
-        # Create Leaderboard entries
+        totals = {str(user['_id']): [0, 0] for user in users}
+        now = timezone.now().replace(tzinfo=None)
+
+        def generate_activities():
+            for user in users:
+                user_id = str(user['_id'])
+                count = activities_per_user if activities_per_user is not None else rng.randint(5, 10)
+                for _ in range(count):
+                    duration = rng.randint(20, 120)
+                    calories = duration * rng.randint(5, 10)
+                    activity_type = rng.choice(ACTIVITY_TYPES)
+                    totals[user_id][0] += calories
+                    totals[user_id][1] += 1
+                    yield {
+                        'user_id': user_id,
+                        'user_name': user['name'],
+                        'team_name': team_names[user['team_id']],
+                        **activity_derived_fields(activity_type, duration),
+                        'duration': duration,
+                        'calories_burned': calories,
+                        'date': now - timedelta(days=rng.randint(0, 30)),
+                    }
+
+        activity_count = self._insert_chunked(collections[Activity], generate_activities(), chunk_size)
+
+        # Create Leaderboard entries, ranked in memory
         self.stdout.write('Creating leaderboard entries...')
-        for user in all_users:
-            user_activities = Activity.objects.filter(user_id=str(user._id))
-            total_calories = sum(activity.calories_burned for activity in user_activities)
-            total_activities = user_activities.count()
-            
-            Leaderboard.objects.create(
-                user_id=str(user._id),
-                team_id=user.team_id,
-                total_calories=total_calories,
-                total_activities=total_activities,
-                rank=0  # Will be calculated later
-            )
-
-        # Update ranks
-        leaderboard_entries = Leaderboard.objects.all().order_by('-total_calories')
-        for rank, entry in enumerate(leaderboard_entries, start=1):
-            entry.rank = rank
-            entry.save()
+        entries = rank_entries(
+            {
+                'user_id': str(user['_id']),
+                'team_id': user['team_id'],
+                'user_name': user['name'],
+                'team_name': team_names[user['team_id']],
+                'total_calories': totals[str(user['_id'])][0],
+                'total_activities': totals[str(user['_id'])][1],
+            }
+            for user in users
+        )
+        self._insert_chunked(collections[Leaderboard], entries, chunk_size)
+        leaderboard_changed.send(sender=Leaderboard, user_ids=None)
+        team_count = rebuild_team_leaderboard()
+        self.stdout.write(f'Team leaderboard entries: {team_count}')
+        bucket_count = rebuild_buckets()
+        self.stdout.write(f'Leaderboard window buckets: {bucket_count}')
 
         # Create Workouts
         self.stdout.write('Creating workouts...')
-        workouts_data = [
-            {
-                'name': 'Hero Training Circuit',
-                'description': 'High-intensity circuit training to build superhero strength and endurance.',
-                'difficulty': 'Advanced',
-                'duration': 45,
-                'category': 'HIIT'
-            },
-            {
-                'name': 'Speedster Sprint',
-                'description': 'Speed-focused cardio workout inspired by the fastest heroes.',
-                'difficulty': 'Intermediate',
-                'duration': 30,
-                'category': 'Running'
-            },
-            {
-                'name': 'Warrior Strength',
-                'description': 'Build power and muscle with this strength-focused workout.',
-                'difficulty': 'Advanced',
-                'duration': 60,
-                'category': 'Weightlifting'
-            },
-            {
-                'name': 'Mystic Yoga Flow',
-                'description': 'Find balance and flexibility with this calming yoga session.',
-                'difficulty': 'Beginner',
-                'duration': 40,
-                'category': 'Yoga'
-            },
-            {
-                'name': 'Atlantean Swim',
-                'description': 'Master the waters with this comprehensive swim workout.',
-                'difficulty': 'Intermediate',
-                'duration': 50,
-                'category': 'Swimming'
-            },
-            {
-                'name': 'Combat Training',
-                'description': 'Learn fighting techniques with this boxing and martial arts workout.',
-                'difficulty': 'Advanced',
-                'duration': 55,
-                'category': 'Boxing'
-            },
-            {
-                'name': 'Beginner Hero Boot Camp',
-                'description': 'Start your hero journey with this beginner-friendly full-body workout.',
-                'difficulty': 'Beginner',
-                'duration': 25,
-                'category': 'HIIT'
-            },
-            {
-                'name': 'Endurance Challenge',
-                'description': 'Push your limits with this long-duration cardio challenge.',
-                'difficulty': 'Intermediate',
-                'duration': 75,
-                'category': 'Cycling'
-            },
-        ]
+        collections[Workout].insert_many([dict(workout) for workout in WORKOUTS])
 
-        for workout_data in workouts_data:
-            Workout.objects.create(**workout_data)
+        # Raw writes skip the model signals, so invalidate what they would have
+        bump_namespaces(('teams', 'workouts'))
+        workout_catalog.invalidate()
 
         # Display summary
+        elapsed = time.perf_counter() - started
         self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
-        self.stdout.write(f'Teams: {Team.objects.count()}')
-        self.stdout.write(f'Users: {User.objects.count()}')
-        self.stdout.write(f'Activities: {Activity.objects.count()}')
-        self.stdout.write(f'Leaderboard entries: {Leaderboard.objects.count()}')
-        self.stdout.write(f'Workouts: {Workout.objects.count()}')
+        self.stdout.write(f'Teams: {collections[Team].count_documents({})}')
+        self.stdout.write(f'Users: {collections[User].count_documents({})}')
+        self.stdout.write(f'Activities: {collections[Activity].count_documents({})}')
+        self.stdout.write(f'Leaderboard entries: {collections[Leaderboard].count_documents({})}')
+        self.stdout.write(f'Workouts: {collections[Workout].count_documents({})}')
+        self.stdout.write(f'Elapsed: {elapsed:.1f}s ({activity_count / elapsed:,.0f} activities/s)')
         self.stdout.write(self.style.SUCCESS('\nDatabase populated successfully!'))
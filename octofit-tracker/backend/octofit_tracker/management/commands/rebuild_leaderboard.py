@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker.leaderboard import REBUILD_CHUNK_SIZE, rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute the leaderboard into a shadow collection and swap it over the live one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--in-python',
+            action='store_true',
+            help='Rank in Python instead of with $setWindowFields (for MongoDB before 5.0)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=REBUILD_CHUNK_SIZE,
+            help='Entries per insert when ranking in Python'
+        )
+
+    def handle(self, *args, **options):
+        result = rebuild_leaderboard(in_python=options['in_python'], chunk_size=options['chunk_size'])
+        seconds = result['seconds']
+        for phase, elapsed in seconds.items():
+            self.stdout.write(f'{phase}: {elapsed:.2f}s')
+        elapsed = max(sum(seconds.values()), 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {result["entries"]} leaderboard entries from {result["activities"]} activities '
+            f'in {elapsed:.1f}s ({result["activities"] / elapsed:,.0f} activities/s, '
+            f'{result["entries"] / elapsed:,.0f} entries/s); '
+            f'{result["late_users"]} users caught up after the swap'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker.leaderboard import rebuild_team_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the team leaderboard from users and their leaderboard entries'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_team_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} team leaderboard entries'))
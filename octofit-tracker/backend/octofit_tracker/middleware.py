@@ -0,0 +1,74 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from .monitoring import RequestMetrics, current_metrics, registry
+
+logger = logging.getLogger('octofit_tracker.requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request and record a detailed breakdown for a sample of them.
+
+    Sampled responses carry a Server-Timing header and produce one JSON log
+    line. Place it first in MIDDLEWARE so the wall time covers the rest of
+    the stack. Streaming responses are timed until their first byte. Runs
+    natively in both sync and async (ASGI) stacks.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks instances as coroutine functions so Django calls the async
+            # path without a sync/async switch, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._acall(request)
+        metrics, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self._finish(request, response, metrics, started)
+
+    async def _acall(self, request):
+        metrics, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self._finish(request, response, metrics, started)
+
+    def _start(self):
+        metrics = RequestMetrics() if random.random() < settings.REQUEST_METRICS_SAMPLE_RATE else None
+        return metrics, current_metrics.set(metrics), time.perf_counter()
+
+    def _finish(self, request, response, metrics, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        registry.observe_request(view, request.method, response.status_code, elapsed, metrics)
+        if metrics is not None:
+            response['Server-Timing'] = metrics.server_timing(elapsed)
+            logger.info(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'mongo_commands': metrics.mongo_commands,
+                'mongo_ms': round(metrics.mongo_seconds * 1000, 2),
+                'serializer_ms': round(metrics.serializer_seconds * 1000, 2),
+            }))
+        return response
@@ -1,6 +1,78 @@
 from djongo import models
 
 
+# Approximate speeds used to estimate activity distance:
+# running ~10km/h, cycling ~20km/h, walking ~5km/h
+ACTIVITY_SPEEDS_KMH = {
+    'Running': 10,
+    'Cycling': 20,
+    'Walking': 5,
+    'Swimming': 2,
+}
+DEFAULT_SPEED_KMH = 5
+
+
+def estimate_distance(activity_type, duration):
+    """Approximate distance in km from activity type and duration in minutes"""
+    speed = ACTIVITY_SPEEDS_KMH.get(activity_type, DEFAULT_SPEED_KMH)
+    return round((duration / 60) * speed, 2)
+
+
+class ActivityType(models.TextChoices):
+    RUNNING = 'Running'
+    CYCLING = 'Cycling'
+    WALKING = 'Walking'
+    SWIMMING = 'Swimming'
+    WEIGHTLIFTING = 'Weightlifting'
+    YOGA = 'Yoga'
+    BOXING = 'Boxing'
+    HIIT = 'HIIT'
+
+
+# Lower-cased spellings clients send for the known activity types
+ACTIVITY_TYPE_ALIASES = {
+    **{activity_type.lower(): activity_type for activity_type in ActivityType.values},
+    'run': ActivityType.RUNNING,
+    'jog': ActivityType.RUNNING,
+    'jogging': ActivityType.RUNNING,
+    'bike': ActivityType.CYCLING,
+    'biking': ActivityType.CYCLING,
+    'cycle': ActivityType.CYCLING,
+    'walk': ActivityType.WALKING,
+    'swim': ActivityType.SWIMMING,
+    'weights': ActivityType.WEIGHTLIFTING,
+    'weight lifting': ActivityType.WEIGHTLIFTING,
+}
+
+
+def normalize_activity_type(value):
+    """Map an activity type to its ActivityType value, keeping unknown types as given"""
+    if not isinstance(value, str):
+        return value
+    key = ' '.join(value.replace('_', ' ').replace('-', ' ').split()).lower()
+    return str(ACTIVITY_TYPE_ALIASES.get(key, value.strip()))
+
+
+def activity_derived_fields(activity_type, duration):
+    """The fields stored alongside an activity's type and duration"""
+    activity_type = normalize_activity_type(activity_type)
+    return {'activity_type': activity_type, 'distance_km': estimate_distance(activity_type, duration or 0)}
+
+
+# Calories burned per minute of workout at each difficulty
+WORKOUT_CALORIE_RATES = {
+    'Beginner': 5,
+    'Intermediate': 8,
+    'Advanced': 12,
+}
+DEFAULT_WORKOUT_CALORIE_RATE = 8
+
+
+def estimate_workout_calories(difficulty, duration):
+    """Estimate calories burned based on duration and difficulty"""
+    return duration * WORKOUT_CALORIE_RATES.get(difficulty, DEFAULT_WORKOUT_CALORIE_RATE)
+
+
 class User(models.Model):
     _id = models.ObjectIdField()
     name = models.CharField(max_length=100)
@@ -10,6 +82,9 @@ class User(models.Model):
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['team_id'], name='user_team_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -34,12 +109,33 @@ class Activity(models.Model):
     duration = models.IntegerField()  # in minutes
     calories_burned = models.IntegerField()
     date = models.DateTimeField()
+    # Copies of the user's and their team's names, see display_names
+    user_name = models.CharField(max_length=100, null=True, blank=True)
+    team_name = models.CharField(max_length=100, null=True, blank=True)
+    # Set from activity_type and duration on every save, see activity_derived_fields
+    distance_km = models.FloatField(null=True, blank=True)
     
     class Meta:
         db_table = 'activities'
+        # Ascending keys only: djongo builds Meta.indexes without key
+        # directions, and an index whose keys all flip serves reversed sorts
+        indexes = [
+            models.Index(fields=['user_id', 'date'], name='activity_user_date_idx'),
+            models.Index(fields=['date', '_id'], name='activity_date_idx'),
+            models.Index(fields=['distance_km', '_id'], name='activity_distance_idx'),
+        ]
     
     def __str__(self):
         return f"{self.activity_type} - {self.duration} mins"
+    
+    def set_derived_fields(self):
+        """Normalize activity_type and store the estimated distance"""
+        for name, value in activity_derived_fields(self.activity_type, self.duration).items():
+            setattr(self, name, value)
+    
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        super().save(*args, **kwargs)
 
 
 class Leaderboard(models.Model):
@@ -49,14 +145,63 @@ class Leaderboard(models.Model):
     total_calories = models.IntegerField()
     total_activities = models.IntegerField()
     rank = models.IntegerField()
+    user_name = models.CharField(max_length=100, null=True, blank=True)
+    team_name = models.CharField(max_length=100, null=True, blank=True)
     
     class Meta:
         db_table = 'leaderboard'
+        indexes = [
+            models.Index(fields=['rank', '_id'], name='leaderboard_rank_idx'),
+            models.Index(fields=['total_calories'], name='leaderboard_calories_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user_id'], name='leaderboard_user_unique'),
+        ]
     
     def __str__(self):
         return f"Rank {self.rank} - {self.total_calories} calories"
 
 
+class TeamLeaderboard(models.Model):
+    _id = models.ObjectIdField()
+    team_id = models.CharField(max_length=50)
+    total_calories = models.IntegerField()
+    total_activities = models.IntegerField()
+    member_count = models.IntegerField()
+    average_calories = models.FloatField()
+    rank = models.IntegerField()
+    
+    class Meta:
+        db_table = 'team_leaderboard'
+        indexes = [
+            models.Index(fields=['total_calories'], name='team_leaderboard_calories_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['team_id'], name='team_leaderboard_team_unique'),
+        ]
+    
+    def __str__(self):
+        return f"Rank {self.rank} - team {self.team_id}"
+
+
+class LeaderboardBucket(models.Model):
+    _id = models.ObjectIdField()
+    user_id = models.CharField(max_length=50)
+    granularity = models.CharField(max_length=5)
+    period = models.CharField(max_length=10)
+    total_calories = models.IntegerField()
+    total_activities = models.IntegerField()
+    
+    class Meta:
+        db_table = 'leaderboard_buckets'
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'period', 'user_id'], name='bucket_user_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularity} {self.period} - user {self.user_id}"
+
+
 class Workout(models.Model):
     _id = models.ObjectIdField()
     name = models.CharField(max_length=100)
@@ -67,6 +212,19 @@ class Workout(models.Model):
     
     class Meta:
         db_table = 'workouts'
+        indexes = [
+            models.Index(fields=['difficulty', 'category'], name='workout_filter_idx'),
+        ]
     
     def __str__(self):
         return self.name
+
+
+# Indexes mixing key directions, which djongo's migrate cannot build; only
+# ensure_indexes creates them, see mongo.index_specs
+DIRECTIONAL_INDEXES = {
+    # Window rankings page by (-total_calories, _id) within one period
+    LeaderboardBucket: [
+        models.Index(fields=['granularity', 'period', '-total_calories', '_id'], name='bucket_ranking_idx'),
+    ],
+}
@@ -0,0 +1,121 @@
+"""
+Helpers for talking to MongoDB directly through the djongo connection.
+
+djongo translates ORM calls into single-document operations; anything that
+needs an aggregation pipeline or a bulk write goes through these helpers.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import DateTimeField, UniqueConstraint
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+from .models import DIRECTIONAL_INDEXES
+from .routers import read_alias
+
+
+def get_database(using='default'):
+    """Return the pymongo Database behind a djongo connection"""
+    connection = connections[using]
+    connection.ensure_connection()
+    return connection.connection
+
+
+def read_only_preference():
+    """The read preference for read paths that tolerate replication lag"""
+    return make_read_preference(read_pref_mode_from_name(settings.MONGO_READ_ONLY_READ_PREFERENCE), None)
+
+
+def get_collection(model, using=None, read_only=False):
+    """
+    Return the pymongo collection backing a model.
+
+    Without ``using`` the collection follows the read routing of the current
+    request, see routers.py. ``read_only`` collections read with
+    ``MONGO_READ_ONLY_READ_PREFERENCE``.
+    """
+    collection = get_database(using or read_alias())[model._meta.db_table]
+    if read_only:
+        collection = collection.with_options(read_preference=read_only_preference())
+    return collection
+
+
+def to_document(instance, using='default'):
+    """Build the document djongo would store for an unsaved model instance"""
+    connection = connections[using]
+    return {
+        field.column: field.get_db_prep_save(getattr(instance, field.attname), connection)
+        for field in instance._meta.concrete_fields
+        if not field.primary_key
+    }
+
+
+def from_document(model, doc):
+    """Build an unsaved model instance from a raw document, as djongo would load it"""
+    values = {}
+    for field in model._meta.concrete_fields:
+        value = doc.get(field.column)
+        if isinstance(field, DateTimeField) and value is not None and settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        values[field.attname] = value
+    return model(**values)
+
+
+def index_specs(model):
+    """
+    Describe the MongoDB indexes declared on a model.
+
+    Returns ``(name, keys, options)`` tuples built from ``Meta.indexes``,
+    ``DIRECTIONAL_INDEXES``, ``Meta.constraints`` unique constraints and
+    ``unique=True`` fields. djongo's migrate builds the Meta entries itself,
+    but drops the direction of ``'-field'`` keys, so mixed-direction indexes
+    are declared outside Meta. Unique fields use MongoDB's default index
+    name, which is what djongo builds them under.
+    """
+    specs = []
+    for index in model._meta.indexes + DIRECTIONAL_INDEXES.get(model, []):
+        keys = [
+            (model._meta.get_field(field.lstrip('-')).column, DESCENDING if field.startswith('-') else ASCENDING)
+            for field in index.fields
+        ]
+        specs.append((index.name, keys, {}))
+    for constraint in model._meta.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            keys = [(model._meta.get_field(field).column, ASCENDING) for field in constraint.fields]
+            specs.append((constraint.name, keys, {'unique': True}))
+    for field in model._meta.fields:
+        if field.unique and not field.primary_key:
+            specs.append((f'{field.column}_1', [(field.column, ASCENDING)], {'unique': True}))
+    return specs
+
+
+def existing_indexes(collection):
+    """Map the key pattern of each index on ``collection`` to its name"""
+    return {
+        tuple((field, int(direction)) for field, direction in info['key']): name
+        for name, info in collection.index_information().items()
+    }
+
+
+def ensure_indexes(model, collection=None):
+    """
+    Create a model's declared indexes.
+
+    Specs whose key pattern is already indexed, under any name, are skipped;
+    MongoDB rejects a second index on the same keys. An index holding a
+    spec's name over other keys is replaced. Returns the names of the
+    indexes created.
+    """
+    collection = collection if collection is not None else get_collection(model)
+    existing = existing_indexes(collection)
+    created = []
+    for name, keys, options in index_specs(model):
+        if tuple(keys) in existing:
+            continue
+        if name in existing.values():
+            collection.drop_index(name)
+        created.append(collection.create_index(keys, name=name, **options))
+    return created
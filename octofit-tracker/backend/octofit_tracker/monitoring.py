@@ -0,0 +1,256 @@
+"""
+Per-request instrumentation: MongoDB command timing, serializer timing and
+per-view histograms exposed in the Prometheus text format.
+
+Every request's wall time lands in a histogram, which costs two clock reads
+and a locked increment. The detailed breakdown (Mongo commands, serializer
+time, the Server-Timing header and a structured log line) is only collected
+for a ``REQUEST_METRICS_SAMPLE_RATE`` fraction of requests. The breakdown
+follows the request through a context variable, so commands issued from
+threads that don't inherit it (Motor's executor) aren't attributed. Metrics
+are per process; scrape every worker.
+
+Connection pools report how long each checkout waited for a connection and
+how many connections are open and checked out per server, summed over the
+process's clients. Waits that approach ``waitQueueTimeoutMS`` or checked-out
+counts at the pool's max size mean the worker needs a bigger pool.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the per-request Mongo command count buckets
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+# Upper bounds (seconds) of the connection checkout wait buckets
+CHECKOUT_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Breakdown collected for one sampled request"""
+
+    def __init__(self):
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+    def server_timing(self, total_seconds):
+        """Server-Timing header value for this request"""
+        return ', '.join([
+            f'app;dur={total_seconds * 1000:.1f}',
+            f'db;dur={self.mongo_seconds * 1000:.1f};desc="{self.mongo_commands} mongo commands"',
+            f'serializer;dur={self.serializer_seconds * 1000:.1f}',
+        ])
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Add each finished command's duration to the current request's metrics"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.mongo_commands += 1
+            metrics.mongo_seconds += event.duration_micros / 1e6
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """Record connection checkout waits and pool occupancy in the metrics registry"""
+
+    def __init__(self, metrics_registry):
+        self._registry = metrics_registry
+        # A thread checks out one connection at a time, from start to finish
+        self._local = threading.local()
+
+    def pool_created(self, event):
+        self._registry.adjust_pool_gauge('pools', event.address, 1)
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self._registry.adjust_pool_gauge('pools', event.address, -1)
+
+    def connection_created(self, event):
+        self._registry.adjust_pool_gauge('connections', event.address, 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._registry.adjust_pool_gauge('connections', event.address, -1)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._finish_checkout(event.address, event.reason)
+
+    def connection_checked_out(self, event):
+        self._registry.adjust_pool_gauge('checked_out', event.address, 1)
+        self._finish_checkout(event.address, 'ok')
+
+    def connection_checked_in(self, event):
+        self._registry.adjust_pool_gauge('checked_out', event.address, -1)
+
+    def _finish_checkout(self, address, outcome):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        if started is not None:
+            self._registry.observe_checkout(address, outcome, time.perf_counter() - started)
+
+
+@contextmanager
+def measure_serializer():
+    """Attribute the time spent in the block to the current request's serializer time"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_seconds += time.perf_counter() - started
+
+
+class Histogram:
+    """Cumulative Prometheus histogram for one label set"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def _address(address):
+    host, port = address
+    return f'{host}:{port}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Process-local request metrics keyed by view and method"""
+
+    # name -> (help text, buckets); the sampled ones only see sampled requests
+    HISTOGRAMS = {
+        'octofit_request_duration_seconds': ('Request wall time', DURATION_BUCKETS),
+        'octofit_request_mongo_seconds': ('Time spent in MongoDB commands (sampled requests)', DURATION_BUCKETS),
+        'octofit_request_mongo_commands': ('MongoDB commands per request (sampled requests)', COMMAND_COUNT_BUCKETS),
+        'octofit_request_serializer_seconds': ('Time spent serializing responses (sampled requests)', DURATION_BUCKETS),
+        'octofit_mongo_pool_checkout_seconds': ('Wait for a pooled MongoDB connection', CHECKOUT_WAIT_BUCKETS),
+    }
+    # gauge -> help text, labelled by server address
+    POOL_GAUGES = {
+        'pools': 'Connection pools, one per client',
+        'connections': 'Open pooled connections',
+        'checked_out': 'Pooled connections in use',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in self.HISTOGRAMS}
+        self._requests = {}
+        self._checkouts = {}
+        self._pool_gauges = {name: {} for name in self.POOL_GAUGES}
+
+    def _observe(self, name, labels, value):
+        histogram = self._histograms[name].get(labels)
+        if histogram is None:
+            histogram = self._histograms[name][labels] = Histogram(self.HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+    def observe_request(self, view, method, status, seconds, metrics=None):
+        labels = (('view', view), ('method', method))
+        with self._lock:
+            counter_labels = labels + (('status', str(status)),)
+            self._requests[counter_labels] = self._requests.get(counter_labels, 0) + 1
+            self._observe('octofit_request_duration_seconds', labels, seconds)
+            if metrics is not None:
+                self._observe('octofit_request_mongo_seconds', labels, metrics.mongo_seconds)
+                self._observe('octofit_request_mongo_commands', labels, metrics.mongo_commands)
+                self._observe('octofit_request_serializer_seconds', labels, metrics.serializer_seconds)
+
+    def observe_checkout(self, address, outcome, seconds):
+        labels = (('address', _address(address)),)
+        with self._lock:
+            counter_labels = labels + (('outcome', outcome),)
+            self._checkouts[counter_labels] = self._checkouts.get(counter_labels, 0) + 1
+            self._observe('octofit_mongo_pool_checkout_seconds', labels, seconds)
+
+    def adjust_pool_gauge(self, name, address, delta):
+        address = _address(address)
+        with self._lock:
+            gauge = self._pool_gauges[name]
+            gauge[address] = gauge.get(address, 0) + delta
+
+    def render(self, sample_rate):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = [
+            '# HELP octofit_requests_total Requests handled',
+            '# TYPE octofit_requests_total counter',
+        ]
+        with self._lock:
+            for labels, value in sorted(self._requests.items()):
+                lines.append(f'octofit_requests_total{{{_labels(labels)}}} {value}')
+            for name, (help_text, buckets) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    label_text = _labels(labels)
+                    for bound, bucket_count in zip(buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label_text},le="{_format_number(bound)}"}} {bucket_count}')
+                    lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label_text}}} {_format_number(histogram.sum)}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+            lines.append('# HELP octofit_mongo_pool_checkouts_total Connection checkouts by outcome')
+            lines.append('# TYPE octofit_mongo_pool_checkouts_total counter')
+            for labels, value in sorted(self._checkouts.items()):
+                lines.append(f'octofit_mongo_pool_checkouts_total{{{_labels(labels)}}} {value}')
+            for gauge, help_text in self.POOL_GAUGES.items():
+                name = f'octofit_mongo_pool_{gauge}'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} gauge')
+                for address, value in sorted(self._pool_gauges[gauge].items()):
+                    lines.append(f'{name}{{address="{address}"}} {value}')
+        lines.append('# HELP octofit_request_metrics_sample_rate Fraction of requests with a detailed breakdown')
+        lines.append('# TYPE octofit_request_metrics_sample_rate gauge')
+        lines.append(f'octofit_request_metrics_sample_rate {_format_number(float(sample_rate))}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# Listeners only attach to clients created after registration, so this runs
+# from AppConfig.ready() before djongo opens its connection
+monitoring.register(MongoCommandTimer())
+monitoring.register(MongoPoolMonitor(registry))
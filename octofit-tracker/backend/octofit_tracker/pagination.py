@@ -0,0 +1,41 @@
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the ObjectId, which only ever grows, so every page
+    is a range scan from the cursor and new inserts never shift earlier pages
+    """
+    ordering = '_id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ActivityCursorPagination(IdCursorPagination):
+    """Newest activities first, with _id breaking ties between equal dates"""
+    ordering = ('-date', '-_id')
+
+
+class LeaderboardCursorPagination(IdCursorPagination):
+    """Leaderboard entries in rank order, with _id breaking ties"""
+    ordering = ('rank', '_id')
+
+
+class WindowCursorPagination(IdCursorPagination):
+    """Window buckets by calories, with _id breaking ties"""
+    ordering = ('-total_calories', '_id')
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    ?ordering= for cursor-paginated views, with _id appended so rows that tie
+    on the requested field keep one order across pages
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or ())
+        if ordering and ordering[-1].lstrip('-') != '_id':
+            ordering.append('-_id' if ordering[0].startswith('-') else '_id')
+        return ordering
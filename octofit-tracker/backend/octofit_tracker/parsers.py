@@ -0,0 +1,55 @@
+import json
+
+import msgpack
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON into a list, one item per non-blank line
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for line_number, line in enumerate(stream, start=1):
+            try:
+                # UnicodeDecodeError is a ValueError too
+                line = line.decode(encoding).strip()
+                if not line:
+                    continue
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {line_number} - {exc}')
+        return items
+
+
+def from_columns(data):
+    """Rebuild rows from the ``{'fields', 'columns'}`` form written by MessagePackRenderer"""
+    if not isinstance(data, dict) or set(data) != {'fields', 'columns'}:
+        return data
+    fields, columns = data['fields'], data['columns']
+    if not isinstance(fields, list) or not isinstance(columns, list) or len(fields) != len(columns):
+        raise ParseError('Columnar payload needs one column per field')
+    if len({len(column) for column in columns}) > 1:
+        raise ParseError('Columnar payload columns differ in length')
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack, accepting lists as rows or in the renderer's columnar form
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            # timestamp=3 decodes the Timestamp extension to aware datetimes
+            data = msgpack.unpackb(stream.read(), raw=False, timestamp=3)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
+        return from_columns(data)
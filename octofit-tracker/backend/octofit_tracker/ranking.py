@@ -0,0 +1,128 @@
+"""
+Process-local ranked index over the leaderboard collection.
+
+Entries are kept in a sorted list keyed by ``(-total_calories, user_id)`` so
+top-k, rank-of-user and neighbourhood queries are O(log n) without touching
+MongoDB. The index is warmed from the ``leaderboard`` collection, refreshed
+from ``leaderboard_changed`` notifications sent by this process, and re-warmed
+after ``LEADERBOARD_INDEX_TTL`` seconds to pick up writes made by other workers.
+Entries keep the stored user and team names, so serializing them needs no
+name lookups; renames reach the index through ``leaderboard_changed``.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.dispatch import receiver
+from sortedcontainers import SortedList
+
+from .models import Leaderboard
+from .mongo import get_collection
+from .signals import leaderboard_changed
+
+ENTRY_FIELDS = ('_id', 'user_id', 'team_id', 'total_calories', 'total_activities', 'user_name', 'team_name')
+
+
+class LeaderboardIndex:
+    """Sorted in-memory view of leaderboard entries"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._order = SortedList()
+        self._warmed_at = None
+
+    @staticmethod
+    def _key(doc):
+        return (-doc['total_calories'], doc['user_id'])
+
+    def _load(self, query):
+        projection = {field: 1 for field in ENTRY_FIELDS}
+        # The index outlives the request, so it never loads from a lagging replica
+        return list(get_collection(Leaderboard, using='default').find(query, projection))
+
+    def warm(self):
+        """Load every leaderboard entry from MongoDB"""
+        docs = self._load({})
+        with self._lock:
+            self._entries = {doc['user_id']: doc for doc in docs}
+            self._order = SortedList(self._key(doc) for doc in docs)
+            self._warmed_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the index so the next query re-warms it"""
+        with self._lock:
+            self._warmed_at = None
+
+    def refresh(self, user_ids):
+        """Reload the entries for ``user_ids`` from MongoDB"""
+        if self._warmed_at is None:
+            return
+        docs = self._load({'user_id': {'$in': list(user_ids)}})
+        with self._lock:
+            for doc in docs:
+                previous = self._entries.get(doc['user_id'])
+                if previous is not None:
+                    self._order.remove(self._key(previous))
+                self._entries[doc['user_id']] = doc
+                self._order.add(self._key(doc))
+
+    def _ensure_warm(self):
+        warmed_at = self._warmed_at
+        if warmed_at is None or (self.ttl is not None and time.monotonic() - warmed_at > self.ttl):
+            self.warm()
+
+    def _entry_at(self, position):
+        """Build an unsaved Leaderboard instance for the entry at a sorted position"""
+        total, user_id = self._order[position]
+        doc = self._entries[user_id]
+        rank = self._order.bisect_left((total,)) + 1
+        return Leaderboard(rank=rank, **{field: doc.get(field) for field in ENTRY_FIELDS})
+
+    def __len__(self):
+        self._ensure_warm()
+        return len(self._order)
+
+    def top(self, count):
+        """Return the ``count`` highest ranked entries"""
+        self._ensure_warm()
+        with self._lock:
+            return [self._entry_at(position) for position in range(min(count, len(self._order)))]
+
+    def position_of(self, user_id):
+        """Return the zero-based sorted position of a user, or None if absent"""
+        self._ensure_warm()
+        with self._lock:
+            doc = self._entries.get(user_id)
+            if doc is None:
+                return None
+            return self._order.index(self._key(doc))
+
+    def entry(self, user_id):
+        """Return a user's entry with its current rank, or None if absent"""
+        with self._lock:
+            position = self.position_of(user_id)
+            return None if position is None else self._entry_at(position)
+
+    def around(self, user_id, radius):
+        """Return up to ``radius`` entries either side of a user, or None if absent"""
+        with self._lock:
+            position = self.position_of(user_id)
+            if position is None:
+                return None
+            start = max(position - radius, 0)
+            stop = min(position + radius + 1, len(self._order))
+            return [self._entry_at(index) for index in range(start, stop)]
+
+
+leaderboard_index = LeaderboardIndex(ttl=getattr(settings, 'LEADERBOARD_INDEX_TTL', None))
+
+
+@receiver(leaderboard_changed)
+def refresh_leaderboard_index(sender, user_ids=None, **kwargs):
+    """Keep the index coherent with leaderboard writes made in this process"""
+    if user_ids is None:
+        leaderboard_index.invalidate()
+    else:
+        leaderboard_index.refresh(user_ids)
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows encoded per yielded chunk when streaming
+STREAM_CHUNK_ROWS = 500
+
+
+def _as_rows(data):
+    if data is None:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+def to_columns(rows):
+    """
+    Turn a list of rows sharing the same fields into ``{'fields', 'columns'}``.
+
+    Returns ``rows`` unchanged when it is empty or the rows differ in fields.
+    """
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        return rows
+    fields = tuple(rows[0])
+    if any(tuple(row) != fields for row in rows):
+        return rows
+    # msgpack packs the zipped tuples as arrays
+    return {'fields': list(fields), 'columns': list(zip(*(row.values() for row in rows)))}
+
+
+def columnar(data):
+    """Encode a list response, or a page's ``results``, column by column"""
+    if isinstance(data, list):
+        return to_columns(data)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': to_columns(data['results'])}
+    return data
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders a list as newline-delimited JSON, one object per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(_as_rows(data)))
+
+    def stream(self, rows, fields=None):
+        """Yield encoded chunks for an iterable of row dicts"""
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(row, cls=JSONEncoder))
+            if len(lines) >= STREAM_CHUNK_ROWS:
+                yield ('\n'.join(lines) + '\n').encode(self.charset)
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders a list of flat objects as CSV with a header row
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = _as_rows(data)
+        fields = list(rows[0]) if rows else []
+        return b''.join(self.stream(rows, fields))
+
+    def stream(self, rows, fields):
+        """Yield encoded chunks for an iterable of row dicts, columns in ``fields`` order"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if count % STREAM_CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode(self.charset)
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack, sending lists of objects one array per field.
+
+    A list of rows with the same fields, whether the whole response or a
+    page's ``results``, becomes ``{'fields': [...], 'columns': [[...], ...]}``
+    so field names are not repeated on every row. Everything else maps to
+    MessagePack as it would to JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(columnar(data), default=JSONEncoder().default, use_bin_type=True)
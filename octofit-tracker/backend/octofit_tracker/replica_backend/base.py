@@ -0,0 +1,28 @@
+"""
+djongo backend for the read replica alias.
+
+djongo caches one MongoClient per database name, so two aliases on the same
+database would share a client and whichever connected first would decide
+its read preference. This backend gives the alias a client of its own, so
+its host, read preference and staleness bound apply only to it, and
+closing one alias leaves the other's client open.
+"""
+from collections import OrderedDict
+
+from djongo import base
+from pymongo import MongoClient
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """djongo connection with a MongoClient that is not shared with other aliases"""
+
+    def get_new_connection(self, connection_params):
+        name = connection_params.pop('name')
+        enforce_schema = connection_params.pop('enforce_schema')
+        connection_params['document_class'] = OrderedDict
+        if self.client_connection is not None:
+            self.client_connection.close()
+        self.client_connection = MongoClient(**connection_params, connect=False)
+        database = self.client_connection[name]
+        self.djongo_connection = base.DjongoClient(database, enforce_schema)
+        return database
@@ -0,0 +1,49 @@
+"""
+Database routing between the primary and the read replica connection.
+
+The ``replica`` alias is a second djongo connection to the same database
+whose client reads with ``secondaryPreferred`` and a bounded staleness.
+Reads go there only while ``replica_reads`` is set, which
+``ReplicaReadMixin`` does for safe viewset actions; everything else,
+including writes, management commands and signal handlers, uses
+``default``. The flag is a context variable, so it follows the request
+and does not leak between threads.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+
+replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def read_alias():
+    """The database alias reads use in the current context"""
+    return settings.READ_REPLICA_ALIAS if settings.READ_REPLICA_ENABLED and replica_reads.get() else 'default'
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, e.g. for data that is about to be cached"""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """Send reads to the replica alias while ``replica_reads`` is set"""
+
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -1,18 +1,195 @@
+from bson import ObjectId
+from django.db import models
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from rest_framework.permissions import SAFE_METHODS
+from .models import (
+    User, Team, Activity, Leaderboard, LeaderboardBucket, TeamLeaderboard, Workout,
+    estimate_distance, estimate_workout_calories
+)
+from .mongo import get_collection
+from .monitoring import measure_serializer
 
 
-class UserSerializer(serializers.ModelSerializer):
+def resolve_names(model, ids):
+    """Map id strings to names for a model with a single $in query"""
+    object_ids = {ObjectId(value) for value in ids if value and ObjectId.is_valid(value)}
+    if not object_ids:
+        return {}
+    return {str(obj._id): obj.name for obj in model.objects.filter(_id__in=list(object_ids))}
+
+
+def count_team_members(team_ids):
+    """Map team id strings to member counts with a single $group aggregation"""
+    team_ids = [str(team_id) for team_id in team_ids if team_id]
+    if not team_ids:
+        return {}
+    pipeline = [
+        {'$match': {'team_id': {'$in': team_ids}}},
+        {'$group': {'_id': '$team_id', 'count': {'$sum': 1}}},
+    ]
+    return {row['_id']: row['count'] for row in get_collection(User).aggregate(pipeline)}
+
+
+class TimedDataMixin:
+    """Record the time spent building ``.data`` as the request's serializer time"""
+
+    @property
+    def data(self):
+        with measure_serializer():
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """List serializer whose rendering time is recorded in the request metrics"""
+
+
+class PrefetchListSerializer(TimedListSerializer):
+    """
+    List serializer that lets the child load per-page lookups before rendering rows
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        instances = list(iterable)
+        self.child.prefetch(instances)
+        return super().to_representation(instances)
+
+
+class BulkListSerializer(PrefetchListSerializer):
+    """
+    List serializer that validates a batch in one pass and keeps the valid items
+    """
+
+    def validate_items(self):
+        """Return ``(validated, errors)`` lists aligned with the submitted items"""
+        if not isinstance(self.initial_data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of items.']})
+        validated, errors = [], []
+        for item in self.initial_data:
+            try:
+                validated.append(self.child.run_validation(item))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                validated.append(None)
+                errors.append(exc.detail)
+        return validated, errors
+
+
+class SparseFieldsMixin:
+    """
+    Honour ``?fields=a,b`` and ``?view=summary`` on read requests.
+
+    Unrequested fields are dropped when the serializer is built, so their
+    SerializerMethodFields and per-page lookups never run. ``Meta.summary_fields``
+    is the compact representation, and ``Meta.field_sources`` names the model
+    attributes each method field reads so views can project the query.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self._requested_fields()
+        self._sparse = selected is not None
+        if self._sparse:
+            unknown = selected - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}.'})
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+    def _requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        view = params.get('view')
+        if view is not None and view != 'summary':
+            raise serializers.ValidationError({'view': 'Must be "summary".'})
+        if params.get('fields'):
+            return {name.strip() for name in params['fields'].split(',') if name.strip()}
+        if view:
+            return set(self.Meta.summary_fields)
+        return None
+
+    def projection(self):
+        """Model attributes the kept fields read, or None when every field is kept"""
+        if not self._sparse:
+            return None
+        model_fields = {field.name for field in self.Meta.model._meta.concrete_fields}
+        sources = getattr(self.Meta, 'field_sources', {})
+        names = {self.Meta.model._meta.pk.name}
+        for name, field in self.fields.items():
+            for source in sources.get(name, (field.source,)):
+                root = source.split('.')[0]
+                if root in model_fields:
+                    names.add(root)
+        return names
+
+
+class RelatedNameMixin:
+    """
+    Resolve user/team display names from lookup maps instead of one query per row.
+
+    ``related_names`` maps a serializer field to the model it names and the
+    attribute holding that model's id on each row. Rows that store a copy of
+    the name under the field's own name (see display_names) use it and are
+    not looked up. Callers that have already resolved the names (the async
+    views) pass them as ``context['name_maps']``.
+    """
+    related_names = {}
+    _name_maps = None
+
+    @classmethod
+    def unresolved_ids(cls, field_name, instances):
+        """Related ids of the rows without a stored copy of ``field_name``"""
+        id_attr = cls.related_names[field_name][1]
+        return {getattr(obj, id_attr) for obj in instances if getattr(obj, field_name, None) is None}
+
+    def _build_name_maps(self, instances, field_names=None):
+        return {
+            field_name: resolve_names(model, self.unresolved_ids(field_name, instances))
+            for field_name, (model, _) in self.related_names.items()
+            if field_name in self.fields and (field_names is None or field_name in field_names)
+        }
+
+    def prefetch(self, instances):
+        """Resolve names for every row on the page, one query per collection"""
+        if 'name_maps' in self.context:
+            self._name_maps = self.context['name_maps']
+        else:
+            self._name_maps = self._build_name_maps(instances)
+
+    def lookup_related_name(self, field_name, obj, default):
+        """Return the stored or prefetched name for ``obj``, resolving it on demand for single objects"""
+        stored = getattr(obj, field_name, None)
+        if stored is not None:
+            return stored or default
+        maps = self._name_maps
+        if maps is None:
+            # A single object only needs the map for the field being rendered
+            maps = self.context['name_maps'] if 'name_maps' in self.context else self._build_name_maps([obj], [field_name])
+        related_id = getattr(obj, self.related_names[field_name][1])
+        if not related_id:
+            return default
+        return maps[field_name].get(str(related_id), default)
+
+
+class UserSerializer(TimedDataMixin, SparseFieldsMixin, RelatedNameMixin, serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     username = serializers.CharField(source='name')
     team_name = serializers.SerializerMethodField()
     fitness_level = serializers.SerializerMethodField()
     date_joined = serializers.SerializerMethodField()
     
+    related_names = {'team_name': (Team, 'team_id')}
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'name', 'email', 'password', 'team_id', 'team_name', 'fitness_level', 'date_joined']
+        summary_fields = ['id', 'name', 'team_name']
+        field_sources = {'team_name': ('team_id',), 'fitness_level': (), 'date_joined': ()}
         extra_kwargs = {'password': {'write_only': True}}
+        list_serializer_class = PrefetchListSerializer
     
     def get_id(self, obj):
         """Convert ObjectId to string"""
@@ -20,13 +197,7 @@ class UserSerializer(serializers.ModelSerializer):
     
     def get_team_name(self, obj):
         """Get team name from team_id"""
-        if obj.team_id:
-            try:
-                team = Team.objects.get(_id=obj.team_id)
-                return team.name
-            except Team.DoesNotExist:
-                return None
-        return None
+        return self.lookup_related_name('team_name', obj, None)
     
     def get_fitness_level(self, obj):
         """Default fitness level"""
@@ -38,14 +209,24 @@ class UserSerializer(serializers.ModelSerializer):
         return datetime.now().isoformat()
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     member_count = serializers.SerializerMethodField()
     created_at = serializers.SerializerMethodField()
     
+    _member_counts = None
+    
     class Meta:
         model = Team
         fields = ['id', 'name', 'description', 'member_count', 'created_at']
+        summary_fields = ['id', 'name', 'member_count']
+        field_sources = {'member_count': (), 'created_at': ()}
+        list_serializer_class = PrefetchListSerializer
+    
+    def prefetch(self, instances):
+        """Count members for every team on the page with one aggregation"""
+        if 'member_count' in self.fields:
+            self._member_counts = count_team_members(self.get_id(obj) for obj in instances)
     
     def get_id(self, obj):
         """Convert ObjectId to string"""
@@ -53,10 +234,11 @@ class TeamSerializer(serializers.ModelSerializer):
     
     def get_member_count(self, obj):
         """Count team members"""
-        team_id = str(obj._id) if hasattr(obj, '_id') and obj._id else None
-        if team_id:
-            return User.objects.filter(team_id=team_id).count()
-        return 0
+        team_id = self.get_id(obj)
+        if not team_id:
+            return 0
+        counts = self._member_counts if self._member_counts is not None else count_team_members([team_id])
+        return counts.get(team_id, 0)
     
     def get_created_at(self, obj):
         """Default created date"""
@@ -64,16 +246,26 @@ class TeamSerializer(serializers.ModelSerializer):
         return datetime.now().isoformat()
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(TimedDataMixin, SparseFieldsMixin, RelatedNameMixin, serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     user_name = serializers.SerializerMethodField()
-    calories = serializers.IntegerField(source='calories_burned')
-    created_at = serializers.DateTimeField(source='date')
+    team_name = serializers.SerializerMethodField()
+    calories = serializers.IntegerField(source='calories_burned', required=False)
+    created_at = serializers.DateTimeField(source='date', required=False)
     distance = serializers.SerializerMethodField()
     
+    related_names = {'user_name': (User, 'user_id')}
+    
     class Meta:
         model = Activity
-        fields = ['id', 'user_id', 'user_name', 'activity_type', 'duration', 'distance', 'calories', 'calories_burned', 'date', 'created_at']
+        fields = ['id', 'user_id', 'user_name', 'team_name', 'activity_type', 'duration', 'distance', 'calories', 'calories_burned', 'date', 'created_at']
+        summary_fields = ['id', 'user_id', 'activity_type', 'duration', 'calories_burned', 'date']
+        field_sources = {
+            'user_name': ('user_id', 'user_name'),
+            'team_name': ('team_name',),
+            'distance': ('distance_km', 'activity_type', 'duration'),
+        }
+        list_serializer_class = BulkListSerializer
     
     def get_id(self, obj):
         """Convert ObjectId to string"""
@@ -81,37 +273,37 @@ class ActivitySerializer(serializers.ModelSerializer):
     
     def get_user_name(self, obj):
         """Get user name from user_id"""
-        if obj.user_id:
-            try:
-                user = User.objects.get(_id=obj.user_id)
-                return user.name
-            except User.DoesNotExist:
-                return "Unknown"
-        return "Unknown"
+        return self.lookup_related_name('user_name', obj, "Unknown")
+    
+    def get_team_name(self, obj):
+        """Get the stored team name, None for rows written without one"""
+        return obj.team_name or None
     
     def get_distance(self, obj):
-        """Calculate approximate distance based on activity type and duration"""
-        # Simple approximation: running ~10km/h, cycling ~20km/h, walking ~5km/h
-        activity_speeds = {
-            'Running': 10,
-            'Cycling': 20,
-            'Walking': 5,
-            'Swimming': 2,
-        }
-        speed = activity_speeds.get(obj.activity_type, 5)
-        return round((obj.duration / 60) * speed, 2)
+        """Stored distance, estimated for rows written before it was stored"""
+        if obj.distance_km is not None:
+            return obj.distance_km
+        return estimate_distance(obj.activity_type, obj.duration)
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(TimedDataMixin, SparseFieldsMixin, RelatedNameMixin, serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     user_name = serializers.SerializerMethodField()
     team_name = serializers.SerializerMethodField()
     total_points = serializers.IntegerField(source='total_calories')
     activity_count = serializers.IntegerField(source='total_activities')
     
+    related_names = {
+        'user_name': (User, 'user_id'),
+        'team_name': (Team, 'team_id'),
+    }
+    
     class Meta:
         model = Leaderboard
         fields = ['id', 'user_id', 'team_id', 'user_name', 'team_name', 'total_points', 'total_calories', 'activity_count', 'total_activities', 'rank']
+        summary_fields = ['id', 'user_id', 'user_name', 'total_calories', 'rank']
+        field_sources = {'user_name': ('user_id', 'user_name'), 'team_name': ('team_id', 'team_name')}
+        list_serializer_class = PrefetchListSerializer
     
     def get_id(self, obj):
         """Convert ObjectId to string"""
@@ -119,26 +311,61 @@ class LeaderboardSerializer(serializers.ModelSerializer):
     
     def get_user_name(self, obj):
         """Get user name from user_id"""
-        if obj.user_id:
-            try:
-                user = User.objects.get(_id=obj.user_id)
-                return user.name
-            except User.DoesNotExist:
-                return "Unknown"
-        return "Unknown"
+        return self.lookup_related_name('user_name', obj, "Unknown")
     
     def get_team_name(self, obj):
         """Get team name from team_id"""
-        if obj.team_id:
-            try:
-                team = Team.objects.get(_id=obj.team_id)
-                return team.name
-            except Team.DoesNotExist:
-                return "No Team"
-        return "No Team"
+        return self.lookup_related_name('team_name', obj, "No Team")
+
+
+class LeaderboardBucketSerializer(TimedDataMixin, SparseFieldsMixin, RelatedNameMixin, serializers.ModelSerializer):
+    id = serializers.SerializerMethodField()
+    user_name = serializers.SerializerMethodField()
+    total_points = serializers.IntegerField(source='total_calories')
+    activity_count = serializers.IntegerField(source='total_activities')
+    rank = serializers.IntegerField(read_only=True)
+    
+    related_names = {'user_name': (User, 'user_id')}
+    
+    class Meta:
+        model = LeaderboardBucket
+        fields = ['id', 'user_id', 'user_name', 'granularity', 'period', 'total_points', 'total_calories', 'activity_count', 'total_activities', 'rank']
+        summary_fields = ['id', 'user_id', 'user_name', 'total_calories', 'rank']
+        field_sources = {'user_name': ('user_id',)}
+        list_serializer_class = PrefetchListSerializer
+    
+    def get_id(self, obj):
+        """Convert ObjectId to string"""
+        return str(obj._id) if hasattr(obj, '_id') and obj._id else None
+    
+    def get_user_name(self, obj):
+        """Get user name from user_id"""
+        return self.lookup_related_name('user_name', obj, "Unknown")
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class TeamLeaderboardSerializer(TimedDataMixin, SparseFieldsMixin, RelatedNameMixin, serializers.ModelSerializer):
+    id = serializers.SerializerMethodField()
+    team_name = serializers.SerializerMethodField()
+    
+    related_names = {'team_name': (Team, 'team_id')}
+    
+    class Meta:
+        model = TeamLeaderboard
+        fields = ['id', 'team_id', 'team_name', 'total_calories', 'total_activities', 'member_count', 'average_calories', 'rank']
+        summary_fields = ['id', 'team_id', 'team_name', 'total_calories', 'rank']
+        field_sources = {'team_name': ('team_id',)}
+        list_serializer_class = PrefetchListSerializer
+    
+    def get_id(self, obj):
+        """Convert ObjectId to string"""
+        return str(obj._id) if hasattr(obj, '_id') and obj._id else None
+    
+    def get_team_name(self, obj):
+        """Get team name from team_id"""
+        return self.lookup_related_name('team_name', obj, "Unknown")
+
+
+class WorkoutSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     difficulty_level = serializers.CharField(source='difficulty')
     workout_type = serializers.CharField(source='category')
@@ -147,6 +374,9 @@ class WorkoutSerializer(serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['id', 'name', 'description', 'difficulty', 'difficulty_level', 'duration', 'category', 'workout_type', 'calories_burned']
+        summary_fields = ['id', 'name', 'difficulty', 'duration', 'category']
+        field_sources = {'calories_burned': ('difficulty', 'duration')}
+        list_serializer_class = TimedListSerializer
     
     def get_id(self, obj):
         """Convert ObjectId to string"""
@@ -154,10 +384,7 @@ class WorkoutSerializer(serializers.ModelSerializer):
     
     def get_calories_burned(self, obj):
         """Estimate calories burned based on duration and difficulty"""
-        base_calories = {
-            'Beginner': 5,
-            'Intermediate': 8,
-            'Advanced': 12
-        }
-        rate = base_calories.get(obj.difficulty, 8)
-        return obj.duration * rate
+        precomputed = getattr(obj, 'calories_estimate', None)
+        if precomputed is not None:
+            return precomputed
+        return estimate_workout_calories(obj.difficulty, obj.duration)
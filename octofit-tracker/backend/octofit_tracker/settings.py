@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,17 +93,73 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# MongoDB client options, passed to pymongo's MongoClient by djongo and reused
+# by the async views' Motor clients. Size pools per worker from the
+# octofit_mongo_pool_* metrics on /api/_metrics.
+MONGO_CLIENT = {
+    'host': os.environ.get('MONGO_HOST', 'localhost'),
+    'port': int(os.environ.get('MONGO_PORT', 27017)),
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000)),
+    'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 20000)),
+}
+# Optional limits; unset keeps the driver default of no limit
+for option, variable in (
+    ('maxIdleTimeMS', 'MONGO_MAX_IDLE_TIME_MS'),
+    ('waitQueueTimeoutMS', 'MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+    ('socketTimeoutMS', 'MONGO_SOCKET_TIMEOUT_MS'),
+):
+    if os.environ.get(variable):
+        MONGO_CLIENT[option] = int(os.environ[variable])
+# Wire compression in order of preference, e.g. 'zstd,zlib'; zstd needs the
+# zstandard package and the server must support the compressor
+if os.environ.get('MONGO_COMPRESSORS'):
+    MONGO_CLIENT['compressors'] = os.environ['MONGO_COMPRESSORS']
+    MONGO_CLIENT['zlibCompressionLevel'] = int(os.environ.get('MONGO_ZLIB_COMPRESSION_LEVEL', -1))
+
+# Read preference of the GET-only read paths (async views, stats, exports),
+# e.g. 'secondaryPreferred' to serve them from replicas; writes and reads
+# that follow writes always use the primary
+MONGO_READ_ONLY_READ_PREFERENCE = os.environ.get('MONGO_READ_ONLY_READ_PREFERENCE', 'primary')
+
+# Safe viewset actions can read through a second connection that prefers
+# secondaries, see routers.py. Off by default; turn it on against a replica
+# set, e.g. a single-node one locally (mongod --replSet rs0, rs.initiate(),
+# MONGO_REPLICA_SET=rs0), where secondaryPreferred falls back to the primary.
+if os.environ.get('MONGO_REPLICA_SET'):
+    MONGO_CLIENT['replicaSet'] = os.environ['MONGO_REPLICA_SET']
+READ_REPLICA_ALIAS = 'replica'
+READ_REPLICA_ENABLED = os.environ.get('READ_REPLICA_ENABLED', '').lower() in ('1', 'true', 'yes')
+# Secondaries further behind the primary than this are not read; MongoDB's minimum is 90
+READ_REPLICA_MAX_STALENESS_SECONDS = int(os.environ.get('READ_REPLICA_MAX_STALENESS_SECONDS', 90))
+# After a write, the client's session reads from the primary for this long;
+# clients without a session send the X-Read-Your-Writes header instead
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', READ_REPLICA_MAX_STALENESS_SECONDS))
+
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
+        'CLIENT': MONGO_CLIENT,
+    },
+    READ_REPLICA_ALIAS: {
+        # djongo shares one client per database name; this backend keeps a separate one
+        'ENGINE': 'octofit_tracker.replica_backend',
+        'NAME': 'octofit_db',
+        'ENFORCE_SCHEMA': False,
         'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
-        }
-    }
+            **MONGO_CLIENT,
+            'host': os.environ.get('MONGO_REPLICA_HOST', MONGO_CLIENT['host']),
+            'readPreference': 'secondaryPreferred',
+            'maxStalenessSeconds': READ_REPLICA_MAX_STALENESS_SECONDS,
+        },
+        # Tests read and write the same test database through both aliases
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['octofit_tracker.routers.ReadReplicaRouter']
 
 
 # Password validation
@@ -145,6 +203,88 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
+    # MessagePack is negotiated with Accept: application/msgpack or ?format=msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'octofit_tracker.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'octofit_tracker.parsers.MessagePackParser',
+    ],
+}
+
+# Caches
+# The 'api' cache holds rendered responses for read-heavy endpoints. 'locmem'
+# is a per-process LRU; use 'file' when several worker processes must see
+# each other's invalidations.
+API_CACHE_ALIAS = 'api'
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'locmem')
+API_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'octofit-api',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('API_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'octofit-api-cache')),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: {
+        **API_CACHE_BACKENDS[API_CACHE_BACKEND],
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+# Connection pool size of each Motor client used by the async views
+ASYNC_MONGO_MAX_POOL_SIZE = int(os.environ.get('ASYNC_MONGO_MAX_POOL_SIZE', 100))
+
+# Largest batch accepted by POST /api/activities/bulk/
+ACTIVITY_BULK_MAX_ITEMS = int(os.environ.get('ACTIVITY_BULK_MAX_ITEMS', 5000))
+
+# In-memory leaderboard index: seconds before re-warming from MongoDB so
+# writes made by other worker processes become visible
+LEADERBOARD_INDEX_TTL = int(os.environ.get('LEADERBOARD_INDEX_TTL', 30))
+
+# In-memory workout catalog: seconds before reloading from MongoDB
+WORKOUT_CATALOG_TTL = int(os.environ.get('WORKOUT_CATALOG_TTL', 60))
+
+# Request metrics: fraction of requests that get the full breakdown
+# (Mongo commands, serializer time, Server-Timing header and a log line)
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0.05))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'octofit_tracker.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after leaderboard totals change. ``user_ids`` lists the users whose
+# entries changed, or is None when the whole leaderboard was rebuilt.
+leaderboard_changed = Signal()
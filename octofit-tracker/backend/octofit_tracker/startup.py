@@ -0,0 +1,20 @@
+"""
+Work done once when a server process starts, after Django is set up.
+"""
+import logging
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+def warm_caches():
+    """Load in-memory indexes so the first requests do not pay for it"""
+    from .catalog import workout_catalog
+    from .ranking import leaderboard_index
+
+    for name, warm in (('leaderboard index', leaderboard_index.warm), ('workout catalog', workout_catalog.build)):
+        try:
+            warm()
+        except PyMongoError:
+            logger.exception('Could not warm the %s; it will load on first use', name)
@@ -0,0 +1,96 @@
+"""
+Activity statistics computed inside MongoDB with aggregation pipelines.
+"""
+from .models import Activity, ACTIVITY_SPEEDS_KMH, DEFAULT_SPEED_KMH
+from .mongo import get_collection
+
+# $dateToString formats for each supported bucket size (week is ISO 8601)
+BUCKET_FORMATS = {
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+    'month': '%Y-%m',
+}
+
+TOTAL_FIELDS = ('count', 'duration', 'calories', 'distance')
+
+
+def distance_expression():
+    """Aggregation expression matching ActivitySerializer.get_distance: stored or estimated"""
+    speed = {
+        '$switch': {
+            'branches': [
+                {'case': {'$eq': ['$activity_type', activity_type]}, 'then': kmh}
+                for activity_type, kmh in ACTIVITY_SPEEDS_KMH.items()
+            ],
+            'default': DEFAULT_SPEED_KMH,
+        }
+    }
+    estimate = {'$round': [{'$multiply': [{'$divide': ['$duration', 60]}, speed]}, 2]}
+    return {'$ifNull': ['$distance_km', estimate]}
+
+
+def _empty_totals():
+    return {field: 0 for field in TOTAL_FIELDS}
+
+
+def _add_totals(target, row):
+    for field in TOTAL_FIELDS:
+        target[field] += row[field]
+
+
+def activity_stats_pipeline(user_id, start=None, end=None, bucket='day'):
+    """Aggregation pipeline grouping a user's activities by bucket and type"""
+    match = {'user_id': user_id}
+    date_range = {}
+    if start is not None:
+        date_range['$gte'] = start
+    if end is not None:
+        date_range['$lt'] = end
+    if date_range:
+        match['date'] = date_range
+
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': {
+                'period': {'$dateToString': {'format': BUCKET_FORMATS[bucket], 'date': '$date'}},
+                'activity_type': '$activity_type',
+            },
+            'count': {'$sum': 1},
+            'duration': {'$sum': '$duration'},
+            'calories': {'$sum': '$calories_burned'},
+            'distance': {'$sum': distance_expression()},
+        }},
+        {'$sort': {'_id.period': 1, '_id.activity_type': 1}},
+    ]
+
+
+def summarise_stats(rows):
+    """Fold aggregation rows into overall totals and per-bucket entries"""
+    totals = _empty_totals()
+    buckets = {}
+    for row in rows:
+        period = row['_id']['period']
+        entry = buckets.setdefault(period, {'period': period, **_empty_totals(), 'by_type': {}})
+        type_totals = {field: row[field] for field in TOTAL_FIELDS}
+        type_totals['distance'] = round(type_totals['distance'], 2)
+        entry['by_type'][row['_id']['activity_type']] = type_totals
+        _add_totals(entry, type_totals)
+        _add_totals(totals, type_totals)
+
+    # Summing rounded per-activity distances can leave float noise behind
+    totals['distance'] = round(totals['distance'], 2)
+    for entry in buckets.values():
+        entry['distance'] = round(entry['distance'], 2)
+    return {'totals': totals, 'buckets': list(buckets.values())}
+
+
+def user_activity_stats(user_id, start=None, end=None, bucket='day'):
+    """
+    Summarise a user's activities per time bucket and activity type.
+
+    ``start`` is inclusive and ``end`` exclusive; either may be None. Returns
+    overall totals plus one entry per bucket with a per-type breakdown.
+    """
+    pipeline = activity_stats_pipeline(user_id, start, end, bucket)
+    return summarise_stats(get_collection(Activity, read_only=True).aggregate(pipeline))
@@ -1,8 +1,27 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import msgpack
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from .models import User, Team, Activity, Leaderboard, Workout
+from .middleware import RequestMetricsMiddleware
+from .models import User, Team, Activity, Leaderboard, LeaderboardBucket, Workout
+from .caching import get_api_cache
+from .catalog import workout_catalog
+from .mongo import get_collection, get_database
+from .ranking import leaderboard_index
+from .serializers import ActivitySerializer, LeaderboardSerializer
 from datetime import datetime
 
 
@@ -181,6 +200,25 @@ class ActivityAPITest(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def test_create_activity_with_aliases(self):
+        """Test the calories and created_at aliases are still accepted on write"""
+        now = datetime.now().isoformat()
+        data = {
+            'user_id': 'user123',
+            'activity_type': 'Cycling',
+            'duration': 45,
+            'calories': 300,
+            'calories_burned': 300,
+            'created_at': now,
+            'date': now
+        }
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['calories'], 300)
+        invalid = self.client.post(reverse('activity-list'), dict(data, calories='lots'), format='json')
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('calories', invalid.data)
 
 
 class WorkoutAPITest(APITestCase):
@@ -204,3 +242,1261 @@ class WorkoutAPITest(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class RelatedNameQueryCountTest(APITestCase):
+    """List endpoints resolve user/team names with a fixed number of queries"""
+    
+    def setUp(self):
+        self.rows = 0
+    
+    def _add_rows(self, count):
+        # One user and team per row: leaderboard entries are unique per user
+        for i in range(self.rows, self.rows + count):
+            team = Team.objects.create(name=f'Query Team {i}', description='Counts queries')
+            user = User.objects.create(
+                name=f'Query User {i}',
+                email=f'query{i}@example.com',
+                password='password123',
+                team_id=str(team._id)
+            )
+            Activity.objects.create(
+                user_id=str(user._id),
+                activity_type='Running',
+                duration=30,
+                calories_burned=200,
+                date=datetime.now()
+            )
+            Leaderboard.objects.create(
+                user_id=str(user._id),
+                team_id=str(team._id),
+                total_calories=1000 - 100 * i,
+                total_activities=1,
+                rank=i + 1
+            )
+        self.rows += count
+    
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+    
+    def test_activity_list_query_count_is_constant(self):
+        """Test activity list queries do not grow with the number of rows"""
+        self._add_rows(2)
+        small, _ = self._count_queries(reverse('activity-list'))
+        self._add_rows(8)
+        large, response = self._count_queries(reverse('activity-list'))
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['results'][0]['user_name'], 'Query User 9')
+    
+    def test_leaderboard_list_query_count_is_constant(self):
+        """Test leaderboard list queries do not grow with the number of rows"""
+        self._add_rows(2)
+        small, _ = self._count_queries(reverse('leaderboard-list'))
+        self._add_rows(8)
+        large, response = self._count_queries(reverse('leaderboard-list'))
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['results'][0]['team_name'], 'Query Team 0')
+    
+    def test_single_object_resolves_each_name_once(self):
+        """Test a detail looks up the user and team names with one query each"""
+        self._add_rows(1)
+        entry = Leaderboard.objects.get()
+        with self.assertNumQueries(2):
+            data = LeaderboardSerializer(entry).data
+        self.assertEqual((data['user_name'], data['team_name']), ('Query User 0', 'Query Team 0'))
+
+
+class TeamMemberCountTest(APITestCase):
+    """Team and user lists share per-page lookups instead of per-row queries"""
+    
+    def setUp(self):
+        self.team = Team.objects.create(name='Count Team', description='Has members')
+        self.empty_team = Team.objects.create(name='Empty Team', description='No members')
+        for i in range(3):
+            User.objects.create(
+                name=f'Member {i}',
+                email=f'member{i}@example.com',
+                password='password123',
+                team_id=str(self.team._id)
+            )
+    
+    def test_team_list_member_counts(self):
+        """Test member counts come from the grouped aggregation"""
+        response = self.client.get(reverse('team-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts = {team['name']: team['member_count'] for team in response.data['results']}
+        self.assertEqual(counts, {'Count Team': 3, 'Empty Team': 0})
+    
+    def test_user_list_query_count_is_constant(self):
+        """Test user list team names do not add a query per user"""
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('user-list'))
+        User.objects.create(
+            name='Late Member',
+            email='late@example.com',
+            password='password123',
+            team_id=str(self.team._id)
+        )
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('user-list'))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(response.data['results'][0]['team_name'], 'Count Team')
+
+
+class LeaderboardMaintenanceTest(APITestCase):
+    """Activity writes keep leaderboard totals and ranks current"""
+    
+    def setUp(self):
+        self.team = Team.objects.create(name='Rank Team', description='Climbs the board')
+        self.users = [
+            User.objects.create(
+                name=f'Ranker {i}',
+                email=f'ranker{i}@example.com',
+                password='password123',
+                team_id=str(self.team._id)
+            )
+            for i in range(3)
+        ]
+    
+    def _log(self, user, calories):
+        response = self.client.post(reverse('activity-list'), {
+            'user_id': str(user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories_burned': calories,
+            'date': datetime.now().isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+    
+    def _entry(self, user):
+        return Leaderboard.objects.get(user_id=str(user._id))
+    
+    def test_create_updates_totals_and_ranks(self):
+        """Test creating activities increments totals and re-ranks"""
+        self._log(self.users[0], 100)
+        self._log(self.users[1], 300)
+        self._log(self.users[0], 250)
+        first = self._entry(self.users[0])
+        self.assertEqual(first.total_calories, 350)
+        self.assertEqual(first.total_activities, 2)
+        self.assertEqual(first.team_id, str(self.team._id))
+        self.assertEqual(first.rank, 1)
+        self.assertEqual(self._entry(self.users[1]).rank, 2)
+    
+    def test_ties_share_a_rank(self):
+        """Test users with equal totals share the same rank"""
+        self._log(self.users[0], 200)
+        self._log(self.users[1], 200)
+        self._log(self.users[2], 100)
+        ranks = [self._entry(user).rank for user in self.users]
+        self.assertEqual(ranks, [1, 1, 3])
+    
+    def test_delete_removes_activity_from_totals(self):
+        """Test deleting an activity decrements totals and re-ranks"""
+        activity_id = self._log(self.users[0], 500)
+        self._log(self.users[1], 200)
+        response = self.client.delete(reverse('activity-detail', args=[activity_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        first = self._entry(self.users[0])
+        self.assertEqual(first.total_calories, 0)
+        self.assertEqual(first.total_activities, 0)
+        self.assertEqual(first.rank, 2)
+        self.assertEqual(self._entry(self.users[1]).rank, 1)
+    
+    def test_moves_keep_competition_ranks(self):
+        """Test entries passed up and down, and ties left behind, shift by one"""
+        self._log(self.users[0], 300)
+        tied = self._log(self.users[1], 200)
+        self._log(self.users[2], 200)
+        passing = self._log(self.users[2], 150)
+        self.assertEqual([self._entry(user).rank for user in self.users], [2, 3, 1])
+        self.client.delete(reverse('activity-detail', args=[passing]))
+        self.assertEqual([self._entry(user).rank for user in self.users], [1, 2, 2])
+        self.client.delete(reverse('activity-detail', args=[tied]))
+        self.assertEqual([self._entry(user).rank for user in self.users], [1, 3, 2])
+
+
+class LeaderboardIndexAPITest(APITestCase):
+    """Rank queries are answered from the in-memory leaderboard index"""
+    
+    def setUp(self):
+        for i, calories in enumerate([500, 900, 700, 700, 100]):
+            Leaderboard.objects.create(
+                user_id=f'user{i}',
+                team_id='team1',
+                total_calories=calories,
+                total_activities=i + 1,
+                rank=0
+            )
+        leaderboard_index.invalidate()
+    
+    def test_top_performers_order(self):
+        """Test top performers come back in rank order"""
+        response = self.client.get(reverse('leaderboard-top-performers'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['user_id'] for row in response.data][:2], ['user1', 'user2'])
+        self.assertEqual([row['rank'] for row in response.data], [1, 2, 2, 4, 5])
+    
+    def test_stored_names_served_from_index(self):
+        """Test index entries carry the stored names, so no name lookups run"""
+        user = User.objects.create(name='Indexed User', email='indexed@example.com', password='password123', team_id='')
+        Leaderboard.objects.create(
+            user_id=str(user._id), team_id='', total_calories=1000, total_activities=1, rank=0,
+            user_name='Indexed User', team_name=''
+        )
+        leaderboard_index.warm()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('leaderboard-top-performers'))
+        self.assertEqual(response.data[0]['user_name'], 'Indexed User')
+    
+    def test_rank_of_user(self):
+        """Test rank lookup for a single user"""
+        response = self.client.get(reverse('leaderboard-rank'), {'user_id': 'user0'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rank'], 4)
+    
+    def test_around_user(self):
+        """Test neighbourhood lookup around a user"""
+        response = self.client.get(reverse('leaderboard-around'), {'user_id': 'user0', 'radius': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['user_id'] for row in response.data], ['user3', 'user0', 'user4'])
+    
+    def test_unknown_user(self):
+        """Test lookups for users without an entry return 404"""
+        response = self.client.get(reverse('leaderboard-rank'), {'user_id': 'missing'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_user_id_required(self):
+        """Test lookups without user_id are rejected"""
+        response = self.client.get(reverse('leaderboard-around'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CursorPaginationTest(APITestCase):
+    """List endpoints page with stable cursors"""
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            name='Pager',
+            email='pager@example.com',
+            password='password123'
+        )
+        for day in range(5):
+            self._add_activity(day)
+    
+    def _add_activity(self, day):
+        return Activity.objects.create(
+            user_id=str(self.user._id),
+            activity_type='Walking',
+            duration=20,
+            calories_burned=100,
+            date=datetime(2024, 1, 1 + day)
+        )
+    
+    def _collect(self, url):
+        ids = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            if not ids:
+                # A newer activity inserted mid-walk must not shift later pages
+                self._add_activity(10)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+    
+    def test_activity_pages_are_newest_first_without_duplicates(self):
+        """Test following cursors visits every activity once in date order"""
+        ids = self._collect(reverse('activity-list'))
+        self.assertEqual(len(ids), len(set(ids)))
+        expected = [str(a._id) for a in Activity.objects.filter(date__lt=datetime(2024, 1, 6)).order_by('-date')]
+        self.assertEqual(ids, expected)
+    
+    def test_user_activities_action_is_paginated(self):
+        """Test the per-user activities action returns a cursor page"""
+        url = reverse('user-activities', args=[str(self.user._id)])
+        response = self.client.get(url, {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+
+class EnsureIndexesCommandTest(TestCase):
+    """ensure_indexes creates the declared indexes idempotently"""
+    
+    def test_creates_declared_indexes(self):
+        """Test every declared index exists after running the command twice"""
+        for _ in range(2):
+            output, errors = StringIO(), StringIO()
+            call_command('ensure_indexes', stdout=output, stderr=errors)
+            self.assertEqual(errors.getvalue(), '')
+            self.assertIn('covers:', output.getvalue())
+            self.assertIn('All indexes are in place.', output.getvalue())
+        user_indexes = get_collection(User).index_information()
+        self.assertEqual([name for name, info in user_indexes.items() if info['key'] == [('email', 1)]], ['email_1'])
+        self.assertTrue(user_indexes['email_1']['unique'])
+        self.assertIn('activity_user_date_idx', get_collection(Activity).index_information())
+        self.assertIn('workout_filter_idx', get_collection(Workout).index_information())
+        self.assertIn('user_team_idx', get_collection(User).index_information())
+        leaderboard_indexes = get_collection(Leaderboard).index_information()
+        self.assertIn('leaderboard_rank_idx', leaderboard_indexes)
+        self.assertTrue(leaderboard_indexes['leaderboard_user_unique']['unique'])
+    
+    def test_replaces_index_with_mangled_keys(self):
+        """Test a declared name left on other keys is rebuilt with the declared keys"""
+        activities = get_collection(Activity)
+        if 'activity_date_idx' in activities.index_information():
+            activities.drop_index('activity_date_idx')
+        activities.create_index([('date" DESC', 1)], name='activity_date_idx')
+        errors = StringIO()
+        call_command('ensure_indexes', stdout=StringIO(), stderr=errors)
+        self.assertEqual(errors.getvalue(), '')
+        self.assertEqual(activities.index_information()['activity_date_idx']['key'], [('date', 1), ('_id', 1)])
+        buckets = get_collection(LeaderboardBucket).index_information()
+        self.assertEqual(
+            buckets['bucket_ranking_idx']['key'],
+            [('granularity', 1), ('period', 1), ('total_calories', -1), ('_id', 1)]
+        )
+
+
+class ActivityBulkAPITest(APITestCase):
+    """Bulk ingestion validates in one pass and reports per-item results"""
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            name='Wearable User',
+            email='wearable@example.com',
+            password='password123'
+        )
+        self.url = reverse('activity-bulk')
+    
+    def _item(self, calories, **overrides):
+        item = {
+            'user_id': str(self.user._id),
+            'activity_type': 'Cycling',
+            'duration': 40,
+            'calories_burned': calories,
+            'date': datetime.now().isoformat()
+        }
+        item.update(overrides)
+        return item
+    
+    def test_json_array_with_invalid_item(self):
+        """Test valid items are written and invalid ones reported"""
+        items = [self._item(100), self._item(200, duration='long'), self._item(300)]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'invalid', 'created'])
+        self.assertIn('duration', response.data['results'][1]['errors'])
+        self.assertEqual(Activity.objects.filter(user_id=str(self.user._id)).count(), 2)
+        entry = Leaderboard.objects.get(user_id=str(self.user._id))
+        self.assertEqual(entry.total_calories, 400)
+        self.assertEqual(entry.total_activities, 2)
+    
+    def test_ndjson_body(self):
+        """Test NDJSON uploads are accepted"""
+        body = '\n'.join(json.dumps(self._item(calories)) for calories in (50, 60, 70))
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user._id)).total_calories, 180)
+    
+    def test_ndjson_invalid_utf8(self):
+        """Test an undecodable NDJSON line is a 400 naming the line"""
+        body = json.dumps(self._item(50)).encode() + b'\n\xff\xfe\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line 2', response.data['detail'])
+    
+    def test_rejects_non_list_body(self):
+        """Test a single object is not accepted as a batch"""
+        response = self.client.post(self.url, self._item(100), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PopulateDbCommandTest(TestCase):
+    """populate_db seeds repeatable datasets with bulk writes"""
+    
+    def test_generated_dataset(self):
+        """Test sizes, totals and ranks of a generated dataset"""
+        call_command('populate_db', users=14, activities_per_user=3, seed=7, chunk_size=5, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 14)
+        self.assertEqual(Team.objects.count(), 2)
+        self.assertEqual(Activity.objects.count(), 42)
+        self.assertEqual(Workout.objects.count(), 8)
+        entries = list(Leaderboard.objects.all().order_by('rank'))
+        self.assertEqual(len(entries), 14)
+        self.assertEqual(entries[0].rank, 1)
+        totals = [entry.total_calories for entry in entries]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        first_user_activities = Activity.objects.filter(user_id=entries[0].user_id)
+        self.assertEqual(entries[0].total_calories, sum(a.calories_burned for a in first_user_activities))
+    
+    def test_invalidates_caches(self):
+        """Test cached team/workout responses and the workout catalog are dropped"""
+        Workout.objects.create(name='Old Workout', description='Gone after seeding', difficulty='Easy', duration=10, category='Cardio')
+        self.assertEqual(len(workout_catalog.search()[0]), 1)
+        for url in (reverse('team-list'), reverse('workout-list')):
+            self.client.get(url)
+        call_command('populate_db', users=4, activities_per_user=1, seed=7, stdout=StringIO())
+        self.assertEqual(len(self.client.get(reverse('team-list')).data['results']), 2)
+        self.assertEqual(self.client.get(reverse('workout-list')).data['count'], 8)
+        self.assertNotIn('Old Workout', [workout.name for workout in workout_catalog.search()[0]])
+
+
+class ImportActivitiesCommandTest(TestCase):
+    """import_activities loads activity files in chunks and updates the leaderboard"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'activities.csv')
+        with open(self.path, 'w') as handle:
+            handle.write('user_id,activity_type,duration,calories_burned,date\n')
+            for i in range(9):
+                handle.write(f'import-{i % 3},Running,30,{100 + i},2024-01-0{i + 1}T08:00:00\n')
+            handle.write('import-0,Running,not-a-number,50,2024-01-10T08:00:00\n')
+    
+    def test_import_csv(self):
+        """Test valid rows are inserted, bad rows rejected and totals recomputed"""
+        errors = StringIO()
+        call_command('import_activities', self.path, chunk_size=4, stdout=StringIO(), stderr=errors)
+        self.assertEqual(Activity.objects.count(), 9)
+        self.assertIn('line 11: duration', errors.getvalue())
+        entry = Leaderboard.objects.get(user_id='import-0')
+        self.assertEqual(entry.total_calories, 100 + 103 + 106)
+        self.assertEqual(entry.total_activities, 3)
+        self.assertEqual(entry.rank, 3)
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+    
+    def test_resume_skips_imported_lines(self):
+        """Test --resume continues after the line stored in the checkpoint"""
+        with open(f'{self.path}.checkpoint', 'w') as handle:
+            json.dump({'file': os.path.abspath(self.path), 'line': 5, 'inserted': 4, 'rejected': 0, 'user_ids': []}, handle)
+        call_command('import_activities', self.path, resume=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Activity.objects.count(), 5)
+        self.assertEqual(sorted(a.calories_burned for a in Activity.objects.all()), [104, 105, 106, 107, 108])
+    
+    def test_resume_after_interrupted_chunk(self):
+        """Test a chunk inserted before the crash that skipped its checkpoint is not inserted twice"""
+        from octofit_tracker.management.commands.import_activities import Command
+        save_checkpoint = Command._save_checkpoint
+        saves = []
+        
+        def crash_after_first_chunk(command, path, state):
+            saves.append(state['line'])
+            if len(saves) == 2:
+                raise KeyboardInterrupt
+            save_checkpoint(command, path, state)
+        
+        with mock.patch.object(Command, '_save_checkpoint', crash_after_first_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('import_activities', self.path, chunk_size=4, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Activity.objects.count(), 4)
+        errors = StringIO()
+        call_command('import_activities', self.path, chunk_size=4, resume=True, stdout=StringIO(), stderr=errors)
+        self.assertEqual(Activity.objects.count(), 9)
+        self.assertNotIn('insert failed', errors.getvalue())
+        self.assertEqual(Leaderboard.objects.get(user_id='import-0').total_calories, 100 + 103 + 106)
+
+
+class UserStatsAPITest(APITestCase):
+    """Per-user activity statistics are aggregated in MongoDB"""
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            name='Stats User',
+            email='stats@example.com',
+            password='password123'
+        )
+        rows = [
+            ('Running', 60, 600, datetime(2024, 3, 1, 8)),
+            ('Running', 30, 300, datetime(2024, 3, 1, 18)),
+            ('Cycling', 90, 700, datetime(2024, 3, 2, 9)),
+            ('Yoga', 45, 150, datetime(2024, 4, 10, 7)),
+        ]
+        for activity_type, duration, calories, date in rows:
+            Activity.objects.create(
+                user_id=str(self.user._id),
+                activity_type=activity_type,
+                duration=duration,
+                calories_burned=calories,
+                date=date
+            )
+        self.url = reverse('user-stats', args=[str(self.user._id)])
+    
+    def test_daily_buckets_in_range(self):
+        """Test day buckets, per-type totals and distance estimates"""
+        response = self.client.get(self.url, {'from': '2024-03-01', 'to': '2024-03-31', 'bucket': 'day'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totals'], {'count': 3, 'duration': 180, 'calories': 1600, 'distance': 45.0})
+        self.assertEqual([bucket['period'] for bucket in response.data['buckets']], ['2024-03-01', '2024-03-02'])
+        first_day = response.data['buckets'][0]
+        self.assertEqual(first_day['by_type']['Running'], {'count': 2, 'duration': 90, 'calories': 900, 'distance': 15.0})
+    
+    def test_monthly_buckets(self):
+        """Test month buckets cover every activity without a range"""
+        response = self.client.get(self.url, {'bucket': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([bucket['period'] for bucket in response.data['buckets']], ['2024-03', '2024-04'])
+        self.assertEqual(response.data['totals']['count'], 4)
+    
+    def test_invalid_bucket(self):
+        """Test unknown bucket sizes are rejected"""
+        response = self.client.get(self.url, {'bucket': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResponseCacheTest(APITestCase):
+    """Read-heavy endpoints are cached until a write bumps their namespace"""
+    
+    def setUp(self):
+        get_api_cache().clear()
+        self.workout = Workout.objects.create(
+            name='Cached Workout',
+            description='Served from cache',
+            difficulty='Beginner',
+            duration=20,
+            category='Yoga'
+        )
+        self.url = reverse('workout-list')
+    
+    def test_second_read_is_a_hit(self):
+        """Test repeated reads are served from the cache"""
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+    
+    def test_if_none_match_returns_not_modified(self):
+        """Test a matching ETag gets a 304"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_write_invalidates(self):
+        """Test creating through the viewset invalidates cached lists"""
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(self.url, {
+            'name': 'New Workout',
+            'description': 'Busts the cache',
+            'difficulty': 'Advanced',
+            'duration': 30,
+            'category': 'HIIT',
+            'difficulty_level': 'Advanced',
+            'workout_type': 'HIIT'
+        }, format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class WorkoutCatalogAPITest(APITestCase):
+    """Workout lists are served from the in-memory catalog"""
+    
+    def setUp(self):
+        get_api_cache().clear()
+        workout_catalog.invalidate()
+        for name, difficulty, duration, category in [
+            ('Easy Flow', 'Beginner', 30, 'Yoga'),
+            ('Hard Sprint', 'Advanced', 20, 'Running'),
+            ('Long Ride', 'Intermediate', 90, 'Cycling'),
+            ('Power Yoga', 'Advanced', 60, 'Yoga'),
+        ]:
+            Workout.objects.create(
+                name=name,
+                description=name,
+                difficulty=difficulty,
+                duration=duration,
+                category=category
+            )
+        self.url = reverse('workout-list')
+    
+    def test_multi_valued_facets_and_counts(self):
+        """Test facet filters accept several values and report counts"""
+        response = self.client.get(self.url, {'category': 'Yoga,Running'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['facets']['difficulty'], {'Advanced': 2, 'Beginner': 1})
+        self.assertEqual(response.data['facets']['category'], {'Cycling': 1, 'Running': 1, 'Yoga': 2})
+    
+    def test_range_filters_use_precomputed_calories(self):
+        """Test calories and duration range filters"""
+        response = self.client.get(self.url, {'calories__gte': 240, 'duration__lte': 60})
+        names = [workout['name'] for workout in response.data['results']]
+        self.assertEqual(names, ['Hard Sprint', 'Power Yoga'])
+        self.assertEqual(response.data['results'][1]['calories_burned'], 720)
+    
+    def test_list_does_not_query_database(self):
+        """Test warm catalog reads make no database queries"""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'difficulty': 'Advanced'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(context.captured_queries), 0)
+    
+    def test_invalid_range(self):
+        """Test non-numeric range bounds are rejected"""
+        response = self.client.get(self.url, {'duration__lte': 'long'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityExportAPITest(APITestCase):
+    """Activity exports stream NDJSON or CSV"""
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            name='Export User',
+            email='export@example.com',
+            password='password123'
+        )
+        for day in range(1, 6):
+            Activity.objects.create(
+                user_id=str(self.user._id),
+                activity_type='Cycling',
+                duration=60,
+                calories_burned=day * 100,
+                date=datetime(2024, 5, day, 12)
+            )
+        self.url = reverse('activity-export')
+    
+    def _body(self, response):
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return content.decode()
+    
+    def test_ndjson_export_with_date_range(self):
+        """Test NDJSON rows are filtered by an inclusive date range"""
+        response = self.client.get(self.url, {'format': 'ndjson', 'from': '2024-05-02', 'to': '2024-05-03'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in self._body(response).splitlines()]
+        self.assertEqual([row['calories_burned'] for row in rows], [200, 300])
+        self.assertEqual(rows[0]['user_name'], 'Export User')
+        self.assertEqual(rows[0]['distance'], 20.0)
+    
+    def test_gzipped_csv_export(self):
+        """Test CSV export with gzip transfer encoding"""
+        response = self.client.get(
+            self.url,
+            {'format': 'csv', 'user_id': str(self.user._id)},
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = self._body(response).splitlines()
+        self.assertEqual(lines[0].split(','), ['id', 'user_id', 'user_name', 'activity_type', 'duration', 'distance', 'calories_burned', 'date'])
+        self.assertEqual(len(lines), 6)
+
+
+class AsyncReadPathTest(APITestCase):
+    """Async read endpoints return the same data as their sync counterparts"""
+    
+    def setUp(self):
+        get_api_cache().clear()
+        team = Team.objects.create(name='Async Team', description='Async')
+        self.users = [
+            User.objects.create(name=f'Async {i}', email=f'async{i}@example.com', password='password123', team_id=str(team._id))
+            for i in range(3)
+        ]
+        for i in range(7):
+            Activity.objects.create(
+                user_id=str(self.users[i % 3]._id),
+                activity_type='Running',
+                duration=30,
+                calories_burned=100 + i,
+                date=datetime(2024, 5, 1 + i % 3, 8)
+            )
+        for rank, user in enumerate(self.users, start=1):
+            Leaderboard.objects.create(
+                user_id=str(user._id),
+                team_id=str(team._id),
+                total_calories=1000 - rank,
+                total_activities=rank,
+                rank=rank
+            )
+        leaderboard_index.invalidate()
+    
+    def test_activity_list_pages(self):
+        """Test keyset pages cover every activity in the sync order"""
+        expected = self.client.get(reverse('activity-list')).data['results']
+        url = reverse('async-activity-list') + '?page_size=3'
+        rows = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            rows += response.json()['results']
+            url = response.json()['next']
+        self.assertEqual([row['id'] for row in rows], [row['id'] for row in expected])
+        self.assertEqual(rows[0]['user_name'], expected[0]['user_name'])
+    
+    def test_leaderboard_matches_sync(self):
+        """Test the leaderboard list and top performers match the sync endpoints"""
+        sync_list = self.client.get(reverse('leaderboard-list')).data['results']
+        async_list = self.client.get(reverse('async-leaderboard-list')).json()['results']
+        self.assertEqual(async_list, json.loads(json.dumps(sync_list)))
+        sync_top = self.client.get(reverse('leaderboard-top-performers')).data
+        async_top = self.client.get(reverse('async-leaderboard-top-performers')).json()
+        self.assertEqual([row['user_id'] for row in async_top], [row['user_id'] for row in sync_top])
+        self.assertEqual(async_top[0]['team_name'], 'Async Team')
+    
+    def test_user_stats_matches_sync(self):
+        """Test async stats match the sync aggregation"""
+        user_id = str(self.users[0]._id)
+        sync_stats = self.client.get(reverse('user-stats', args=[user_id]), {'bucket': 'day'}).data
+        response = self.client.get(reverse('async-user-stats', args=[user_id]), {'bucket': 'day'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['totals'], sync_stats['totals'])
+        self.assertEqual(response.json()['buckets'], sync_stats['buckets'])
+    
+    def test_errors(self):
+        """Test unknown users, bad parameters and writes are rejected"""
+        user_id = str(self.users[0]._id)
+        self.assertEqual(self.client.get(reverse('async-user-stats', args=['0' * 24])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('async-user-stats', args=[user_id]), {'bucket': 'year'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('async-activity-list'), {'cursor': 'bogus'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(reverse('async-activity-list')).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class RequestMetricsTest(APITestCase):
+    """Requests are timed, and sampled ones get a Mongo/serializer breakdown"""
+    
+    def setUp(self):
+        User.objects.create(name='Metrics User', email='metrics@example.com', password='password123')
+    
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_breakdown(self):
+        """Test Server-Timing reports Mongo commands and serializer time"""
+        response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn('serializer;dur=', timing)
+        commands = int(timing.split('desc="')[1].split(' ')[0])
+        self.assertGreater(commands, 0)
+    
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_is_still_counted(self):
+        """Test unsampled requests skip the breakdown but land in the histograms"""
+        response = self.client.get(reverse('user-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        metrics = self.client.get(reverse('metrics'))
+        self.assertEqual(metrics.status_code, status.HTTP_200_OK)
+        self.assertTrue(metrics['Content-Type'].startswith('text/plain'))
+        body = metrics.content.decode()
+        self.assertIn('# TYPE octofit_request_duration_seconds histogram', body)
+        self.assertIn('octofit_request_duration_seconds_count{view="user-list",method="GET"}', body)
+        self.assertIn('octofit_request_metrics_sample_rate 0.0', body)
+    
+    def test_pool_checkout_metrics(self):
+        """Test connection checkouts and pool occupancy are exported"""
+        self.client.get(reverse('user-list'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE octofit_mongo_pool_checkout_seconds histogram', body)
+        self.assertIn('octofit_mongo_pool_checkouts_total{address="localhost:27017",outcome="ok"}', body)
+        self.assertIn('octofit_mongo_pool_checked_out{address="localhost:27017"}', body)
+    
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    def test_async_stack(self):
+        """Test the middleware runs natively in front of an async handler"""
+        async def get_response(request):
+            return HttpResponse('ok')
+        middleware = RequestMetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        with self.assertLogs('octofit_tracker.requests', level='INFO') as logs:
+            response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'unmatched')
+
+
+class TeamLeaderboardAPITest(APITestCase):
+    """Team standings are maintained incrementally in team_leaderboard"""
+    
+    def setUp(self):
+        self.alpha, self.beta = [
+            self.client.post(reverse('team-list'), {'name': name, 'description': name}, format='json').data['id']
+            for name in ('Alpha', 'Beta')
+        ]
+        self.users = [self._create_user(index, team_id) for index, team_id in enumerate([self.alpha, self.alpha, self.beta])]
+        for user_id, calories in zip(self.users, [300, 100, 500]):
+            self.client.post(reverse('activity-list'), {
+                'user_id': user_id,
+                'activity_type': 'Running',
+                'duration': 30,
+                'calories_burned': calories,
+                'date': datetime.now().isoformat()
+            }, format='json')
+    
+    def _create_user(self, index, team_id):
+        data = {
+            'username': f'Team User {index}',
+            'name': f'Team User {index}',
+            'email': f'teamuser{index}@example.com',
+            'password': 'password123',
+            'team_id': team_id
+        }
+        return self.client.post(reverse('user-list'), data, format='json').data['id']
+    
+    def _standings(self):
+        response = self.client.get(reverse('team-leaderboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {row['team_name']: row for row in response.data}
+    
+    def test_totals_and_ranks(self):
+        """Test team totals, member counts, averages and ranks"""
+        standings = self._standings()
+        self.assertEqual(standings['Alpha']['total_calories'], 400)
+        self.assertEqual(standings['Alpha']['member_count'], 2)
+        self.assertEqual(standings['Alpha']['average_calories'], 200)
+        self.assertEqual(standings['Alpha']['rank'], 2)
+        self.assertEqual(standings['Beta']['total_calories'], 500)
+        self.assertEqual(standings['Beta']['rank'], 1)
+    
+    def test_user_changes_team(self):
+        """Test a user's totals follow them to a new team"""
+        url = reverse('user-detail', args=[self.users[1]])
+        self.client.patch(url, {'team_id': self.beta}, format='json')
+        standings = self._standings()
+        self.assertEqual((standings['Alpha']['total_calories'], standings['Alpha']['member_count']), (300, 1))
+        self.assertEqual((standings['Beta']['total_calories'], standings['Beta']['member_count']), (600, 2))
+        self.assertEqual(standings['Beta']['average_calories'], 300)
+        self.assertEqual(Leaderboard.objects.get(user_id=self.users[1]).team_id, self.beta)
+    
+    def test_rebuild_matches_incremental(self):
+        """Test a full rebuild reproduces the incrementally maintained standings"""
+        self.client.delete(reverse('user-detail', args=[self.users[0]]))
+        incremental = self._standings()
+        self.assertEqual(incremental['Alpha']['total_calories'], 100)
+        call_command('rebuild_team_leaderboard', stdout=StringIO())
+        rebuilt = self._standings()
+        for name in ('Alpha', 'Beta'):
+            for field in ('total_calories', 'total_activities', 'member_count', 'average_calories', 'rank'):
+                self.assertEqual(rebuilt[name][field], incremental[name][field])
+
+
+class WindowedLeaderboardTest(APITestCase):
+    """Daily, weekly and monthly leaderboards are ranked from per-period buckets"""
+    
+    def setUp(self):
+        self.alice, self.bob = [
+            self.client.post(reverse('user-list'), {
+                'username': name,
+                'name': name,
+                'email': f'{name.lower()}@example.com',
+                'password': 'password123',
+                'team_id': ''
+            }, format='json').data['id']
+            for name in ('Alice', 'Bob')
+        ]
+        self.activities = [
+            self._log(user_id, calories, date)
+            for user_id, calories, date in [
+                (self.alice, 300, '2024-03-04T09:00:00'),
+                (self.alice, 200, '2024-03-05T09:00:00'),
+                (self.bob, 400, '2024-03-05T18:00:00'),
+                (self.bob, 1000, '2024-04-10T07:30:00'),
+            ]
+        ]
+    
+    def _log(self, user_id, calories, date):
+        return self.client.post(reverse('activity-list'), {
+            'user_id': user_id,
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories_burned': calories,
+            'date': date
+        }, format='json').data['id']
+    
+    def _window(self, window, at):
+        response = self.client.get(reverse('leaderboard-list'), {'window': window, 'at': at})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['period'], [(row['user_name'], row['total_calories'], row['rank']) for row in response.data['results']]
+    
+    def test_windows(self):
+        """Test each window totals and ranks only its period's activities"""
+        self.assertEqual(self._window('day', '2024-03-05'), ('2024-03-05', [('Bob', 400, 1), ('Alice', 200, 2)]))
+        self.assertEqual(self._window('week', '2024-03-10'), ('2024-W10', [('Alice', 500, 1), ('Bob', 400, 2)]))
+        self.assertEqual(self._window('month', '2024-04-01'), ('2024-04', [('Bob', 1000, 1)]))
+    
+    def test_invalid_window(self):
+        """Test an unknown window is rejected"""
+        response = self.client.get(reverse('leaderboard-list'), {'window': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_delete_and_move(self):
+        """Test deleting or re-dating an activity moves it out of its buckets"""
+        self.client.delete(reverse('activity-detail', args=[self.activities[1]]))
+        self.assertEqual(self._window('day', '2024-03-05')[1], [('Bob', 400, 1)])
+        self.client.patch(reverse('activity-detail', args=[self.activities[2]]), {'date': '2024-04-02T10:00:00'}, format='json')
+        self.assertEqual(self._window('day', '2024-03-05')[1], [])
+        self.assertEqual(self._window('month', '2024-03-01')[1], [('Alice', 300, 1)])
+        self.assertEqual(self._window('month', '2024-04-01')[1], [('Bob', 1400, 1)])
+    
+    def test_compaction(self):
+        """Test compaction drops old day buckets and month totals survive late writes"""
+        call_command('compact_leaderboard_buckets', stdout=StringIO())
+        self.assertEqual(self._window('day', '2024-03-05')[1], [])
+        self.assertEqual(self._window('month', '2024-03-01')[1], [('Alice', 500, 1), ('Bob', 400, 2)])
+        self._log(self.bob, 150, '2024-03-20T12:00:00')
+        call_command('compact_leaderboard_buckets', stdout=StringIO())
+        self.assertEqual(self._window('month', '2024-03-01')[1], [('Bob', 550, 1), ('Alice', 500, 2)])
+    
+    def test_edit_after_compaction(self):
+        """Test a calories-only edit in a compacted month leaves no partial day bucket"""
+        call_command('compact_leaderboard_buckets', stdout=StringIO())
+        self.client.patch(reverse('activity-detail', args=[self.activities[2]]), {'calories_burned': 700}, format='json')
+        self.assertEqual(self._window('day', '2024-03-05')[1], [])
+        self.assertEqual(self._window('month', '2024-03-01')[1], [('Bob', 700, 1), ('Alice', 500, 2)])
+    
+    def test_rebuild_matches_incremental(self):
+        """Test rebuilding from activities reproduces the incremental buckets"""
+        incremental = [self._window(window, '2024-03-05') for window in ('day', 'week', 'month')]
+        call_command('compact_leaderboard_buckets', rebuild=True, keep_days=100000, stdout=StringIO())
+        rebuilt = [self._window(window, '2024-03-05') for window in ('day', 'week', 'month')]
+        self.assertEqual(rebuilt, incremental)
+
+
+class DisplayNamesTest(APITestCase):
+    """User and team names are stored on activities and leaderboard entries"""
+    
+    def setUp(self):
+        self.team_id = self.client.post(reverse('team-list'), {'name': 'Stored Team', 'description': 'Names'}, format='json').data['id']
+        self.user_id = self.client.post(reverse('user-list'), {
+            'username': 'Stored User',
+            'name': 'Stored User',
+            'email': 'stored@example.com',
+            'password': 'password123',
+            'team_id': self.team_id
+        }, format='json').data['id']
+        self.client.post(reverse('activity-list'), {
+            'user_id': self.user_id,
+            'activity_type': 'Cycling',
+            'duration': 45,
+            'calories_burned': 350,
+            'date': datetime.now().isoformat()
+        }, format='json')
+    
+    def _stored(self, model):
+        doc = get_collection(model).find_one({'user_id': self.user_id})
+        return doc['user_name'], doc['team_name']
+    
+    def test_names_stored_on_write(self):
+        """Test new activities and leaderboard entries carry the names"""
+        self.assertEqual(self._stored(Activity), ('Stored User', 'Stored Team'))
+        self.assertEqual(self._stored(Leaderboard), ('Stored User', 'Stored Team'))
+        row = self.client.get(reverse('activity-list')).data['results'][0]
+        self.assertEqual((row['user_name'], row['team_name']), ('Stored User', 'Stored Team'))
+    
+    def test_renames_propagate(self):
+        """Test user and team renames rewrite the stored copies"""
+        self.client.patch(reverse('user-detail', args=[self.user_id]), {'name': 'Renamed User'}, format='json')
+        self.client.patch(reverse('team-detail', args=[self.team_id]), {'name': 'Renamed Team'}, format='json')
+        self.assertEqual(self._stored(Activity), ('Renamed User', 'Renamed Team'))
+        self.assertEqual(self._stored(Leaderboard), ('Renamed User', 'Renamed Team'))
+        row = self.client.get(reverse('leaderboard-list')).data['results'][0]
+        self.assertEqual((row['user_name'], row['team_name']), ('Renamed User', 'Renamed Team'))
+    
+    def test_team_deleted(self):
+        """Test deleting a team clears its name from members' rows"""
+        self.client.delete(reverse('team-detail', args=[self.team_id]))
+        self.assertEqual(self._stored(Leaderboard), ('Stored User', ''))
+        row = self.client.get(reverse('leaderboard-list')).data['results'][0]
+        self.assertEqual(row['team_name'], 'No Team')
+    
+    def test_check_and_repair_drift(self):
+        """Test the check command reports stale copies and --repair rewrites them"""
+        get_collection(User).update_one({'name': 'Stored User'}, {'$set': {'name': 'Drifted User'}})
+        get_collection(Activity).update_many({}, {'$unset': {'team_name': ''}})
+        self.assertEqual(self.client.get(reverse('activity-list')).data['results'][0]['user_name'], 'Stored User')
+        err = StringIO()
+        call_command('check_display_names', stdout=StringIO(), stderr=err)
+        self.assertIn('stale names', err.getvalue())
+        call_command('check_display_names', repair=True, stdout=StringIO())
+        self.assertEqual(self._stored(Activity), ('Drifted User', 'Stored Team'))
+        self.assertEqual(self._stored(Leaderboard), ('Drifted User', 'Stored Team'))
+        out = StringIO()
+        call_command('check_display_names', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+    
+    def test_repair_refreshes_leaderboard_reads(self):
+        """Test repaired names reach the ranked index and cached leaderboard responses"""
+        leaderboard_index.warm()
+        self.assertEqual(self.client.get(reverse('leaderboard-list')).data['results'][0]['user_name'], 'Stored User')
+        get_collection(User).update_one({'name': 'Stored User'}, {'$set': {'name': 'Drifted User'}})
+        call_command('check_display_names', repair=True, stdout=StringIO())
+        self.assertEqual(leaderboard_index.entry(self.user_id).user_name, 'Drifted User')
+        self.assertEqual(self.client.get(reverse('leaderboard-list')).data['results'][0]['user_name'], 'Drifted User')
+
+
+class SparseFieldsTest(APITestCase):
+    """List and detail endpoints honour ?fields= and ?view=summary"""
+    
+    def setUp(self):
+        self.user = User.objects.create(name='Sparse User', email='sparse@example.com', password='password123', team_id='')
+        for calories in (150, 250):
+            Activity.objects.create(
+                user_id=str(self.user._id),
+                activity_type='Running',
+                duration=30,
+                calories_burned=calories,
+                date=datetime.now()
+            )
+    
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        return response, len(context.captured_queries)
+    
+    def test_fields(self):
+        """Test only the requested fields are returned"""
+        response, _ = self._get(reverse('activity-list'), {'fields': 'id,calories'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({frozenset(row) for row in response.data['results']}, {frozenset(['id', 'calories'])})
+        response, _ = self._get(reverse('user-detail', args=[self.user._id]), {'fields': 'name'})
+        self.assertEqual(response.data, {'name': 'Sparse User'})
+    
+    def test_unrequested_lookups_skipped(self):
+        """Test method fields that need lookups only run when requested"""
+        _, full = self._get(reverse('activity-list'), {})
+        _, sparse = self._get(reverse('activity-list'), {'fields': 'id,activity_type'})
+        self.assertLess(sparse, full)
+    
+    def _add_rows(self, index):
+        team = Team.objects.create(name=f'Sparse Team {index}', description='More rows')
+        user = User.objects.create(name=f'Sparse {index}', email=f'sparse{index}@example.com', password='password123', team_id=str(team._id))
+        Activity.objects.create(user_id=str(user._id), activity_type='Cycling', duration=45, calories_burned=300, date=datetime.now())
+        Leaderboard.objects.create(user_id=str(user._id), team_id=str(team._id), total_calories=300, total_activities=1, rank=1)
+        Workout.objects.create(name=f'Sparse Workout {index}', description='More rows', difficulty='Beginner', duration=20, category='Cardio')
+    
+    def test_method_fields_query_count(self):
+        """Test each method field costs the same queries however many rows it renders"""
+        method_fields = {
+            'user-list': ['team_name', 'fitness_level', 'date_joined'],
+            'team-list': ['member_count', 'created_at'],
+            'activity-list': ['user_name', 'team_name', 'distance'],
+            'leaderboard-list': ['user_name', 'team_name'],
+            'workout-list': ['calories_burned'],
+        }
+        self._add_rows(0)
+        expected = {}
+        for url_name, fields in method_fields.items():
+            for field in fields:
+                get_api_cache().clear()
+                expected[url_name, field] = self._get(reverse(url_name), {'fields': f'id,{field}'})[1]
+        for index in range(1, 4):
+            self._add_rows(index)
+        for (url_name, field), count in expected.items():
+            get_api_cache().clear()
+            with self.subTest(url=url_name, field=field), self.assertNumQueries(count):
+                response = self.client.get(reverse(url_name), {'fields': f'id,{field}'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_summary_view(self):
+        """Test ?view=summary returns the compact representation"""
+        response, _ = self._get(reverse('activity-list'), {'view': 'summary'})
+        expected = set(ActivitySerializer.Meta.summary_fields)
+        self.assertEqual(set(response.data['results'][0]), expected)
+    
+    def test_invalid_selection(self):
+        """Test unknown fields and views are rejected"""
+        response, _ = self._get(reverse('activity-list'), {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response, _ = self._get(reverse('workout-list'), {'view': 'full'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MessagePackTest(APITestCase):
+    """MessagePack is negotiated by Accept header and lists are sent column by column"""
+    
+    def setUp(self):
+        self.user = User.objects.create(name='Packed User', email='packed@example.com', password='password123', team_id='')
+        for calories in (120, 340):
+            Activity.objects.create(
+                user_id=str(self.user._id),
+                activity_type='Swimming',
+                duration=40,
+                calories_burned=calories,
+                date=datetime.now()
+            )
+    
+    def test_list_is_columnar(self):
+        """Test a msgpack list page carries one array per field"""
+        response = self.client.get(reverse('activity-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        page = msgpack.unpackb(response.content)
+        results = page['results']
+        rows = [dict(zip(results['fields'], values)) for values in zip(*results['columns'])]
+        self.assertEqual(rows, json.loads(json.dumps(self.client.get(reverse('activity-list')).data['results'])))
+    
+    def test_detail(self):
+        """Test a single object is a plain map"""
+        response = self.client.get(reverse('user-detail', args=[self.user._id]), {'format': 'msgpack'})
+        self.assertEqual(msgpack.unpackb(response.content)['name'], 'Packed User')
+    
+    def test_bulk_columnar_body(self):
+        """Test bulk create accepts a columnar msgpack body"""
+        body = msgpack.packb({
+            'fields': ['user_id', 'activity_type', 'duration', 'calories_burned', 'date'],
+            'columns': [
+                [str(self.user._id)] * 2,
+                ['Running', 'Yoga'],
+                [30, 60],
+                [300, 180],
+                ['2024-05-01T08:00:00Z', '2024-05-02T08:00:00Z'],
+            ],
+        })
+        response = self.client.post(reverse('activity-bulk'), body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+    
+    def test_malformed_body(self):
+        """Test an undecodable body is a 400"""
+        response = self.client.post(reverse('activity-list'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityDerivedFieldsTest(APITestCase):
+    """Activities store a normalized type and their distance when written"""
+    
+    def setUp(self):
+        self.user = User.objects.create(name='Distance User', email='distance@example.com', password='password123', team_id='')
+    
+    def _create(self, activity_type, duration):
+        response = self.client.post(reverse('activity-list'), {
+            'user_id': str(self.user._id),
+            'activity_type': activity_type,
+            'duration': duration,
+            'calories_burned': 200,
+            'date': datetime.now().isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+    
+    def test_stored_on_write(self):
+        """Test aliases are normalized, unknown types kept and distance stored"""
+        created = self._create(' run', 60)
+        self.assertEqual((created['activity_type'], created['distance']), ('Running', 10.0))
+        doc = get_collection(Activity).find_one({'activity_type': 'Running'})
+        self.assertEqual(doc['distance_km'], 10.0)
+        self.assertEqual(self._create('Kayaking', 60)['activity_type'], 'Kayaking')
+        updated = self.client.patch(reverse('activity-detail', args=[created['id']]), {'duration': 30}, format='json')
+        self.assertEqual(updated.data['distance'], 5.0)
+    
+    def test_filter_and_order_by_distance(self):
+        """Test ?min_distance= and ?ordering= use the stored distance"""
+        for activity_type, duration in (('Walking', 30), ('Cycling', 90), ('Running', 60)):
+            self._create(activity_type, duration)
+        response = self.client.get(reverse('activity-list'), {'min_distance': 5, 'ordering': '-distance_km'})
+        self.assertEqual([row['distance'] for row in response.data['results']], [30.0, 10.0])
+        response = self.client.get(reverse('activity-list'), {'min_distance': 'far'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_backfill(self):
+        """Test the backfill command fills in documents written without the fields"""
+        get_collection(Activity).insert_many([
+            {'user_id': str(self.user._id), 'activity_type': 'cycling', 'duration': 30, 'calories_burned': 100, 'date': datetime.now()}
+            for _ in range(3)
+        ])
+        call_command('backfill_activity_fields', batch_size=2, stdout=StringIO())
+        docs = list(get_collection(Activity).find())
+        self.assertEqual({(doc['activity_type'], doc['distance_km']) for doc in docs}, {('Cycling', 10.0)})
+
+
+class RebuildLeaderboardCommandTest(TestCase):
+    """rebuild_leaderboard recomputes entries in a shadow collection and swaps it in"""
+    
+    def setUp(self):
+        self.team = Team.objects.create(name='Swap Team', description='Rebuilt nightly')
+        self.users = [
+            User.objects.create(name=f'Swapper {i}', email=f'swapper{i}@example.com', password='password123', team_id=str(self.team._id))
+            for i in range(3)
+        ]
+        get_collection(Activity).insert_many([
+            {'user_id': str(self.users[index]._id), 'activity_type': 'Running', 'duration': 30, 'calories_burned': calories, 'date': datetime.now()}
+            for index, calories in ((0, 200), (0, 100), (1, 300))
+        ])
+        # A stale entry for a user who no longer has activities
+        get_collection(Leaderboard).insert_one({'user_id': 'gone', 'team_id': '', 'total_calories': 999, 'total_activities': 9, 'rank': 1})
+    
+    def _assert_rebuilt(self, **options):
+        call_command('rebuild_leaderboard', stdout=StringIO(), **options)
+        entries = {
+            entry.user_id: (entry.total_calories, entry.total_activities, entry.rank, entry.user_name, entry.team_name)
+            for entry in Leaderboard.objects.all()
+        }
+        self.assertEqual(entries, {
+            str(self.users[0]._id): (300, 2, 1, 'Swapper 0', 'Swap Team'),
+            str(self.users[1]._id): (300, 1, 1, 'Swapper 1', 'Swap Team'),
+            str(self.users[2]._id): (0, 0, 3, 'Swapper 2', 'Swap Team'),
+        })
+        database = get_collection(Leaderboard).database
+        self.assertNotIn('leaderboard_rebuild', database.list_collection_names())
+        self.assertIn('leaderboard_user_unique', get_collection(Leaderboard).index_information())
+    
+    def test_window_ranking(self):
+        """Test the aggregation path totals, names and ranks every user"""
+        self._assert_rebuilt()
+    
+    def test_python_ranking(self):
+        """Test ranking in Python produces the same leaderboard"""
+        self._assert_rebuilt(in_python=True, chunk_size=2)
+
+
+@override_settings(READ_REPLICA_ENABLED=True)
+class ReplicaReadRoutingTest(APITestCase):
+    """Safe actions read through the replica alias; writes and read-your-writes stay on the primary"""
+    databases = {'default', 'replica'}
+    
+    def setUp(self):
+        self.user = User.objects.create(name='Replica User', email='replica@example.com', password='password123', team_id='')
+    
+    def _replica_queries(self, method, url, data=None, **extra):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url, data, format='json', **extra)
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+    
+    def _activity(self):
+        return {
+            'user_id': str(self.user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories_burned': 300,
+            'date': datetime.now().isoformat()
+        }
+    
+    def test_safe_actions_use_replica(self):
+        """Test list, retrieve and listed extra actions read from the replica"""
+        self.assertGreater(self._replica_queries('get', reverse('user-list')), 0)
+        self.assertGreater(self._replica_queries('get', reverse('user-activities', args=[self.user._id])), 0)
+        self.assertEqual(self._replica_queries('get', reverse('user-stats', args=[self.user._id])), 0)
+    
+    def test_aliases_have_separate_clients(self):
+        """Test the replica alias gets its own client and only it prefers secondaries"""
+        primary = get_database('default').client
+        replica = get_database('replica').client
+        self.assertIsNot(primary, replica)
+        self.assertEqual(primary.read_preference.mongos_mode, 'primary')
+        self.assertEqual(replica.read_preference.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(replica.read_preference.max_staleness, 90)
+    
+    def test_writes_use_primary(self):
+        """Test creating an activity never touches the replica"""
+        self.assertEqual(self._replica_queries('post', reverse('activity-list'), self._activity()), 0)
+    
+    def test_read_your_writes(self):
+        """Test the header, and a session that just wrote, keep reads on the primary"""
+        url = reverse('activity-list')
+        self.assertEqual(self._replica_queries('get', url, HTTP_X_READ_YOUR_WRITES='1'), 0)
+        self.client.session.save()
+        self.assertGreater(self._replica_queries('get', url), 0)
+        self._replica_queries('post', url, self._activity())
+        self.assertEqual(self._replica_queries('get', url), 0)
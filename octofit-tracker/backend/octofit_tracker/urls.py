@@ -20,7 +20,9 @@ from rest_framework import routers
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from . import async_views
 from .views import (
+    metrics,
     UserViewSet,
     TeamViewSet,
     ActivityViewSet,
@@ -62,5 +64,10 @@ def api_root(request, format=None):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api-root'),
+    path('api/_metrics', metrics, name='metrics'),
+    path('api/async/activities/', async_views.activity_list, name='async-activity-list'),
+    path('api/async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard-list'),
+    path('api/async/leaderboard/top_performers/', async_views.leaderboard_top_performers, name='async-leaderboard-top-performers'),
+    path('api/async/users/<str:pk>/stats/', async_views.user_stats, name='async-user-stats'),
     path('api/', include(router.urls)),
 ]
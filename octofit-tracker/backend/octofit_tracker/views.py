@@ -1,22 +1,158 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from pymongo.errors import BulkWriteError
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
-from .models import User, Team, Activity, Leaderboard, Workout
+from . import display_names, leaderboard, windows
+from .caching import CachedResponseMixin
+from .catalog import FACET_FIELDS, RANGE_FILTERS, workout_catalog
+from .exports import EXPORT_FIELDS, gzip_stream, iter_activity_rows
+from .models import User, Team, Activity, Leaderboard, LeaderboardBucket, TeamLeaderboard, Workout
+from .monitoring import registry
+from .mongo import get_collection, to_document
+from .pagination import (
+    ActivityCursorPagination, LeaderboardCursorPagination, StableOrderingFilter, WindowCursorPagination
+)
+from .parsers import MessagePackParser, NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .routers import replica_reads
+from .stats import BUCKET_FORMATS, user_activity_stats
+from .ranking import leaderboard_index
 from .serializers import (
     UserSerializer,
     TeamSerializer,
     ActivitySerializer,
     LeaderboardSerializer,
+    LeaderboardBucketSerializer,
+    TeamLeaderboardSerializer,
     WorkoutSerializer
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def parse_date_param(params, name, end_of_range=False):
+    """
+    Parse an ISO date or datetime query parameter into a naive UTC datetime.
+    
+    A bare date used as the end of a range covers the whole day.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is not None:
+        return datetime.combine(day + timedelta(days=1) if end_of_range else day, time.min)
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+    if timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed, dt_timezone.utc)
+    return parsed
+
+
+def metrics(request):
+    """Per-view request histograms for this process in the Prometheus text format"""
+    return HttpResponse(
+        registry.render(settings.REQUEST_METRICS_SAMPLE_RATE),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class SparseFieldsViewMixin:
+    """
+    Load only the columns a ``?fields=`` or ``?view=summary`` read needs.
+    
+    The serializer works out which model attributes its kept fields read;
+    the pagination ordering fields are added so cursors need no extra loads.
+    Extra actions serialize other models, so only list and retrieve project.
+    """
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        projection = self.get_serializer().projection()
+        if projection is None:
+            return queryset
+        ordering = self.paginator.get_ordering(self.request, queryset, self) if self.paginator else ()
+        return queryset.only(*projection, *(name.lstrip('-') for name in ordering))
+
+
+# Clients without a session send this header to read their own writes
+READ_YOUR_WRITES_HEADER = 'X-Read-Your-Writes'
+READ_YOUR_WRITES_SESSION_KEY = 'primary_reads_until'
+
+
+class ReplicaReadMixin:
+    """
+    Read safe actions through the replica connection, see routers.py.
+    
+    ``replica_actions`` lists the actions that tolerate replication lag.
+    Requests with the X-Read-Your-Writes header stay on the primary, as do
+    sessions for READ_YOUR_WRITES_SECONDS after they last wrote.
+    """
+    replica_actions = ('list', 'retrieve')
+    
+    def reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS or self.action not in self.replica_actions:
+            return False
+        if request.headers.get(READ_YOUR_WRITES_HEADER):
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key:
+            return session.get(READ_YOUR_WRITES_SESSION_KEY, 0) < timezone.now().timestamp()
+        return True
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_token = replica_reads.set(self.reads_from_replica(request))
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            replica_reads.reset(token)
+            self._replica_token = None
+        session = getattr(request, 'session', None)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and session is not None and session.session_key:
+            session[READ_YOUR_WRITES_SESSION_KEY] = timezone.now().timestamp() + settings.READ_YOUR_WRITES_SECONDS
+        return response
+
+
+class UserViewSet(ReplicaReadMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for users
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    replica_actions = ('list', 'retrieve', 'activities')
+    
+    def perform_create(self, serializer):
+        """Save the user and count them as a member of their team"""
+        user = serializer.save()
+        leaderboard.change_user_team(str(user._id), None, user.team_id)
+    
+    def perform_update(self, serializer):
+        """Save the user, move their totals to their new team and rewrite their stored names"""
+        old_name, old_team_id = serializer.instance.name, serializer.instance.team_id
+        user = serializer.save()
+        leaderboard.change_user_team(str(user._id), old_team_id, user.team_id)
+        if (user.name, user.team_id) != (old_name, old_team_id):
+            display_names.propagate_user(str(user._id))
+    
+    def perform_destroy(self, instance):
+        """Delete the user and remove them from their team's totals and stored names"""
+        user_id, team_id = str(instance._id), instance.team_id
+        instance.delete()
+        leaderboard.change_user_team(user_id, team_id, None)
+        display_names.propagate_user(user_id)
     
     @action(detail=True, methods=['get'])
     def activities(self, request, pk=None):
@@ -24,16 +160,64 @@ class UserViewSet(viewsets.ModelViewSet):
         user = self.get_object()
         user_id = str(user._id)
         activities = Activity.objects.filter(user_id=user_id)
-        serializer = ActivitySerializer(activities, many=True)
-        return Response(serializer.data)
+        paginator = ActivityCursorPagination()
+        page = paginator.paginate_queryset(activities, request, view=self)
+        serializer = ActivitySerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Get activity totals for a user, bucketed by day, week or month"""
+        user = self.get_object()
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in BUCKET_FORMATS:
+            raise ValidationError({'bucket': f'Must be one of: {", ".join(BUCKET_FORMATS)}.'})
+        start = parse_date_param(request.query_params, 'from')
+        end = parse_date_param(request.query_params, 'to', end_of_range=True)
+        stats = user_activity_stats(str(user._id), start, end, bucket)
+        return Response({
+            'user_id': str(user._id),
+            'bucket': bucket,
+            'from': start,
+            'to': end,
+            **stats,
+        })
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for teams
     """
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
+    cache_namespace = 'teams'
+    replica_actions = ('list', 'retrieve', 'members')
+    
+    def perform_create(self, serializer):
+        """Save the team and give it an empty standings entry"""
+        team = serializer.save()
+        leaderboard.apply_team_deltas({str(team._id): (0, 0, 0)})
+    
+    def perform_update(self, serializer):
+        """Save the team and rewrite its name stored on members' rows"""
+        old_name = serializer.instance.name
+        team = serializer.save()
+        if team.name != old_name:
+            display_names.propagate_team(str(team._id), team.name)
+    
+    def perform_destroy(self, instance):
+        """Delete the team, its standings entry and its name stored on members' rows"""
+        team_id = str(instance._id)
+        instance.delete()
+        leaderboard.remove_team(team_id)
+        display_names.propagate_team(team_id, '')
+    
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        """Get team standings from the materialized team leaderboard"""
+        standings = TeamLeaderboard.objects.all().order_by('rank', 'team_id')
+        serializer = TeamLeaderboardSerializer(standings, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def members(self, request, pk=None):
@@ -41,49 +225,227 @@ class TeamViewSet(viewsets.ModelViewSet):
         team = self.get_object()
         team_id = str(team._id)
         members = User.objects.filter(team_id=team_id)
-        serializer = UserSerializer(members, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(members)
+        serializer = UserSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(ReplicaReadMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for activities
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityCursorPagination
+    filter_backends = [StableOrderingFilter]
+    ordering_fields = ['date', 'distance_km', 'calories_burned', 'duration']
+    ordering = ActivityCursorPagination.ordering
     
     def get_queryset(self):
         """
-        Optionally filter activities by user_id
+        Optionally filter activities by user_id and stored distance
+        (min_distance/max_distance, in km)
         """
         queryset = Activity.objects.all()
         user_id = self.request.query_params.get('user_id', None)
         if user_id is not None:
             queryset = queryset.filter(user_id=user_id)
+        for param, lookup in (('min_distance', 'distance_km__gte'), ('max_distance', 'distance_km__lte')):
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: float(value)})
+            except ValueError:
+                raise ValidationError({param: 'Must be a number.'})
         return queryset
+    
+    def perform_create(self, serializer):
+        """Save the activity with its user's names and add it to their leaderboard totals"""
+        activity = serializer.save(**display_names.user_names(serializer.validated_data['user_id']))
+        windows.apply_activity_change(after=(activity.user_id, activity.calories_burned, activity.date))
+        leaderboard.apply_activity_change(after=(activity.user_id, activity.calories_burned))
+    
+    def perform_update(self, serializer):
+        """Save the activity and move its calories between leaderboard totals"""
+        instance = serializer.instance
+        before = (instance.user_id, instance.calories_burned, instance.date)
+        activity = serializer.save(**display_names.user_names(serializer.validated_data.get('user_id', instance.user_id)))
+        windows.apply_activity_change(before=before, after=(activity.user_id, activity.calories_burned, activity.date))
+        leaderboard.apply_activity_change(before=before[:2], after=(activity.user_id, activity.calories_burned))
+    
+    def perform_destroy(self, instance):
+        """Delete the activity and remove it from the user's leaderboard totals"""
+        before = (instance.user_id, instance.calories_burned, instance.date)
+        instance.delete()
+        windows.apply_activity_change(before=before)
+        leaderboard.apply_activity_change(before=before[:2])
+    
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser, MessagePackParser])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array, NDJSON or MessagePack body.
+        
+        Items are validated in one pass and the valid ones are written with a
+        single unordered insert_many. Returns a result per submitted item.
+        """
+        if isinstance(request.data, list) and len(request.data) > settings.ACTIVITY_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [f'At most {settings.ACTIVITY_BULK_MAX_ITEMS} items per request.']})
+        serializer = self.get_serializer(data=request.data, many=True)
+        validated, errors = serializer.validate_items()
+        results = [
+            {'index': index, 'status': 'invalid', 'errors': item_errors}
+            for index, item_errors in enumerate(errors)
+            if item_errors
+        ]
+        
+        pending = [(index, Activity(**data)) for index, data in enumerate(validated) if data is not None]
+        for _, activity in pending:
+            activity.set_derived_fields()
+        # insert_many assigns each document its _id before writing
+        documents = [to_document(activity) for _, activity in pending]
+        failed = {}
+        if documents:
+            display_names.fill_names(documents)
+            try:
+                get_collection(Activity).insert_many(documents, ordered=False)
+            except BulkWriteError as exc:
+                failed = {error['index']: error['errmsg'] for error in exc.details['writeErrors']}
+        
+        deltas = defaultdict(lambda: [0, 0])
+        window_rows = []
+        for position, (index, activity) in enumerate(pending):
+            if position in failed:
+                results.append({'index': index, 'status': 'failed', 'errors': {'non_field_errors': [failed[position]]}})
+                continue
+            deltas[activity.user_id][0] += activity.calories_burned
+            deltas[activity.user_id][1] += 1
+            window_rows.append((activity.user_id, activity.date, activity.calories_burned, 1))
+            results.append({'index': index, 'status': 'created', 'id': str(documents[position]['_id'])})
+        windows.record_activities(window_rows)
+        leaderboard.record_activities(deltas)
+        
+        results.sort(key=lambda result: result['index'])
+        created = sum(1 for result in results if result['status'] == 'created')
+        response_status = status.HTTP_201_CREATED if created == len(results) else status.HTTP_207_MULTI_STATUS
+        return Response({'created': created, 'failed': len(results) - created, 'results': results}, status=response_status)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream activities as NDJSON or CSV (?format=ndjson|csv).
+        
+        Optional user_id, from and to filters; gzip-compressed on the fly when
+        the client accepts it.
+        """
+        query = {}
+        user_id = request.query_params.get('user_id')
+        if user_id:
+            query['user_id'] = user_id
+        date_range = {}
+        start = parse_date_param(request.query_params, 'from')
+        end = parse_date_param(request.query_params, 'to', end_of_range=True)
+        if start is not None:
+            date_range['$gte'] = start
+        if end is not None:
+            date_range['$lt'] = end
+        if date_range:
+            query['date'] = date_range
+        
+        renderer = request.accepted_renderer
+        chunks = renderer.stream(iter_activity_rows(query), EXPORT_FIELDS)
+        gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+        if gzipped:
+            chunks = gzip_stream(chunks)
+        response = StreamingHttpResponse(chunks, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="activities.{renderer.format}"'
+        response['Vary'] = 'Accept-Encoding'
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        return response
 
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+class LeaderboardViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for leaderboard
     """
     queryset = Leaderboard.objects.all().order_by('rank')
     serializer_class = LeaderboardSerializer
+    pagination_class = LeaderboardCursorPagination
+    cache_namespace = 'leaderboard'
+    replica_actions = ('list', 'retrieve', 'top_performers')
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List the all-time leaderboard, or a window's with ?window=day|week|month.
+        
+        A window covers the period containing ``at`` (an ISO date or
+        datetime, default now) and is ranked from its calorie buckets.
+        """
+        if 'window' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, lambda: self._window_response(request))
+    
+    def _window_response(self, request):
+        granularity = request.query_params['window']
+        if granularity not in BUCKET_FORMATS:
+            raise ValidationError({'window': f'Must be one of: {", ".join(BUCKET_FORMATS)}.'})
+        at = parse_date_param(request.query_params, 'at') or timezone.make_naive(timezone.now(), dt_timezone.utc)
+        period = windows.period_key(granularity, at)
+        buckets = LeaderboardBucket.objects.filter(granularity=granularity, period=period)
+        paginator = WindowCursorPagination()
+        page = paginator.paginate_queryset(buckets, request, view=self)
+        windows.assign_ranks(granularity, period, page)
+        serializer = LeaderboardBucketSerializer(page, many=True, context=self.get_serializer_context())
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['window'] = granularity
+        response.data['period'] = period
+        return response
+    
+    def _required_user_id(self, request):
+        user_id = request.query_params.get('user_id')
+        if not user_id:
+            raise ValidationError({'user_id': 'This query parameter is required.'})
+        return user_id
     
     @action(detail=False, methods=['get'])
     def top_performers(self, request):
         """Get top 10 performers"""
-        top_users = Leaderboard.objects.all().order_by('rank')[:10]
+        top_users = leaderboard_index.top(10)
         serializer = self.get_serializer(top_users, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def rank(self, request):
+        """Get the current rank of a user"""
+        entry = leaderboard_index.entry(self._required_user_id(request))
+        if entry is None:
+            raise NotFound('User has no leaderboard entry.')
+        serializer = self.get_serializer(entry)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def around(self, request):
+        """Get the users ranked just above and below a user"""
+        user_id = self._required_user_id(request)
+        try:
+            radius = min(max(int(request.query_params.get('radius', 5)), 0), 50)
+        except ValueError:
+            raise ValidationError({'radius': 'Must be an integer.'})
+        entries = leaderboard_index.around(user_id, radius)
+        if entries is None:
+            raise NotFound('User has no leaderboard entry.')
+        serializer = self.get_serializer(entries, many=True)
+        return Response(serializer.data)
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for workouts
     """
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    cache_namespace = 'workouts'
     
     def get_queryset(self):
         """
@@ -99,3 +461,35 @@ class WorkoutViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category=category)
         
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List workouts from the in-memory catalog.
+        
+        Facet filters (difficulty, category) accept several values, repeated
+        or comma-separated; duration__gte/lte and calories__gte/lte filter
+        ranges. The response includes facet counts for the other filters.
+        """
+        return self.cached_response(request, lambda: self._catalog_response(request))
+    
+    def _catalog_response(self, request):
+        facets = {
+            field: [value for raw in request.query_params.getlist(field) for value in raw.split(',') if value]
+            for field in FACET_FIELDS
+        }
+        ranges = {}
+        for name in RANGE_FILTERS:
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            try:
+                ranges[name] = int(value)
+            except ValueError:
+                raise ValidationError({name: 'Must be an integer.'})
+        workouts, facet_counts = workout_catalog.search(facets, ranges)
+        serializer = self.get_serializer(workouts, many=True)
+        return Response({
+            'count': len(workouts),
+            'results': serializer.data,
+            'facets': facet_counts,
+        })
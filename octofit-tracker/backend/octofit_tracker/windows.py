@@ -0,0 +1,171 @@
+"""
+Per-user calorie buckets behind the time-windowed leaderboards.
+
+Every activity write increments the user's day, ISO week and month buckets,
+so ranking a window is an index scan over one period's buckets instead of
+an aggregation over activities. Periods use the same keys as the stats
+endpoint (``BUCKET_FORMATS``). Buckets whose last activity is removed are
+deleted. Old day buckets are folded into their month buckets by the
+``compact_leaderboard_buckets`` command; week and month buckets are kept.
+"""
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+from pymongo import InsertOne, UpdateOne
+
+from .models import Activity, LeaderboardBucket
+from .mongo import get_collection
+from .stats import BUCKET_FORMATS
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def period_key(granularity, date):
+    """Return the bucket period containing ``date`` (naive or aware UTC)"""
+    if timezone.is_aware(date):
+        date = timezone.make_naive(date, dt_timezone.utc)
+    return date.strftime(BUCKET_FORMATS[granularity])
+
+
+def record_activities(rows):
+    """
+    Add activity deltas to their users' buckets with one bulk write.
+
+    ``rows`` yields ``(user_id, date, calories, activities)``; negative
+    deltas remove activities, and buckets left without activities are dropped.
+    That includes the partial day buckets a calories-only edit recreates in
+    an already-compacted month.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for user_id, date, calories, activities in rows:
+        if not user_id or date is None:
+            continue
+        for granularity in BUCKET_FORMATS:
+            delta = deltas[(granularity, period_key(granularity, date), user_id)]
+            delta[0] += calories
+            delta[1] += activities
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    collection = get_collection(LeaderboardBucket)
+    collection.bulk_write([
+        UpdateOne(
+            {'granularity': granularity, 'period': period, 'user_id': user_id},
+            {'$inc': {'total_calories': calories, 'total_activities': activities}},
+            upsert=True,
+        )
+        for (granularity, period, user_id), (calories, activities) in deltas.items()
+    ], ordered=False)
+
+    touched = [
+        {'granularity': granularity, 'period': period, 'user_id': user_id}
+        for granularity, period, user_id in deltas
+    ]
+    collection.delete_many({'$or': touched, 'total_activities': {'$lte': 0}})
+
+
+def apply_activity_change(before=None, after=None):
+    """
+    Move an activity between buckets for a write.
+
+    ``before`` and ``after`` are ``(user_id, calories_burned, date)`` triples;
+    pass ``None`` for the side that does not exist.
+    """
+    rows = []
+    if before:
+        rows.append((before[0], before[2], -before[1], -1))
+    if after:
+        rows.append((after[0], after[2], after[1], 1))
+    record_activities(rows)
+
+
+def rebuild_buckets(user_ids=None):
+    """
+    Recompute buckets from activities, for ``user_ids`` or everyone.
+
+    Returns the number of buckets written.
+    """
+    match = {'user_id': {'$in': list(user_ids)}} if user_ids is not None else {}
+    collection = get_collection(LeaderboardBucket)
+    collection.delete_many(match)
+
+    written = 0
+    requests = []
+    for granularity, date_format in BUCKET_FORMATS.items():
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {'user_id': '$user_id', 'period': {'$dateToString': {'format': date_format, 'date': '$date'}}},
+                'calories': {'$sum': '$calories_burned'},
+                'count': {'$sum': 1},
+            }},
+        ]
+        for row in get_collection(Activity).aggregate(pipeline, allowDiskUse=True):
+            requests.append(InsertOne({
+                'granularity': granularity,
+                'period': row['_id']['period'],
+                'user_id': row['_id']['user_id'],
+                'total_calories': row['calories'],
+                'total_activities': row['count'],
+            }))
+            if len(requests) >= REBUILD_CHUNK_SIZE:
+                written += collection.bulk_write(requests, ordered=False).inserted_count
+                requests = []
+    if requests:
+        written += collection.bulk_write(requests, ordered=False).inserted_count
+    return written
+
+
+def compact_day_buckets(before_month):
+    """
+    Fold day buckets of months before ``before_month`` ('YYYY-MM') into month buckets.
+
+    Month buckets are kept current on every write, including late writes
+    into already-compacted months, so existing ones are left alone; months
+    missing a bucket get one summed from their days. The day buckets are
+    then deleted. Returns ``(day_buckets_removed, month_buckets_created)``.
+    """
+    collection = get_collection(LeaderboardBucket)
+    old_days = {'granularity': 'day', 'period': {'$lt': f'{before_month}-01'}}
+    pipeline = [
+        {'$match': old_days},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'month': {'$substrCP': ['$period', 0, 7]}},
+            'calories': {'$sum': '$total_calories'},
+            'count': {'$sum': '$total_activities'},
+        }},
+    ]
+    requests = [
+        UpdateOne(
+            {'granularity': 'month', 'period': row['_id']['month'], 'user_id': row['_id']['user_id']},
+            {'$setOnInsert': {'total_calories': row['calories'], 'total_activities': row['count']}},
+            upsert=True,
+        )
+        for row in collection.aggregate(pipeline, allowDiskUse=True)
+    ]
+    created = collection.bulk_write(requests, ordered=False).upserted_count if requests else 0
+    removed = collection.delete_many(old_days).deleted_count
+    return removed, created
+
+
+def assign_ranks(granularity, period, page):
+    """
+    Set competition ranks on a page of buckets ordered by (-total_calories, _id).
+
+    Two counts locate the page's first row in the window; the rest of the
+    page is ranked from there.
+    """
+    if not page:
+        return
+    collection = get_collection(LeaderboardBucket)
+    scope = {'granularity': granularity, 'period': period}
+    first = page[0]
+    greater = collection.count_documents({**scope, 'total_calories': {'$gt': first.total_calories}})
+    position = greater + collection.count_documents({**scope, 'total_calories': first.total_calories, '_id': {'$lt': first._id}})
+    rank = greater + 1
+    for offset, bucket in enumerate(page):
+        if offset and bucket.total_calories != page[offset - 1].total_calories:
+            rank = position + offset + 1
+        bucket.rank = rank
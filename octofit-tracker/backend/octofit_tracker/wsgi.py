@@ -11,6 +11,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from octofit_tracker.startup import warm_caches
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
 application = get_wsgi_application()
+
+warm_caches()